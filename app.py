@@ -3,10 +3,29 @@ Evals Demo: Customer Pain Point Extractor
 """
 import streamlit as st
 import os
+import time
+import hashlib
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from dotenv import load_dotenv
-import sqlite3
-from claude_api import call_claude
-from openai_api import call_openai
+from db_pool import get_pool
+from init_db import upgrade_database
+from providers import (DEFAULT_CALL_TIMEOUT, DEFAULT_MODELS, DEFAULT_TURN_DEADLINE, MODEL_TIERS,
+                       call_provider, call_providers, call_routed, with_deadline)
+from scheduler import EvalHistory, prompt_hash, run_all, run_key
+from sampling import DEFAULT_MAX_SAMPLES, sample_pass_rate
+from evals import EVAL_DATASET, SARAH_PERSONA, get_assertions, get_question, build_system_prompt, evaluate_response_rule_based
+from judge import JUDGE_CHECK, JUDGE_CHECK_DESCRIPTION, apply_verdict, judge_responses
+from retrieval import (ReviewIndex, build_index, extract_clothing_id, index_is_stale, index_watermark,
+                       retrieve_review_context)
+from product_digests import load_digest, refresh_digests
+from history import (CARRIED_SUMMARY_TOKENS, DEFAULT_HISTORY_TOKEN_BUDGET, build_history, summarize_turns,
+                     summary_prompt)
+from sessions import MEMORY_WINDOW, SessionStore, new_session_id
+from response_archive import ResponseArchive
+from cost_ledger import CostLedger, SpendBudget, call_cost, estimate_sweep, format_cost, usage_records
 
 # Load environment variables
 load_dotenv()
@@ -56,110 +75,100 @@ if 'try_counter' not in st.session_state:
     st.session_state.try_counter = {}  # {question_id: try_number}
 if 'selected_brand' not in st.session_state:
     st.session_state.selected_brand = "Anthropic"
+if 'messages' not in st.session_state:
+    st.session_state.messages = []  # newest MEMORY_WINDOW messages; the full transcript is on disk
+if 'message_offset' not in st.session_state:
+    st.session_state.message_offset = 0  # transcript position of messages[0]
+if 'earlier_summary' not in st.session_state:
+    st.session_state.earlier_summary = None  # folded summary of the transcript before messages[0]
+if 'pending_jobs' not in st.session_state:
+    st.session_state.pending_jobs = []  # provider calls running in the background
+if 'prefetch' not in st.session_state:
+    st.session_state.prefetch = None  # speculative call for the selected question
+if 'sweep_estimate' not in st.session_state:
+    st.session_state.sweep_estimate = None  # pre-flight cost of "Run all"
 
-# Evaluation Questions
-EVAL_QUESTIONS = [
-    {
-        "id": 1,
-        "question": "I need professional clothing for work presentations. Should I order clothing ID 1094?",
-        "context": {"clothing_id": 1094},
-        "ground_truth": "HIGH RISK: sizing issues, quality concerns. Sarah is anxious about online shopping and hates returns.",
-        "assertions": [
-            {
-                "check": "includes_buy_link",
-                "description": "Response includes a buy link in format https://santra.com/clothing/{id}",
-                "keywords": ["https://santra.com/clothing/", "santra.com/clothing"]
-            },
-            {
-                "check": "tailored_to_sarah",
-                "description": "Response mentions Sarah by name AND references at least one specific detail about her (sizing struggles, return aversion, anxiety, presentation needs, or $150 budget)",
-                "keywords": [
-                    "sarah",
-                    "between sizes",
-                    "hate returns", "hates returns", "return aversion", "avoid returns",
-                    "anxious about online", "anxiety about shopping",
-                    "work presentation", "professional presentation",
-                    "$150 budget", "budget of $150"
-                ]
-            }
-        ],
-        "pass_criteria": "Both assertions must pass",
-        "prompt_improvement": "Add Sarah's context to your system prompt. Reference her BY NAME and address her specific concerns (anxiety about online shopping, return aversion, fit struggles, presentation needs)."
-    },
-    {
-        "id": 2,
-        "question": "Does clothing ID 829 have quality issues?",
-        "context": {"clothing_id": 829},
-        "ground_truth": "Yes, quality issues exist. Sarah needs reliable clothing for work presentations.",
-        "assertions": [
-            {
-                "check": "includes_buy_link",
-                "description": "Response includes a buy link in format https://santra.com/clothing/{id}",
-                "keywords": ["https://santra.com/clothing/", "santra.com/clothing"]
-            },
-            {
-                "check": "tailored_to_sarah",
-                "description": "Response mentions Sarah by name AND connects quality concerns to her professional/presentation needs",
-                "keywords": [
-                    "sarah",
-                    "work presentation", "professional presentation", "professional setting",
-                    "presentation needs", "professional needs"
-                ]
-            }
-        ],
-        "pass_criteria": "Both assertions must pass",
-        "prompt_improvement": "Connect the quality issues to Sarah's specific needs (professional settings, work presentations). Mention her BY NAME."
-    },
-    {
-        "id": 3,
-        "question": "I'm between sizes (usually 8-10). Which size should I order for clothing ID 1094?",
-        "context": {"clothing_id": 1094},
-        "ground_truth": "Runs 2-4 sizes small. Sarah struggles with fit and needs confident guidance.",
-        "assertions": [
-            {
-                "check": "includes_buy_link",
-                "description": "Response includes a buy link in format https://santra.com/clothing/{id}",
-                "keywords": ["https://santra.com/clothing/", "santra.com/clothing"]
-            },
-            {
-                "check": "tailored_to_sarah",
-                "description": "Response mentions Sarah by name AND acknowledges her return aversion or anxiety about getting sizing wrong",
-                "keywords": [
-                    "sarah",
-                    "hate returns", "hates returns", "avoid returns", "return aversion",
-                    "anxious about", "anxiety", "get it right the first time",
-                    "between sizes struggle", "sizing struggles"
-                ]
-            }
-        ],
-        "pass_criteria": "Both assertions must pass",
-        "prompt_improvement": "Acknowledge Sarah's fit struggles BY NAME and address her return aversion. Give her confident, specific sizing advice that reduces her anxiety."
-    }
-]
-
-# System prompts are separate - you test different prompts against the same questions
-SYSTEM_PROMPTS = {
-    "empty": "",
-    "basic": "You are a shopping assistant. Help customers make purchase decisions.",
-    "sales_driven": "You are a shopping assistant. Your goal is to drive purchases. Always include a purchase link: https://santra.com/clothing/{id}",
-    "customer_focused": "You are a shopping assistant. Your goal is customer satisfaction. Include purchase links only for items you confidently recommend. For risky items, suggest alternatives with links."
-}
-# Sarah's persona
-SARAH_PERSONA = {
-    "name": "Sarah",
-    "age": 32,
-    "context": "Needs professional clothing for upcoming work presentations",
-    "goal": "Find clothing that fits well and looks professional",
-    "pain_point": "Usually between sizes (struggles with fit)",
-    "time_constraint": "Needs it in 2 weeks",
-    "budget": "Willing to spend up to $150",
-    "behaviors": [
-        "Reads reviews carefully, especially about sizing",
-        "Anxious about online shopping",
-        "Values honest opinions over marketing fluff",
-        "Hates returns - wants to get it right the first time"
-    ]
-}
+@st.cache_resource
+def get_session_store():
+    """Transcript store shared by all sessions, so per-session memory stays bounded"""
+    return SessionStore()
+
+def restore_session(session_id, saved):
+    """Load a saved session into session_state (only its newest messages)"""
+    st.session_state.session_id = session_id
+    st.session_state.messages = saved["messages"]
+    st.session_state.message_offset = saved["message_offset"]
+    st.session_state.system_prompt = saved.get("system_prompt", "")
+    # Stored as (key, value) pairs so integer question IDs survive JSON
+    st.session_state.eval_results = dict(saved.get("eval_results", []))
+    st.session_state.try_counter = dict(saved.get("try_counter", []))
+    st.session_state.game_complete = saved.get("game_complete", False)
+    st.session_state.earlier_summary = saved.get("earlier_summary")
+    # Messages that left memory after the summary was last saved are folded in now,
+    # reading at most one window of them (older lines would not fit the summary anyway)
+    covered = saved.get("summary_offset", 0)
+    if covered < saved["message_offset"]:
+        fold_into_summary(get_session_store().load_messages(
+            session_id, max(covered, saved["message_offset"] - MEMORY_WINDOW), saved["message_offset"]
+        ))
+
+def fold_into_summary(messages):
+    """Carry messages leaving the in-memory window forward in the session's summary"""
+    st.session_state.earlier_summary = summarize_turns(
+        messages, CARRIED_SUMMARY_TOKENS, earlier=st.session_state.earlier_summary
+    ) or None
+
+def start_session():
+    """Start a new, empty session with its own ID in the URL"""
+    st.session_state.session_id = new_session_id()
+    st.query_params["session"] = st.session_state.session_id
+
+def save_session():
+    """Save everything but the transcript (messages are written as they're added)"""
+    get_session_store().save_state(st.session_state.session_id, {
+        "system_prompt": st.session_state.system_prompt,
+        "eval_results": list(st.session_state.eval_results.items()),
+        "try_counter": list(st.session_state.try_counter.items()),
+        "game_complete": st.session_state.game_complete,
+        "earlier_summary": st.session_state.earlier_summary,
+        "summary_offset": st.session_state.message_offset
+    })
+
+def add_message(message):
+    """Append a chat message to the transcript on disk, keeping only the newest ones in memory"""
+    get_session_store().append_message(st.session_state.session_id, message)
+    st.session_state.messages.append(message)
+    overflow = len(st.session_state.messages) - MEMORY_WINDOW
+    if overflow > 0:
+        fold_into_summary(st.session_state.messages[:overflow])
+        del st.session_state.messages[:overflow]
+        st.session_state.message_offset += overflow
+
+def resume_session():
+    """Switch to the session ID typed in the sidebar"""
+    session_id = st.session_state.resume_session_id.strip()
+    saved = get_session_store().load_session(session_id) if session_id else None
+    if saved is None:
+        st.error(f"No saved session with ID {session_id}")
+        return
+    restore_session(session_id, saved)
+    st.session_state.history_window = CHAT_WINDOW_SIZE
+    st.session_state.pending_jobs = []
+    st.session_state.prefetch = None
+    st.query_params["session"] = session_id
+    st.session_state.resume_session_id = ""
+
+# Each browser session has an ID in the URL, so reloading the page resumes it from disk
+if 'session_id' not in st.session_state:
+    session_id = st.query_params.get("session")
+    saved = get_session_store().load_session(session_id) if session_id else None
+    if saved is None:
+        start_session()
+    else:
+        restore_session(session_id, saved)
+
+# Sidebar option that sends each question to both providers at once
+COMPARE_MODE = "Compare both"
 
 # Sidebar - Persona and API Key
 with st.sidebar:
@@ -177,72 +186,184 @@ with st.sidebar:
     st.markdown("---")
     
     st.header("🤖 LLM Provider & API Key")
+    provider_options = ["Anthropic", "OpenAI", COMPARE_MODE]
     st.session_state.selected_brand = st.radio(
         "Select Provider:",
-        ["Anthropic", "OpenAI"],
-        index=0 if st.session_state.selected_brand == "Anthropic" else 1
+        provider_options,
+        index=provider_options.index(st.session_state.selected_brand),
+        help="Compare both sends each question to Anthropic and OpenAI at the same time"
     )
     
-    if st.session_state.selected_brand == "Anthropic":
-        llm_api_key = st.text_input("Anthropic API Key:", type="password", 
+    # API keys for the active provider(s), keyed by brand
+    api_keys = {}
+    if st.session_state.selected_brand in ("Anthropic", COMPARE_MODE):
+        api_keys["Anthropic"] = st.text_input("Anthropic API Key:", type="password", key="anthropic_api_key",
                                 help="Get your API key from console.anthropic.com")
-    else:
-        llm_api_key = st.text_input("OpenAI API Key:", type="password", 
+    if st.session_state.selected_brand in ("OpenAI", COMPARE_MODE):
+        api_keys["OpenAI"] = st.text_input("OpenAI API Key:", type="password", key="openai_api_key",
                                 help="Get your API key from platform.openai.com")
     
     st.markdown("---")
+    
+    st.header("💾 Session")
+    st.caption(f"Session ID: `{st.session_state.session_id}` (bookmark this page to come back to it)")
+    st.text_input("Resume session ID:", key="resume_session_id", on_change=resume_session,
+                  help="Load a saved chat, its eval results and system prompt")
+    
+    st.markdown("---")
+
+# Number of chat messages rendered per page
+CHAT_WINDOW_SIZE = 20
+
+# Number of eval question buttons shown per page
+QUESTION_PAGE_SIZE = 10
+
+# Provider calls in flight at once across all sessions
+LLM_WORKERS = 8
+
+# How often the chat checks for finished background calls (seconds)
+PENDING_POLL_SECONDS = 0.5
+
+# How long a read of the review index watermark is reused before the database is scanned again (seconds)
+INDEX_WATERMARK_TTL_SECONDS = 30
+
+@st.cache_resource
+def prepare_database():
+    """Upgrade the reviews database to the current schema once per server, and compute missing product digests"""
+    upgrade_database()
+    # Incremental: only products with reviews newer than the last refresh
+    refresh_digests()
+
+prepare_database()
 
 # Main content
 st.title("🎯 Evals - Clothing Recommendations")
 
-def evaluate_response_rule_based(response: str, question_id: int, scenario: str = "neutral") -> dict:
-    """
-    Evaluate a response using rule-based keyword matching.
+@st.cache_resource(max_entries=1)
+def load_review_index(watermark: tuple):
+    """Load the memory-mapped review index, (re)building it if it was built at another watermark."""
+    if index_is_stale(watermark=watermark):
+        build_index()
+    return ReviewIndex()
+
+@st.cache_data(ttl=INDEX_WATERMARK_TTL_SECONDS)
+def current_index_watermark():
+    """The database's index watermark; it scans every canonical row, so it is read at most once per TTL, not every turn."""
+    return index_watermark()
+
+def get_review_index():
+    """The review index for the database as it was at most INDEX_WATERMARK_TTL_SECONDS ago (rebuilt after ingests and re-marked copies)."""
+    return load_review_index(current_index_watermark())
+
+@st.cache_resource
+def get_llm_executor():
+    """Worker pool for provider calls, shared by all sessions so the UI never waits on them"""
+    return ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+
+@st.cache_resource
+def get_response_archive():
+    """Deduplicated store of answers; eval history keeps only their hashes"""
+    return ResponseArchive()
+
+@st.cache_resource
+def get_cost_ledger():
+    """Tokens and cost of every provider call, by session, prompt and run"""
+    return CostLedger()
+
+@st.cache_resource
+def get_eval_history():
+    """Verdict history shared by all sessions (used to schedule "Run all")."""
+    return EvalHistory()
+
+def render_eval_result(result):
+    """Render an assistant message's own eval record (verdict, assertions and tip)."""
+    q = get_question(result.get("question_id"))
+    if q is None:
+        return
     
-    Args:
-        response: The AI's response text
-        question_id: The ID of the question being evaluated
-        scenario: Which scenario to evaluate against (neutral, sales_driven, customer_satisfaction)
-        
-    Returns:
-        dict with 'passed' (bool) and 'details' (dict of assertion results)
-    """
-    # Find the question
-    question_data = next((q for q in EVAL_QUESTIONS if q["id"] == question_id), None)
-    if not question_data:
-        return {"passed": False, "details": {}, "error": "Question not found"}
-    
-    response_lower = response.lower()
-    assertion_results = {}
-    
-    # Handle new scenario-based structure
-    if "scenarios" in question_data:
-        if scenario not in question_data["scenarios"]:
-            return {"passed": False, "details": {}, "error": f"Scenario '{scenario}' not found"}
-        
-        assertions = question_data["scenarios"][scenario]["assertions"]
-    # Handle old structure (direct assertions)
-    elif "assertions" in question_data:
-        assertions = question_data["assertions"]
+    # Show try number
+    try_num = result.get('try_number', 1)
+    st.markdown(f"**📝 Try #{try_num}**")
+    st.markdown("---")
+    
+    # Get assertions for this question (handle both old and new structure)
+    assertions, _ = get_assertions(q, result.get("scenario", "neutral"))
+    descriptions = {a["check"]: a["description"] for a in assertions}
+    descriptions[JUDGE_CHECK] = JUDGE_CHECK_DESCRIPTION
+    
+    sampling = result.get("sampling")
+    if sampling:
+        summary = (f"{sampling['passes']}/{sampling['samples']} samples passed "
+                   f"({sampling['pass_rate']:.0%}, {sampling['confidence']:.0%} CI "
+                   f"{sampling['ci_low']:.0%}-{sampling['ci_high']:.0%}; target {sampling['target']:.0%})")
+        if sampling["stopped_early"]:
+            summary += " - stopped early, result settled"
+        if result["passed"]:
+            st.success(f"🎲 Passed - {summary}")
+        else:
+            st.error(f"🎲 Failed - {summary}")
+        st.caption("Assertions below are for the answer shown" + (" (a failing sample)" if sampling["passes"] < sampling["samples"] else ""))
+    elif result["passed"]:
+        st.success("✅ Passed - All assertions met!")
     else:
-        return {"passed": False, "details": {}, "error": "No assertions found in question"}
+        st.error("❌ Failed - Some assertions not met")
     
-    # Check each assertion
-    for assertion in assertions:
-        check_name = assertion["check"]
-        keywords = assertion.get("keywords", [])
-        
-        # Check if any keyword is present in the response
-        found = any(keyword.lower() in response_lower for keyword in keywords)
-        assertion_results[check_name] = found
+    # Show ALL assertions with their status (passed or failed)
+    scores = result.get("scores", {})
+    for check, passed in result.get("details", {}).items():
+        if check in descriptions:
+            # Semantic assertions also show how close the answer came
+            score = f" (similarity {scores[check]:.2f})" if check in scores else ""
+            if passed:
+                st.success(f"✅ {descriptions[check]}{score}")
+            else:
+                st.error(f"❌ {descriptions[check]}{score}")
     
-    # All assertions must pass
-    all_passed = all(assertion_results.values())
+    # Show the judge's reasoning (or why it couldn't grade)
+    judge = result.get("judge")
+    if judge:
+        if "error" in judge:
+            st.warning(f"⚖️ Judge unavailable: {judge['error']}")
+        else:
+            cached = " (cached)" if judge.get("cached") else ""
+            st.caption(f"⚖️ Judge score {judge['score']:.2f}{cached}: {judge['reason']}")
     
-    return {
-        "passed": all_passed,
-        "details": assertion_results
-    }
+    # Show improvement tip if available and failed
+    if not result["passed"] and "prompt_improvement" in q:
+        st.info(f"💡 **Tip:** {q['prompt_improvement']}")
+
+def render_comparison(compare):
+    """Render a compare-mode answer: one column per provider with its own verdict."""
+    columns = st.columns(len(compare))
+    for column, (brand, entry) in zip(columns, compare.items()):
+        with column:
+            st.markdown(f"**{brand}**")
+            stats = []
+            if entry.get("latency") is not None:
+                stats.append(f"⏱️ {entry['latency']:.1f}s")
+            if entry.get("tokens"):
+                stats.append(f"🔤 {entry['tokens']['input']} in / {entry['tokens']['output']} out")
+                cost = call_cost(entry.get("model"), entry["tokens"])
+                if cost is not None:
+                    stats.append(f"💲 {format_cost(cost)}")
+            if entry.get("routing"):
+                stats.append(routing_caption(entry["routing"]))
+            if stats:
+                st.caption(" · ".join(stats))
+            st.markdown(entry["response"])
+            if "eval" in entry:
+                render_eval_result(entry["eval"])
+
+def routing_caption(routing):
+    """One line saying which model tier answered a routed turn."""
+    if not routing["escalations"]:
+        return f"🪜 Tier {routing['tier'] + 1} ({routing['model']}) answered"
+    failed = ", ".join(e["model"] for e in routing["escalations"])
+    return f"🪜 Tier {routing['tier'] + 1} ({routing['model']}) answered after {failed} failed the assertions"
+
+def show_earlier_messages():
+    """Grow the rendered chat window by one page."""
+    st.session_state.history_window += CHAT_WINDOW_SIZE
 
 def set_question(question_text, question_id):
     """Set the question in the chat input and track which question was asked."""
@@ -305,17 +426,14 @@ with tab1:
     
     # Show sample data
     import pandas as pd
-    conn = sqlite3.connect('data/evals_demo.db')
-    
-    df = pd.read_sql_query("""
-        SELECT clothing_id, rating, age, department_name, 
-               substr(review_text, 1, 100) || '...' as review_preview
-        FROM feedback_submissions 
-        WHERE clothing_id IN (1094, 829)
-        LIMIT 6
-    """, conn)
-    
-    conn.close()
+    with get_pool().connection() as conn:
+        df = pd.read_sql_query("""
+            SELECT clothing_id, rating, age, department_name, 
+                   substr(review_text, 1, 100) || '...' as review_preview
+            FROM feedback_submissions 
+            WHERE clothing_id IN (1094, 829)
+            LIMIT 6
+        """, conn)
     
     st.dataframe(df, width='stretch', hide_index=True)
     
@@ -334,107 +452,500 @@ with tab1:
 
 # Tab 2: Evals - Main Interface
 with tab2:
+    def score_response(q_id, response):
+        """Evaluate one provider's answer to an eval question with the rule-based assertions."""
+        eval_result = evaluate_response_rule_based(response, q_id)
+        eval_result['question_id'] = q_id
+        return eval_result
+
+    def judge_answers(scored, labels, run_id=None):
+        """
+        Grade answers against their ground truth in one batched judge call (if LLM-as-Judge is enabled)
+        
+        scored: (q_id, brand, result, eval_result) tuples; verdicts are folded into the eval results.
+        The judge calls are billed to the cost ledger under labels and run_id.
+        """
+        if not use_llm_judge:
+            return
+        items, targets = [], {}
+        for q_id, brand, result, eval_result in scored:
+            question_data = get_question(q_id)
+            if result['success'] and question_data.get("ground_truth"):
+                item_id = f"{q_id}:{brand}"
+                items.append({
+                    "id": item_id,
+                    "question": question_data["question"],
+                    "response": result['response'],
+                    "ground_truth": question_data["ground_truth"]
+                })
+                targets[item_id] = eval_result
+        if not items:
+            return
+        # The first active provider judges every answer, so they all fit in one request
+        judge_brand = next(iter(api_keys))
+        verdicts, usage = judge_responses(items, provider=judge_brand.lower(), api_key=api_keys[judge_brand],
+                                          return_usage=True)
+        record_usage([(judge_brand, call) for call in usage], None, labels, run_id)
+        for item_id, eval_result in targets.items():
+            apply_verdict(eval_result, verdicts.get(item_id))
+
+    # Looked up on the script thread; worker threads only use the objects
+    response_archive = get_response_archive()
+    cost_ledger = get_cost_ledger()
+
+    def archive_responses(results):
+        """Store answers in the response archive; returns {brand: content hash}"""
+        brands = list(results)
+        return dict(zip(brands, response_archive.put_many(response_text(results[b]) for b in brands)))
+
+    def record_usage(calls, q_id, labels, run_id=None):
+        """Add (brand, result) calls to the cost ledger, escalations included; returns their cost"""
+        return cost_ledger.record(
+            [record for brand, result in calls for record in usage_records(result, brand, q_id)],
+            run_id=run_id, **labels
+        )
+
+    def ledger_labels():
+        """Session and prompt hash the next calls are billed to (read on the script thread)"""
+        return {
+            "session_id": st.session_state.session_id,
+            "prompt_hash": prompt_hash(build_system_prompt(st.session_state.system_prompt, use_user_memory))
+        }
+
+    def response_text(result):
+        """Text shown for a provider result (the answer, or the error)."""
+        if result['success']:
+            return result['response']
+        return f"Error: {result['error']}"
+
+    def score_results(q_id, results, labels):
+        """Score every provider's answer to an eval question, keyed by brand (judge calls billed to labels)."""
+        evals_by_brand = {brand: score_response(q_id, response_text(result)) for brand, result in results.items()}
+        judge_answers([(q_id, brand, result, evals_by_brand[brand]) for brand, result in results.items()], labels)
+        return evals_by_brand
+
+    def combined_eval(evals_by_brand):
+        """One verdict for a question answered by every active provider: passed only if all pass"""
+        return {
+            "passed": all(e["passed"] for e in evals_by_brand.values()),
+            "details": {f"{brand}:{check}": passed
+                        for brand, e in evals_by_brand.items()
+                        for check, passed in e["details"].items()},
+            "by_brand": evals_by_brand
+        }
+
+    def prepare_calls(prompt, q_id, conversation_history=None, history_summary=None):
+        """Build call_provider arguments per active provider for one prompt."""
+        # Build system prompt with user memory if enabled
+        effective_system_prompt = build_system_prompt(st.session_state.system_prompt, use_user_memory)
+        if history_summary:
+            effective_system_prompt += summary_prompt(history_summary)
+        
+        # print("🔍 Conversation history:", conversation_history)
+        # print("🔍 User message:", prompt)
+        # print("🔍 System prompt:", effective_system_prompt)
+        # print("🔍 Use DB tool:", use_db_tool)
+        
+        # Retrieve the most relevant reviews up front so most answers need no tool call
+        review_context = None
+        clothing_id = None
+        if q_id is not None:
+            clothing_id = get_question(q_id).get("context", {}).get("clothing_id")
+        if use_review_retrieval:
+            review_context = retrieve_review_context(get_review_index(), prompt, clothing_id)
+        
+        # A precomputed digest of all the product's reviews costs the same few lines every time
+        if use_product_digests:
+            if clothing_id is None:
+                clothing_id = extract_clothing_id(prompt, get_review_index() if use_review_retrieval else None)
+            digest = load_digest(clothing_id) if clothing_id is not None else None
+            if digest:
+                review_context = {"clothing_id": clothing_id, "reviews": [], **(review_context or {}), "digest": digest}
+        
+        return {
+            brand: dict(
+                api_key=api_key,
+                system_prompt=effective_system_prompt,
+                user_message=prompt,
+                review_context=review_context,
+                use_tool=use_db_tool,
+                conversation_history=conversation_history,
+                timeout=call_timeout
+            )
+            for brand, api_key in api_keys.items()
+        }
+
+    def current_run_key():
+        """Hash of everything that determines an eval verdict right now."""
+        return run_key(
+            build_system_prompt(st.session_state.system_prompt, use_user_memory),
+            {brand: MODEL_TIERS[brand] if use_routing else DEFAULT_MODELS[brand] for brand in api_keys},
+            {"use_tool": use_db_tool, "review_retrieval": use_review_retrieval,
+             "product_digests": use_product_digests, "llm_judge": use_llm_judge}
+        )
+
+    def record_turn(q_id, results, evals_by_brand=None, sampling=None, reply_to=None):
+        """Append an assistant turn to the chat and, for eval questions, record its verdict."""
+        responses = {brand: response_text(result) for brand, result in results.items()}
+        
+        # Which model tier answered, for routed turns
+        routing = {
+            brand: {"tier": result["tier"], "model": result.get("model"), "escalations": result["escalations"]}
+            for brand, result in results.items() if "tier" in result
+        }
+        
+        if len(results) == 1:
+            (brand, result), = results.items()
+            assistant_message = {"role": "assistant", "content": responses[brand]}
+            if brand in routing:
+                assistant_message["routing"] = routing[brand]
+        else:
+            # Side-by-side answers; the combined text is what "Save context" sends later
+            assistant_message = {
+                "role": "assistant",
+                "content": "\n\n".join(f"**{brand}:** {response}" for brand, response in responses.items()),
+                "compare": {
+                    brand: {
+                        "response": responses[brand],
+                        "latency": result.get("latency"),
+                        "tokens": result.get("tokens"),
+                        "model": result.get("model"),
+                        "routing": routing.get(brand)
+                    }
+                    for brand, result in results.items()
+                }
+            }
+        
+        # Answers can arrive out of order when several questions are in flight
+        if reply_to and st.session_state.messages[-1:] != [{"role": "user", "content": reply_to}]:
+            assistant_message["reply_to"] = reply_to
+        
+        # Run evaluation if this was an eval question
+        if q_id is not None:
+            # Increment try counter for this question
+            if q_id not in st.session_state.try_counter:
+                st.session_state.try_counter[q_id] = 0
+            st.session_state.try_counter[q_id] += 1
+            
+            if evals_by_brand is None:
+                evals_by_brand = score_results(q_id, results, ledger_labels())
+            for brand_eval in evals_by_brand.values():
+                brand_eval['try_number'] = st.session_state.try_counter[q_id]
+            
+            if len(evals_by_brand) == 1:
+                eval_result, = evals_by_brand.values()
+            else:
+                for brand, brand_eval in evals_by_brand.items():
+                    assistant_message["compare"][brand]["eval"] = brand_eval
+                # The scoreboard counts a compared question as passed only if both providers pass
+                eval_result = {
+                    "passed": all(e["passed"] for e in evals_by_brand.values()),
+                    "details": {},
+                    "question_id": q_id,
+                    "try_number": st.session_state.try_counter[q_id],
+                    "compare": {brand: e["passed"] for brand, e in evals_by_brand.items()}
+                }
+            
+            if sampling:
+                # The verdict is the sampled pass rate, not the single answer shown
+                eval_result["sampling"] = sampling
+                eval_result["passed"] = sampling["passed"]
+            
+            st.session_state.eval_results[q_id] = eval_result
+            # The message keeps its own verdict, so older tries don't show the newest one
+            assistant_message["eval"] = eval_result
+            
+            # Check if game is complete (all questions answered)
+            if len(st.session_state.eval_results) == len(EVAL_DATASET):
+                st.session_state.game_complete = True
+        
+        add_message(assistant_message)
+        save_session()
+
+    def passes_assertions(q_id):
+        """Pass check for adaptive routing: the answer meets the question's rule-based assertions"""
+        return lambda result: result["success"] and \
+            evaluate_response_rule_based(result["response"], q_id, stop_on_failure=True)["passed"]
+
+    def run_turn(turn, q_id):
+        """Make a turn's provider call(s) and score them (runs on a worker thread: no session state)"""
+        sampling = None
+        call_kwargs = turn["call_kwargs"]
+        route = {brand: passes_assertions(q_id) for brand in call_kwargs} if turn["routed"] else None
+        
+        def record_hedge_loser(brand, result):
+            # A hedged request that lost still used tokens; it reports them when it finishes
+            record_usage([(brand, result)], q_id, turn["ledger"])
+        
+        def timed(requests):
+            # The turn deadline starts when the calls do (a prefetch may wait in the queue first)
+            return with_deadline(requests, turn["turn_deadline"], turn["hedge"], record_hedge_loser)
+        
+        if turn["sample_max"]:
+            # Flakiness mode: sample the question repeatedly until the pass rate is settled; each sample gets its own deadline
+            (brand, kwargs), = call_kwargs.items()
+            
+            def sample():
+                sample_kwargs = timed({brand: kwargs})[brand]
+                if route:
+                    return call_routed(brand, route[brand], **sample_kwargs)
+                return call_provider(brand, **sample_kwargs)
+            
+            sampling = sample_pass_rate(
+                sample,
+                lambda r: evaluate_response_rule_based(r["response"], q_id, stop_on_failure=True)["passed"],
+                max_samples=turn["sample_max"],
+                # Samples still running when the result settled are billed when they finish
+                on_late_result=lambda r: record_usage([(brand, r)], q_id, turn["ledger"])
+            )
+            # Show a failing sample if there is one - it's the one worth reading
+            sample_results = sampling.pop("results")
+            record_usage([(brand, r) for r in sample_results], q_id, turn["ledger"])
+            representative = next((r for r in sample_results if not r["passed"]), sample_results[0])
+            results = {brand: representative}
+        else:
+            # Call the selected provider (or both at once in compare mode)
+            results = call_providers(timed(call_kwargs), route)
+            record_usage(results.items(), q_id, turn["ledger"])
+        
+        evals_by_brand, response_refs = None, None
+        if q_id is not None:
+            evals_by_brand = score_results(q_id, results, turn["ledger"])
+            response_refs = archive_responses(results)
+        return results, evals_by_brand, sampling, response_refs
+
+    def submit_job(kind, label, fn, *args, **job):
+        """Run fn on the shared worker pool; the chat shows it as pending until it finishes"""
+        st.session_state.pending_jobs.append({
+            "kind": kind,
+            "label": label,
+            "future": get_llm_executor().submit(fn, *args),
+            "started": time.time(),
+            **job
+        })
+
+    def finish_turn(job, output):
+        results, evals_by_brand, sampling, response_refs = output
+        q_id = job["q_id"]
+        record_turn(q_id, results, evals_by_brand=evals_by_brand, sampling=sampling, reply_to=job.get("reply_to"))
+        if q_id is not None and sampling is None:
+            # Remember the verdict so "Run all" can skip or prioritise this question
+            get_eval_history().record(job["run_key"], job["system_prompt"], q_id,
+                                      st.session_state.eval_results[q_id], response_refs)
+
+    def finish_run_all(job, run):
+        # Show answered questions in the order they were scheduled
+        for q_id in run["order"]:
+            if q_id in run["results"]:
+                results, eval_result = run["results"][q_id]
+                add_message({"role": "user", "content": get_question(q_id)["question"]})
+                record_turn(q_id, results, evals_by_brand=eval_result["by_brand"])
+        
+        # Known verdicts still count on the scoreboard
+        for q_id, verdict in run["skipped"].items():
+            question_id = get_question(q_id)["id"]
+            if question_id not in st.session_state.eval_results:
+                st.session_state.eval_results[question_id] = {**verdict, "question_id": question_id, "cached": True}
+        if len(st.session_state.eval_results) == len(EVAL_DATASET):
+            st.session_state.game_complete = True
+        
+        summary = [f"▶️ **Run all:** {len(run['results'])} run, {len(run['skipped'])} skipped (verdict already known for this prompt & settings)"]
+        if run["first_failure"] is not None:
+            summary.append(f"First failure: question {run['first_failure']}")
+        if run["cancelled"]:
+            summary.append(f"Cancelled after first failure: {len(run['cancelled'])} question(s)")
+        if run["over_budget"]:
+            summary.append(f"Stopped at the {format_cost(job['spend_limit'])} spend limit: "
+                           f"{len(run['over_budget'])} question(s) not run")
+        spend = cost_ledger.totals(run_id=job["run_id"])
+        summary.append(f"Spend: {format_cost(spend['cost'])} over {spend['calls']} call(s) "
+                       f"(estimated {format_cost(job['estimate'])})")
+        tiers = [result["tier"] for results, _ in run["results"].values()
+                 for result in results.values() if "tier" in result]
+        if tiers:
+            summary.append(f"Routing: {tiers.count(0)} of {len(tiers)} answers from the cheapest tier")
+        add_message({"role": "assistant", "content": "  \n".join(summary)})
+        save_session()
+
+    def collect_finished_jobs() -> bool:
+        """Add the results of finished background jobs to the chat; True if any finished"""
+        finished = [job for job in st.session_state.pending_jobs if job["future"].done()]
+        for job in finished:
+            st.session_state.pending_jobs.remove(job)
+            try:
+                output = job["future"].result()
+            except Exception as e:
+                add_message({"role": "assistant", "content": f"Error: {e}", "reply_to": job["label"]})
+                continue
+            if job["kind"] == "run_all":
+                finish_run_all(job, output)
+            else:
+                finish_turn(job, output)
+        return bool(finished)
+
+    def prepare_turn(prompt, q_id, history_messages, earlier_summary=None):
+        """Everything a turn's background call needs: call kwargs per provider, sampling, routing and deadlines"""
+        # Prepare conversation history if save_context is enabled
+        conversation_history = None
+        history_summary = None
+        if save_context and history_messages:
+            # Pass the newest messages that fit the token budget; older turns are folded into a summary
+            history = build_history(history_messages, token_budget=history_token_budget,
+                                    earlier_summary=earlier_summary)
+            conversation_history = history["messages"]
+            history_summary = history["summary"]
+        
+        call_kwargs = prepare_calls(prompt, q_id, conversation_history, history_summary)
+        return {
+            "call_kwargs": call_kwargs,
+            "sample_max": max_samples if use_sampling and q_id is not None and len(api_keys) == 1 else None,
+            # Only eval questions have assertions to decide an escalation
+            "routed": use_routing and q_id is not None,
+            "turn_deadline": turn_deadline,
+            "hedge": use_hedging,
+            # Discarded prefetches are billed too, so usage is recorded where the calls are made
+            "ledger": ledger_labels()
+        }
+
+    def turn_key(turn, q_id):
+        """Hash of everything that shapes a turn's answer and verdict (to match a prefetch)"""
+        payload = json.dumps([turn, q_id, use_llm_judge], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def discard_prefetch():
+        """Drop the speculative call, cancelling it if it hasn't started yet"""
+        prefetch = st.session_state.prefetch
+        if prefetch is not None:
+            prefetch["future"].cancel()
+            st.session_state.prefetch = None
+
+    def handle_question_selected(question_text, question_id):
+        """Fill the chat input and, in speculative mode, start answering before Send is clicked."""
+        set_question(question_text, question_id)
+        discard_prefetch()
+        if use_prefetch and all(api_keys.values()):
+            turn = prepare_turn(question_text, question_id, st.session_state.messages,
+                                st.session_state.earlier_summary)
+            st.session_state.prefetch = {
+                "key": turn_key(turn, question_id),
+                "future": get_llm_executor().submit(run_turn, turn, question_id)
+            }
+
     # Chat input handler
     def handle_chat_input():
         print("🔍 DEBUG: handle_chat_input called!")
         prompt = st.session_state.chat_input_val
         print(f"🔍 DEBUG: prompt = {prompt}")
         if prompt:
-            if not llm_api_key:
+            if not all(api_keys.values()):
                 print("🔍 ERROR: No API key provided!")
                 st.error("Please enter your API key in the sidebar")
             else:
-                # Add user message
-                st.session_state.messages.append({"role": "user", "content": prompt})
-                
-                # Prepare conversation history if save_context is enabled
-                conversation_history = None
-                if save_context and len(st.session_state.messages) > 1:
-                    # Pass all messages except the one we just added (we'll send it separately)
-                    conversation_history = st.session_state.messages[:-1]
-                
-                print(f"🔍 save_context={save_context}, conversation_history={'None' if conversation_history is None else f'{len(conversation_history)} messages'}")
+                # History as it was before this prompt; we'll send the prompt separately
+                history_messages = list(st.session_state.messages)
+                earlier_summary = st.session_state.earlier_summary
                 
-                # Build system prompt with user memory if enabled
-                effective_system_prompt = st.session_state.system_prompt
-                if use_user_memory:
-                    user_memory_context = f"""
-                        You are helping {SARAH_PERSONA['name']}, a {SARAH_PERSONA['age']}-year-old customer who:
-                        - {SARAH_PERSONA['context']}
-                        - {SARAH_PERSONA['pain_point']}
-                        - Budget: {SARAH_PERSONA['budget']}
-                        - Goal: {SARAH_PERSONA['goal']}
-
-                        Customer behaviors:
-                        {chr(10).join(f'- {behavior}' for behavior in SARAH_PERSONA['behaviors'])}
-
-                        Tailor your recommendations to her specific situation, risk tolerance, and constraints."""
-                    effective_system_prompt = st.session_state.system_prompt + user_memory_context
-                
-                # print("🔍 Conversation history:", conversation_history)
-                # print("🔍 User message:", prompt)
-                # print("🔍 System prompt:", effective_system_prompt)
-                # print("🔍 Use DB tool:", use_db_tool)
+                # Add user message
+                add_message({"role": "user", "content": prompt})
                 
-                # Call appropriate API based on selected brand
-                if st.session_state.selected_brand == "Anthropic":
-                    # print("🔍 CALLING CLAUDE API")
-                    result = call_claude(
-                        api_key=llm_api_key,
-                        system_prompt=effective_system_prompt,
-                        user_message=prompt,
-                        review_context=None,
-                        use_tool=use_db_tool,
-                        conversation_history=conversation_history
-                    )
-                else:  # OpenAI
-                    # print("🔍 CALLING OPENAI API")
-                    result = call_openai(
-                        api_key=llm_api_key,
-                        system_prompt=effective_system_prompt,
-                        user_message=prompt,
-                        review_context=None,
-                        use_tool=use_db_tool,
-                        conversation_history=conversation_history
-                    )
+                q_id = st.session_state.current_question_id
+                turn = prepare_turn(prompt, q_id, history_messages, earlier_summary)
+                job = dict(
+                    q_id=q_id,
+                    reply_to=prompt,
+                    run_key=current_run_key(),
+                    system_prompt=build_system_prompt(st.session_state.system_prompt, use_user_memory)
+                )
                 
-                if result['success']:
-                    response = result['response']
-                    # print("🔍 SUCCESS - Response preview:", response[:200] if len(response) > 200 else response)
+                prefetch = st.session_state.prefetch
+                st.session_state.prefetch = None
+                if prefetch is not None and prefetch["key"] == turn_key(turn, q_id):
+                    # Nothing changed since the question was selected: reuse the speculative call
+                    st.session_state.pending_jobs.append({
+                        "kind": "turn", "label": prompt, "future": prefetch["future"],
+                        "started": time.time(), **job
+                    })
                 else:
-                    response = f"Error: {result['error']}"
-                    # print("🔍 ERROR Response:", response)
-                
-                
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                print("🔍 Total messages in history:", len(st.session_state.messages))
+                    if prefetch is not None:
+                        # The prompt or settings changed; its answer would be for a different turn
+                        prefetch["future"].cancel()
+                    # The call runs in the background; the chat shows it as pending meanwhile
+                    submit_job("turn", prompt, run_turn, turn, q_id, **job)
                 
-                # Run evaluation if this was an eval question
-                if st.session_state.current_question_id is not None:
-                    # Increment try counter for this question
-                    q_id = st.session_state.current_question_id
-                    if q_id not in st.session_state.try_counter:
-                        st.session_state.try_counter[q_id] = 0
-                    st.session_state.try_counter[q_id] += 1
-                    
-                    eval_result = evaluate_response_rule_based(
-                        response, 
-                        st.session_state.current_question_id
-                    )
-                    # Add try number to the result
-                    eval_result['try_number'] = st.session_state.try_counter[q_id]
-                    st.session_state.eval_results[st.session_state.current_question_id] = eval_result
-                    
-                    # Check if game is complete (all questions answered)
-                    if len(st.session_state.eval_results) == len(EVAL_QUESTIONS):
-                        st.session_state.game_complete = True
-                    
-                    # Reset current question ID
-                    st.session_state.current_question_id = None
+                # Reset current question ID
+                st.session_state.current_question_id = None
                 
                 # Clear input
                 st.session_state.chat_input_val = ""
 
+    def plan_run_all():
+        """Call kwargs for every eval question, and a local cost estimate of the ones "Run all" would send"""
+        question_ids = [get_question(case_id)["id"] for case_id in EVAL_DATASET.ids()]
+        call_kwargs = {q_id: prepare_calls(get_question(q_id)["question"], q_id) for q_id in question_ids}
+        known = get_eval_history().known_verdicts(current_run_key(), question_ids) if skip_known_verdicts else {}
+        # Routed questions are estimated at the cheapest tier; escalations are settled at their actual cost
+        models = {brand: MODEL_TIERS[brand][0] if use_routing else DEFAULT_MODELS[brand] for brand in api_keys}
+        estimate = estimate_sweep(
+            {q_id: [(models[brand], kwargs) for brand, kwargs in call_kwargs[q_id].items()]
+             for q_id in question_ids if str(q_id) not in known},
+            output_tokens=cost_ledger.average_output_tokens()
+        )
+        return question_ids, call_kwargs, estimate
+
+    def handle_estimate():
+        """Pre-flight cost of "Run all" with the current prompt and settings (no API calls)."""
+        _, _, estimate = plan_run_all()
+        estimate.pop("per_question")
+        st.session_state.sweep_estimate = {"run_key": current_run_key(), **estimate}
+
+    def handle_run_all():
+        """Run every eval question, failure-first, skipping verdicts already known for this setup."""
+        if not all(api_keys.values()):
+            st.error("Please enter your API key in the sidebar")
+            return
+        
+        # Built up front: session state isn't available on the worker threads
+        question_ids, call_kwargs, estimate = plan_run_all()
+        labels, run_id = ledger_labels(), uuid.uuid4().hex[:12]
+        budget = SpendBudget(spend_limit, estimate["per_question"]) if spend_limit else None
+        
+        routed, deadline, hedge = use_routing, turn_deadline, use_hedging
+        
+        def record_hedge_loser(q_id, brand, result):
+            # Billed after the question settled, so it is charged to the budget separately
+            cost = record_usage([(brand, result)], q_id, labels, run_id)
+            if budget is not None:
+                budget.charge(cost)
+        
+        def run_question(q_id):
+            route = {brand: passes_assertions(q_id) for brand in call_kwargs[q_id]} if routed else None
+            # Each question gets the full turn deadline, counted from when its calls start
+            results = call_providers(
+                with_deadline(call_kwargs[q_id], deadline, hedge, partial(record_hedge_loser, q_id)), route
+            )
+            record_usage(results.items(), q_id, labels, run_id)
+            return results
+        
+        def score_question(q_id, results):
+            # Rule-based only; the judge grades the whole run at once in judge_run
+            evals_by_brand = {brand: score_response(q_id, response_text(result)) for brand, result in results.items()}
+            return {**combined_eval(evals_by_brand), "response_refs": archive_responses(results)}
+        
+        def judge_run(run_results):
+            judge_answers([(q_id, brand, result, eval_result["by_brand"][brand])
+                           for q_id, (results, eval_result) in run_results.items()
+                           for brand, result in results.items()], labels, run_id)
+            for results, eval_result in run_results.values():
+                eval_result.update(combined_eval(eval_result["by_brand"]))
+        
+        submit_job(
+            "run_all", "Run all", partial(run_all, budget=budget, judge_fn=judge_run if use_llm_judge else None),
+            question_ids, run_question, score_question, get_eval_history(), current_run_key(),
+            build_system_prompt(st.session_state.system_prompt, use_user_memory),
+            fail_fast, skip_known_verdicts,
+            run_id=run_id, estimate=estimate["cost"], spend_limit=spend_limit
+        )
+
     # Two columns - System Prompt and Chat
     col1, col2 = st.columns(2)
 
@@ -453,16 +964,45 @@ with tab2:
         # Update session state if changed
         if system_prompt != st.session_state.system_prompt:
             st.session_state.system_prompt = system_prompt
+            save_session()
 
         st.markdown("---")
         use_db_tool = st.checkbox("Enable Database Query Tool", value=False, 
                                 help="Allow Claude to query the reviews database for better answers")
         use_user_memory = st.checkbox("Enable User Memory (Sarah's Persona)", value=False,
                                 help="Add Sarah's persona and preferences to the system prompt for personalized recommendations")
+        use_review_retrieval = st.checkbox("Retrieve Review Context", value=False,
+                                help="Add the most relevant reviews for the question's product to the message, so the model rarely needs a database round-trip")
+        use_product_digests = st.checkbox("Use Product Digests", value=False,
+                                help="Add a precomputed digest of all the product's reviews (sizing verdict, quality complaints, ratings, quotes) to the message; build them with product_digests.py")
+        use_routing = st.checkbox("Adaptive Routing (cheap model first)", value=False,
+                                help=f"Answer eval questions with the cheapest model and re-ask a stronger one only if the rule-based assertions fail ({', '.join(' → '.join(tiers) for tiers in MODEL_TIERS.values())}); each answer shows which tier it came from")
+        use_sampling = st.checkbox("Flakiness Mode (repeat sampling)", value=False,
+                                help="Send eval questions several times in parallel and report the pass rate with a confidence interval; stops early once the result is settled")
+        max_samples = st.slider("Max samples per question", min_value=3, max_value=30,
+                                value=DEFAULT_MAX_SAMPLES, disabled=not use_sampling)
+        use_prefetch = st.checkbox("Speculative prefetch", value=False,
+                                help="Start answering as soon as a question is selected; the answer is used on Send if the question and settings are unchanged (discarded answers still cost tokens)")
         save_context = st.checkbox("Save context", value=False,
-                                help="Send full conversation history to Claude for context")
-        use_llm_judge = st.checkbox("Use LLM-as-Judge", value=False, disabled=True,
-                                help="Use Claude to evaluate responses (coming soon)")
+                                help="Send recent conversation history to Claude for context")
+        history_token_budget = st.number_input("Context token budget", min_value=200, max_value=50000,
+                                value=DEFAULT_HISTORY_TOKEN_BUDGET, step=200, disabled=not save_context,
+                                help="Newest turns that fit are sent as-is; older turns are folded into a short summary")
+        call_timeout = st.number_input("Call timeout (s)", min_value=5, max_value=600, value=DEFAULT_CALL_TIMEOUT, step=5,
+                                help="Longest a single model call may take, including its database tool round-trip")
+        turn_deadline = st.number_input("Turn deadline (s)", min_value=5, max_value=1200, value=DEFAULT_TURN_DEADLINE, step=5,
+                                help="Longest a whole turn may take, across escalations and hedged duplicates")
+        use_hedging = st.checkbox("Hedge slow calls", value=False,
+                                help="If a call runs longer than 95% of recent calls to the same model, send a duplicate and use whichever answers first (costs tokens for the duplicate)")
+        use_llm_judge = st.checkbox("Use LLM-as-Judge", value=False,
+                                help="Also grade eval answers against the ground truth with the selected provider's model (verdicts are cached)")
+        
+        # Spend so far, from the cost ledger (answers, escalations and judge calls)
+        session_spend = cost_ledger.totals(session_id=st.session_state.session_id)
+        prompt_spend = cost_ledger.totals(prompt_hash=ledger_labels()["prompt_hash"])
+        st.caption(f"💰 Session: {format_cost(session_spend['cost'])} · {session_spend['calls']} calls · "
+                   f"{session_spend['input']:,} in / {session_spend['output']:,} out / {session_spend['cached']:,} cached tokens")
+        st.caption(f"💰 This prompt (all sessions): {format_cost(prompt_spend['cost'])} · {prompt_spend['calls']} calls")
 
     with col2:
         st.subheader("Chat")
@@ -471,58 +1011,51 @@ with tab2:
         chat_container = st.container(height=400)
         
         with chat_container:
-            # Initialize chat history
-            if 'messages' not in st.session_state:
-                st.session_state.messages = []
+            if 'history_window' not in st.session_state:
+                st.session_state.history_window = CHAT_WINDOW_SIZE
+            
+            # Only render the newest messages; older ones are loaded on demand
+            offset = st.session_state.message_offset
+            total_count = offset + len(st.session_state.messages)
+            hidden_count = max(0, total_count - st.session_state.history_window)
+            if hidden_count:
+                st.button(f"⬆️ Show {min(hidden_count, CHAT_WINDOW_SIZE)} earlier messages ({hidden_count} hidden)",
+                         on_click=show_earlier_messages, width='stretch')
+            
+            # Messages older than the in-memory window are read back from the session store
+            visible_messages = st.session_state.messages[max(0, hidden_count - offset):]
+            if hidden_count < offset:
+                visible_messages = get_session_store().load_messages(
+                    st.session_state.session_id, hidden_count, offset
+                ) + visible_messages
             
             # Display chat messages
-            for idx, message in enumerate(st.session_state.messages):
+            for message in visible_messages:
                 with st.chat_message(message["role"]):
-                    st.markdown(message["content"])
+                    if "reply_to" in message:
+                        st.caption(f"↪️ {message['reply_to'][:100]}")
+                    if "compare" in message:
+                        render_comparison(message["compare"])
+                    else:
+                        st.markdown(message["content"])
+                        if "routing" in message:
+                            st.caption(routing_caption(message["routing"]))
                     
                     # Show eval result if this is an assistant message that was evaluated
-                    if message["role"] == "assistant":
-                        # Check if this message has an eval result
-                        # We need to match this to a question - check if idx-1 was a user message
-                        # that matches one of our eval questions
-                        if idx > 0:
-                            user_msg = st.session_state.messages[idx - 1]["content"]
-                            for q in EVAL_QUESTIONS:
-                                if q["question"] == user_msg and q["id"] in st.session_state.eval_results:
-                                    result = st.session_state.eval_results[q["id"]]
-                                    
-                                    # Show try number
-                                    try_num = result.get('try_number', 1)
-                                    st.markdown(f"**📝 Try #{try_num}**")
-                                    st.markdown("---")
-                                    
-                                    # Get assertions for this question (handle both old and new structure)
-                                    if "scenarios" in q:
-                                        scenario = result.get("scenario", "neutral")
-                                        assertions = q["scenarios"][scenario]["assertions"]
-                                    else:
-                                        assertions = q.get("assertions", [])
-                                    
-                                    if result["passed"]:
-                                        st.success("✅ Passed - All assertions met!")
-                                    else:
-                                        st.error("❌ Failed - Some assertions not met")
-                                    
-                                    # Show ALL assertions with their status (passed or failed)
-                                    if "details" in result:
-                                        for check, passed in result["details"].items():
-                                            # Find the description for this check
-                                            assertion = next((a for a in assertions if a["check"] == check), None)
-                                            if assertion:
-                                                if passed:
-                                                    st.success(f"✅ {assertion['description']}")
-                                                else:
-                                                    st.error(f"❌ {assertion['description']}")
-                                    
-                                    # Show improvement tip if available and failed
-                                    if not result["passed"] and "prompt_improvement" in q:
-                                        st.info(f"💡 **Tip:** {q['prompt_improvement']}")
-                                    break
+                    if message["role"] == "assistant" and "eval" in message and "compare" not in message:
+                        render_eval_result(message["eval"])
+        
+        # Answers still being generated in the background; polls until they arrive
+        @st.fragment(run_every=PENDING_POLL_SECONDS if st.session_state.pending_jobs else None)
+        def show_pending_jobs():
+            if collect_finished_jobs():
+                st.rerun()
+            for job in st.session_state.pending_jobs:
+                with st.chat_message("assistant"):
+                    st.markdown(f"⏳ *Working on: {job['label'][:80]}* ({time.time() - job['started']:.0f}s)")
+        
+        with chat_container:
+            show_pending_jobs()
         
         # Chat input - using text_area for better visibility of long questions
         st.text_area(
@@ -545,7 +1078,7 @@ with tab2:
         
         # Calculate score
         passed_count = sum(1 for result in st.session_state.eval_results.values() if result["passed"])
-        total_count = len(EVAL_QUESTIONS)
+        total_count = len(EVAL_DATASET)
         
         # Create a nice results display
         st.markdown("---")
@@ -567,8 +1100,12 @@ with tab2:
             st.markdown("**Tools Used:**")
             st.markdown(f"{'✓' if use_db_tool else '✗'} Database Query Tool")
             st.markdown(f"{'✓' if use_user_memory else '✗'} User Memory")
+            st.markdown(f"{'✓' if use_review_retrieval else '✗'} Review Retrieval")
+            st.markdown(f"{'✓' if use_product_digests else '✗'} Product Digests")
+            st.markdown(f"{'✓' if use_routing else '✗'} Adaptive Routing")
             st.markdown(f"{'✓' if save_context else '✗'} Save Context")
-            st.markdown(f"**Eval Method:** Rule-based")
+            st.markdown(f"{'✓' if use_sampling else '✗'} Flakiness Mode")
+            st.markdown(f"**Eval Method:** {'Rule-based + LLM judge' if use_llm_judge else 'Rule-based'}")
         
         st.markdown("---")
         st.info("💡 Take a screenshot of this results screen to share your score!")
@@ -577,7 +1114,15 @@ with tab2:
             st.session_state.eval_results = {}
             st.session_state.game_complete = False
             st.session_state.messages = []
+            st.session_state.message_offset = 0
+            st.session_state.earlier_summary = None
+            st.session_state.pending_jobs = []
+            st.session_state.prefetch = None
             st.session_state.try_counter = {}
+            st.session_state.history_window = CHAT_WINDOW_SIZE
+            # The finished game stays on disk under its old session ID
+            start_session()
+            save_session()
             st.rerun()
             
     else:
@@ -585,9 +1130,41 @@ with tab2:
         st.subheader("📝 Evaluation Questions")
         st.markdown("Click a question to populate the chat:")
         
+        # Large suites are shown one page at a time, read lazily from the dataset file
+        question_ids = EVAL_DATASET.ids()
+        page_start = 0
+        if len(question_ids) > QUESTION_PAGE_SIZE:
+            page_count = (len(question_ids) + QUESTION_PAGE_SIZE - 1) // QUESTION_PAGE_SIZE
+            page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1)
+            page_start = (page - 1) * QUESTION_PAGE_SIZE
+        
+        # Run the whole suite, last failures first
+        run_col, fail_fast_col, skip_col = st.columns([2, 1, 1])
+        with fail_fast_col:
+            fail_fast = st.checkbox("Fail fast", value=False,
+                                help="Stop at the first failing question")
+        with skip_col:
+            skip_known_verdicts = st.checkbox("Skip known", value=True,
+                                help="Skip questions already scored with this exact prompt, provider and settings")
+        with run_col:
+            st.button("▶️ Run all (failures first)", on_click=handle_run_all, width='stretch')
+        limit_col, estimate_col = st.columns([1, 1])
+        with limit_col:
+            spend_limit = st.number_input("Spend limit ($)", min_value=0.0, value=0.0, step=0.5,
+                                help="Stop \"Run all\" before a question could take it over this spend (0 for no limit)")
+        with estimate_col:
+            st.button("💲 Estimate cost", on_click=handle_estimate, width='stretch',
+                     help="Count the tokens \"Run all\" would send locally and price them (no API calls)")
+        estimate = st.session_state.sweep_estimate
+        if estimate and estimate["run_key"] == current_run_key():
+            unpriced = f", {estimate['unpriced']} call(s) to unpriced models" if estimate["unpriced"] else ""
+            st.caption(f"💲 Run all: ~{format_cost(estimate['cost'])} for {estimate['questions']} question(s), "
+                       f"{estimate['calls']} call(s), ~{estimate['input']:,} in / {estimate['output']:,} out tokens{unpriced}")
+        
         # Create a container for the questions
         with st.container():
-            for q_data in EVAL_QUESTIONS:
+            for case_id in question_ids[page_start:page_start + QUESTION_PAGE_SIZE]:
+                q_data = get_question(case_id)
                 q_id = q_data["id"]
                 q_text = q_data["question"]
                 
@@ -599,7 +1176,7 @@ with tab2:
                     label = f"{status} {q_text}"
                 
                 st.button(label, key=f"q_{q_id}", 
-                         on_click=set_question, args=(q_text, q_id), 
+                         on_click=handle_question_selected, args=(q_text, q_id), 
                          width='stretch')
 
 # Footer
@@ -0,0 +1,189 @@
+"""
+Assertion language for rule-based eval checks
+
+Each assertion in an eval case has a "match" expression (JSON), compiled
+once per case into a predicate over the response text:
+
+    "text"                              contains the phrase (case-insensitive)
+    {"contains": "text"}                same as a bare string
+    {"literal": "text"}                 contains the text as written ({braces} are not placeholders)
+    {"regex": "pattern"}                re.search, case-insensitive
+    {"any": [expr, ...]}                at least one matches (stops at the first that does)
+    {"all": [expr, ...]}                every one matches (stops at the first that doesn't)
+    {"not": expr}                       expr does not match
+    {"count": expr, "min": 2, "max": 5} number of occurrences of a "contains"/"regex"
+                                        expr (or of matching sub-expressions of an
+                                        "any" list) is within [min, max]
+
+Strings and patterns may use {placeholders} filled from the case's
+"context", e.g. {"regex": "santra\\.com/clothing/{clothing_id}\\b"} only
+passes if the buy link is for the product the question is about. Values
+are regex-escaped inside patterns.
+
+Assertions with the legacy "keywords" list compile to {"any": keywords}.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List
+
+# Compiled cases kept in memory (compiling is cheap, but not free at 10k cases)
+COMPILED_CACHE_SIZE = 1024
+
+_PLACEHOLDER_RE = re.compile(r"\{([A-Za-z_]\w*)\}")
+
+_compiled_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# A predicate gets the response and its lowercase form (computed once per response)
+Predicate = Callable[[str, str], bool]
+
+
+class InvalidAssertion(ValueError):
+    """An assertion expression is malformed or uses an unknown placeholder"""
+
+
+def _fill(template: str, context: Dict, escape: bool) -> str:
+    def replace(match):
+        name = match.group(1)
+        if name not in context:
+            raise InvalidAssertion(f"Unknown placeholder {{{name}}} (context has: {', '.join(context) or 'nothing'})")
+        value = str(context[name])
+        return re.escape(value) if escape else value
+    return _PLACEHOLDER_RE.sub(replace, template)
+
+
+def _counter(expr, context: Dict) -> Callable[[str, str], int]:
+    """Compile an expression whose matches can be counted"""
+    if isinstance(expr, str):
+        expr = {"contains": expr}
+    if "contains" in expr or "literal" in expr:
+        needle = expr["literal"] if "literal" in expr else _fill(expr["contains"], context, escape=False)
+        needle = needle.lower()
+        return lambda response, lower: lower.count(needle) if needle else 0
+    if "regex" in expr:
+        pattern = re.compile(_fill(expr["regex"], context, escape=True), re.IGNORECASE)
+        return lambda response, lower: sum(1 for _ in pattern.finditer(response))
+    if "any" in expr:
+        predicates = [compile_expression(e, context) for e in expr["any"]]
+        return lambda response, lower: sum(1 for p in predicates if p(response, lower))
+    raise InvalidAssertion(f"count needs a contains, literal, regex or any expression, got {expr!r}")
+
+
+def compile_expression(expr, context: Dict = None) -> Predicate:
+    """
+    Compile one match expression into a predicate
+
+    Args:
+        expr: Expression (see module docstring)
+        context: Values for {placeholders}
+
+    Returns:
+        predicate(response, response_lower) -> bool
+    """
+    context = context or {}
+    if isinstance(expr, str):
+        needle = _fill(expr, context, escape=False).lower()
+        return lambda response, lower: needle in lower
+    if not isinstance(expr, dict) or not expr:
+        raise InvalidAssertion(f"Invalid assertion expression: {expr!r}")
+
+    if "contains" in expr:
+        return compile_expression(expr["contains"], context)
+    if "literal" in expr:
+        needle = expr["literal"].lower()
+        return lambda response, lower: needle in lower
+    if "regex" in expr:
+        pattern = re.compile(_fill(expr["regex"], context, escape=True), re.IGNORECASE)
+        return lambda response, lower: pattern.search(response) is not None
+    if "any" in expr:
+        predicates = [compile_expression(e, context) for e in expr["any"]]
+        return lambda response, lower: any(p(response, lower) for p in predicates)
+    if "all" in expr:
+        predicates = [compile_expression(e, context) for e in expr["all"]]
+        return lambda response, lower: all(p(response, lower) for p in predicates)
+    if "not" in expr:
+        inner = compile_expression(expr["not"], context)
+        return lambda response, lower: not inner(response, lower)
+    if "count" in expr:
+        count = _counter(expr["count"], context)
+        low = expr.get("min", 1)
+        high = expr.get("max")
+
+        def within_bounds(response, lower):
+            n = count(response, lower)
+            return n >= low and (high is None or n <= high)
+        return within_bounds
+    raise InvalidAssertion(f"Unknown assertion operator in {expr!r}")
+
+
+def assertion_expression(assertion: Dict):
+    """The match expression of an assertion (legacy keyword lists become 'any')"""
+    if "match" in assertion:
+        return assertion["match"]
+    return {"any": assertion.get("keywords", [])}
+
+
+class CompiledAssertions:
+    """
+    The rule-based assertions of one eval case, compiled
+
+    Semantic assertions are not compiled here; they are listed in
+    `semantic` for the caller to score (they are batched across responses).
+    """
+
+    def __init__(self, assertions: List[Dict], context: Dict = None):
+        self.rules = []
+        self.semantic = []
+        for assertion in assertions:
+            if assertion.get("type") == "semantic":
+                self.semantic.append(assertion)
+            else:
+                self.rules.append((assertion["check"], compile_expression(assertion_expression(assertion), context)))
+
+    def evaluate(self, response: str, stop_on_failure: bool = False) -> Dict[str, bool]:
+        """
+        Run the rule-based checks
+
+        Args:
+            response: Response text
+            stop_on_failure: Return as soon as one check fails (the verdict is
+                decided); the result then only has the checks run so far
+
+        Returns:
+            {check: passed} in assertion order
+        """
+        lower = response.lower()
+        results = {}
+        for check, predicate in self.rules:
+            results[check] = predicate(response, lower)
+            if stop_on_failure and not results[check]:
+                break
+        return results
+
+
+def compile_case(assertions: List[Dict], context: Dict = None) -> CompiledAssertions:
+    """
+    Compile a case's assertions, reusing the compilation of the same loaded case
+
+    The cache is keyed on the identity of the assertions list and context
+    dict, so a lookup costs no serialising or hashing. Loaded cases are not
+    modified; a case read again (a new object) is compiled again.
+
+    Args:
+        assertions: The case's assertion dicts
+        context: The case's context (placeholder values)
+    """
+    key = (id(assertions), id(context))
+    with _cache_lock:
+        entry = _compiled_cache.get(key)
+        # The entry holds the objects themselves, so their ids cannot be reused while it is cached
+        if entry is not None and entry[0] is assertions and entry[1] is context:
+            _compiled_cache.move_to_end(key)
+            return entry[2]
+    compiled = CompiledAssertions(assertions, context)
+    with _cache_lock:
+        _compiled_cache[key] = (assertions, context, compiled)
+        if len(_compiled_cache) > COMPILED_CACHE_SIZE:
+            _compiled_cache.popitem(last=False)
+    return compiled
@@ -0,0 +1,578 @@
+"""
+Batch-API execution mode for large eval suites
+
+Packages every eval case into provider batch jobs (Anthropic Message Batches,
+OpenAI Batch), polls until they finish and scores the results with the same
+rule-based assertions as the app (evaluate_response_rule_based). Job IDs are
+persisted to a state file after each submission, so a crashed or interrupted
+run resumes polling the same jobs instead of paying for them twice. Scored
+results are appended to a JSONL file next to it (see results_path) as each
+job finishes, so the state file stays small however large the suite is.
+
+Batch jobs are single-turn: the database query tool is not available here.
+Each submitted chunk's cost is estimated locally first, so a max_spend
+limit stops submitting before the run could go over it; actual usage is
+recorded in the cost ledger (cost_ledger.py) as each job is scored.
+"""
+import anthropic
+from openai import OpenAI
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from claude_api import usage_tokens
+from cost_ledger import CostLedger, estimate_sweep, format_cost, usage_records
+from eval_dataset import EvalDataset
+from evals import EVAL_DATASET, build_system_prompt, evaluate_responses_rule_based
+from judge import apply_verdict, judge_responses
+from response_archive import ResponseArchive
+from scheduler import prompt_hash
+
+DEFAULT_MODELS = {
+    "anthropic": "claude-haiku-4-5-20251001",
+    "openai": "gpt-4o-mini"
+}
+
+# Requests per provider batch job (both providers cap a single batch well above this)
+DEFAULT_CHUNK_SIZE = 10000
+
+OPENAI_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def custom_id_for(case: Dict) -> str:
+    """Stable per-case request ID (providers only allow [a-zA-Z0-9_-])"""
+    return f"q-{case['id']}"
+
+
+def case_id_from(custom_id: str) -> str:
+    """Inverse of custom_id_for"""
+    return custom_id[len("q-"):]
+
+
+def load_state(state_path: str) -> Dict:
+    """Load persisted batch state, or None if no run has been started"""
+    path = Path(state_path)
+    if not path.exists():
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_state(state_path: str, state: Dict):
+    """Atomically persist batch state so a crash never leaves a half-written file"""
+    path = Path(state_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def results_path(state_path: str) -> Path:
+    """JSONL file holding a run's scored results, next to its state file"""
+    return Path(state_path).with_suffix(".results.jsonl")
+
+
+def append_results(state_path: str, results: Dict[str, Dict]):
+    """Append one job's results (custom_id -> result) to the run's results file"""
+    path = results_path(state_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab") as f:
+        # A crash can leave a line cut short; start on a fresh line after it
+        if f.tell() and not _ends_with_newline(path):
+            f.write(b"\n")
+        for custom_id, result in results.items():
+            f.write((json.dumps({"custom_id": custom_id, **result}) + "\n").encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _ends_with_newline(path: Path) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def load_results(state_path: str) -> Dict[str, Dict]:
+    """
+    Scored results of a run by custom_id
+
+    A job that was scored again after a crash appears twice in the file;
+    its later lines win.
+    """
+    results = {}
+    path = results_path(state_path)
+    if not path.exists():
+        return results
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Cut short by a crash before its job was marked scored; the job is scored again
+                continue
+            results[entry.pop("custom_id")] = entry
+    return results
+
+
+def _chunks(cases: Iterable[Dict], chunk_size: int) -> Iterable[List[Dict]]:
+    chunk = []
+    for case in cases:
+        chunk.append(case)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ---------------------------------------------------------------------------
+# Anthropic Message Batches
+# ---------------------------------------------------------------------------
+
+def submit_anthropic_batch(client, cases: List[Dict], system_prompt: str, model: str) -> str:
+    """Submit one Message Batch and return its ID"""
+    requests = []
+    for case in cases:
+        params = {
+            "model": model,
+            "max_tokens": 2000,
+            "messages": [{"role": "user", "content": case["question"]}]
+        }
+        if system_prompt:
+            params["system"] = system_prompt
+        requests.append({"custom_id": custom_id_for(case), "params": params})
+
+    batch = client.messages.batches.create(requests=requests)
+    return batch.id
+
+
+def anthropic_batch_done(client, batch_id: str) -> bool:
+    """Whether a Message Batch has finished processing"""
+    batch = client.messages.batches.retrieve(batch_id)
+    return batch.processing_status == "ended"
+
+
+def fetch_anthropic_results(client, batch_id: str, model: str) -> Dict[str, Dict]:
+    """Collect results keyed by custom_id, in the same shape call_claude returns"""
+    results = {}
+    for entry in client.messages.batches.results(batch_id):
+        if entry.result.type == "succeeded":
+            message = entry.result.message
+            text = "".join(block.text for block in message.content if block.type == "text")
+            results[entry.custom_id] = {
+                "success": True,
+                "response": text,
+                "model": model,
+                "tokens": usage_tokens(message.usage)
+            }
+        else:
+            error = getattr(entry.result, "error", None)
+            results[entry.custom_id] = {
+                "success": False,
+                "error": str(error) if error else f"Request {entry.result.type}"
+            }
+    return results
+
+
+# ---------------------------------------------------------------------------
+# OpenAI Batch
+# ---------------------------------------------------------------------------
+
+def submit_openai_batch(client, cases: List[Dict], system_prompt: str, model: str) -> str:
+    """Upload a JSONL input file, start one Batch and return its ID"""
+    lines = []
+    for case in cases:
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": case["question"]})
+        lines.append(json.dumps({
+            "custom_id": custom_id_for(case),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": model, "messages": messages, "max_tokens": 2000}
+        }))
+
+    input_file = client.files.create(
+        file=("batch_input.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch"
+    )
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    return batch.id
+
+
+def openai_batch_done(client, batch_id: str) -> bool:
+    """Whether an OpenAI Batch has reached a terminal status"""
+    batch = client.batches.retrieve(batch_id)
+    return batch.status in OPENAI_TERMINAL_STATUSES
+
+
+def fetch_openai_results(client, batch_id: str, model: str) -> Dict[str, Dict]:
+    """Collect results keyed by custom_id, in the same shape call_openai returns"""
+    batch = client.batches.retrieve(batch_id)
+    results = {}
+
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get("response") or {}
+            if response.get("status_code") == 200:
+                body = response["body"]
+                results[entry["custom_id"]] = {
+                    "success": True,
+                    "response": body["choices"][0]["message"]["content"],
+                    "model": body.get("model", model),
+                    "tokens": {
+                        "input": body["usage"]["prompt_tokens"],
+                        "output": body["usage"]["completion_tokens"],
+                        "cached": (body["usage"].get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+                    }
+                }
+            else:
+                error = entry.get("error") or response.get("body", {}).get("error")
+                results[entry["custom_id"]] = {
+                    "success": False,
+                    "error": str(error) if error else f"Batch {batch.status}"
+                }
+    return results
+
+
+PROVIDERS = {
+    "anthropic": {
+        "client": lambda api_key, base_url: anthropic.Anthropic(api_key=api_key, base_url=base_url),
+        "submit": submit_anthropic_batch,
+        "done": anthropic_batch_done,
+        "fetch": fetch_anthropic_results
+    },
+    "openai": {
+        "client": lambda api_key, base_url: OpenAI(api_key=api_key, base_url=base_url),
+        "submit": submit_openai_batch,
+        "done": openai_batch_done,
+        "fetch": fetch_openai_results
+    }
+}
+
+
+def _estimate_cases(effective_system_prompt: str, cases: Iterable[Dict], model: str,
+                    output_tokens: Dict[str, int] = None) -> Dict:
+    # Batch requests are the question alone under the system prompt (no tool, no history)
+    return estimate_sweep(
+        {custom_id_for(case): [(model, {"system_prompt": effective_system_prompt, "user_message": case["question"]})]
+         for case in cases},
+        output_tokens=output_tokens,
+        batch=True
+    )
+
+
+def estimate_batch(
+    system_prompt: str,
+    cases: Iterable[Dict],
+    model: str,
+    use_user_memory: bool = False,
+    ledger: CostLedger = None
+) -> Dict:
+    """
+    Pre-flight estimate of a batch run, counted locally (see cost_ledger.estimate_sweep)
+
+    Args:
+        system_prompt: System prompt under test
+        cases: Eval cases that would be submitted
+        model: Model the batch would use
+        use_user_memory: Whether Sarah's persona would be appended
+        ledger: Past calls used to estimate answer length (optional)
+    """
+    return _estimate_cases(build_system_prompt(system_prompt, use_user_memory), cases, model,
+                           ledger.average_output_tokens() if ledger else None)
+
+
+def run_batch(
+    provider: str,
+    api_key: str,
+    system_prompt: str,
+    state_path: str,
+    dataset: EvalDataset = None,
+    tags: List[str] = None,
+    shard_index: int = 0,
+    num_shards: int = 1,
+    model: str = None,
+    use_user_memory: bool = False,
+    poll_interval: float = 60.0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    base_url: str = None,
+    use_judge: bool = False,
+    archive: ResponseArchive = None,
+    max_spend: float = None,
+    ledger: CostLedger = None
+) -> Dict:
+    """
+    Run an eval suite through a provider batch API and score the results
+
+    Calling this again with the same state_path resumes the run: jobs that
+    were already submitted are polled rather than resubmitted, and results
+    that were already scored are kept.
+
+    Args:
+        provider: "anthropic" or "openai"
+        api_key: Provider API key
+        system_prompt: System prompt under test
+        state_path: JSON file where job IDs are persisted (scored results go
+            to results_path(state_path))
+        dataset: Eval cases to run, streamed lazily (defaults to EVAL_DATASET)
+        tags: Only run cases carrying one of these tags
+        shard_index: Which shard of the suite this worker runs (0-based)
+        num_shards: Number of workers splitting the suite (each needs its own state_path)
+        model: Model to use (defaults to the provider's cheapest model)
+        use_user_memory: Whether to append Sarah's persona to the system prompt
+        poll_interval: Seconds between status checks
+        chunk_size: Maximum number of requests per provider batch job
+        base_url: Optional API base URL, e.g. a local stand-in batch endpoint
+        use_judge: Also grade responses against ground_truth with the batched LLM judge
+        archive: Where response bodies are stored (the state file keeps their
+            hashes as 'response_ref'); defaults to data/responses.db
+        max_spend: Stop submitting once the estimated cost of the submitted
+            cases would exceed this (USD); cases left out are not submitted
+        ledger: Where each scored call's tokens and cost are recorded;
+            defaults to data/cost_ledger.db
+
+    Returns:
+        Final state dict with the jobs and a summary of the pass rate and
+        cost (per-case results: load_results(state_path))
+    """
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown provider '{provider}' (expected one of {sorted(PROVIDERS)})")
+
+    ops = PROVIDERS[provider]
+    model = model or DEFAULT_MODELS[provider]
+    effective_system_prompt = build_system_prompt(system_prompt, use_user_memory)
+    dataset = dataset if dataset is not None else EVAL_DATASET
+    client = ops["client"](api_key, base_url)
+    archive = archive or ResponseArchive()
+    ledger = ledger or CostLedger()
+    run_id = f"batch:{Path(state_path).stem}"
+    output_tokens = ledger.average_output_tokens()
+
+    state = load_state(state_path)
+    if state is None:
+        state = {
+            "provider": provider,
+            "model": model,
+            "prompt_hash": prompt_hash(effective_system_prompt),
+            "jobs": [],
+            "estimated_cost": 0.0
+        }
+    elif (state["provider"], state["model"], state["prompt_hash"]) != (
+            provider, model, prompt_hash(effective_system_prompt)):
+        raise ValueError(
+            f"State file {state_path} belongs to a different run "
+            f"({state['provider']}/{state['model']}, prompt {state['prompt_hash']})"
+        )
+    else:
+        print(f"♻️  Resuming batch run from {state_path} ({len(state['jobs'])} jobs)")
+        if "results" in state:
+            # State files written before results had their own file
+            append_results(state_path, state.pop("results"))
+            save_state(state_path, state)
+
+    # Submit any cases that are not yet covered by a persisted job
+    submitted = {cid for job in state["jobs"] for cid in job["custom_ids"]}
+    pending = (
+        case for case in dataset.iter_cases(tags=tags, shard_index=shard_index, num_shards=num_shards)
+        if custom_id_for(case) not in submitted
+    )
+    for chunk in _chunks(pending, chunk_size):
+        estimate = _estimate_cases(effective_system_prompt, chunk, model, output_tokens)
+        over_budget = False
+        if max_spend is not None:
+            # Keep the cases that still fit under the limit; the rest are never submitted
+            fitting = []
+            spend = state.get("estimated_cost", 0.0)
+            for case in chunk:
+                spend += estimate["per_question"][custom_id_for(case)]
+                if spend > max_spend:
+                    over_budget = True
+                    break
+                fitting.append(case)
+            chunk = fitting
+        if chunk:
+            batch_id = ops["submit"](client, chunk, effective_system_prompt, model)
+            state["jobs"].append({
+                "batch_id": batch_id,
+                "custom_ids": [custom_id_for(case) for case in chunk],
+                "status": "submitted"
+            })
+            state["estimated_cost"] = state.get("estimated_cost", 0.0) + \
+                sum(estimate["per_question"][custom_id_for(case)] for case in chunk)
+            save_state(state_path, state)
+            print(f"📤 Submitted batch {batch_id} with {len(chunk)} requests "
+                  f"(estimated {format_cost(state['estimated_cost'])} so far)")
+        if over_budget:
+            state["stopped_by_budget"] = True
+            save_state(state_path, state)
+            print(f"💸 Spend limit {format_cost(max_spend)} reached; remaining cases were not submitted")
+            break
+
+    # Poll every unfinished job, then fetch and score its results
+    while True:
+        open_jobs = [job for job in state["jobs"] if job["status"] != "scored"]
+        if not open_jobs:
+            break
+
+        for job in open_jobs:
+            if not ops["done"](client, job["batch_id"]):
+                continue
+
+            results = ops["fetch"](client, job["batch_id"], model)
+            job_results = {}
+            to_score = []
+            for custom_id in job["custom_ids"]:
+                case = dataset.get(case_id_from(custom_id))
+                result = results.get(custom_id, {"success": False, "error": "No result returned"})
+                if case is not None and result["success"]:
+                    to_score.append((custom_id, case, result))
+                job_results[custom_id] = result
+
+            # Score the whole job at once so semantic assertions run vectorized
+            evals = evaluate_responses_rule_based(
+                [result["response"] for _, _, result in to_score],
+                [case for _, case, _ in to_score]
+            )
+            judge_items = []
+            for (custom_id, case, result), eval_result in zip(to_score, evals):
+                result["eval"] = eval_result
+                if use_judge and case.get("ground_truth"):
+                    judge_items.append({
+                        "id": custom_id,
+                        "question": case["question"],
+                        "response": result["response"],
+                        "ground_truth": case["ground_truth"]
+                    })
+
+            if judge_items:
+                verdicts, judge_usage = judge_responses(judge_items, provider, api_key, base_url=base_url,
+                                                        return_usage=True)
+                # Judge calls are interactive requests: billed at the full price
+                ledger.record([record for call in judge_usage for record in usage_records(call, provider)],
+                              prompt_hash=state["prompt_hash"], run_id=run_id)
+                for item in judge_items:
+                    apply_verdict(job_results[item["id"]]["eval"], verdicts.get(item["id"]))
+
+            # Keep only references in the results file; bodies go to the deduplicated archive
+            answered = [result for result in job_results.values() if "response" in result]
+            refs = archive.put_many([result["response"] for result in answered])
+            for result, ref in zip(answered, refs):
+                result["response_ref"] = ref
+                del result["response"]
+
+            ledger.record(
+                [record for cid, result in job_results.items()
+                 for record in usage_records(result, provider, case_id_from(cid), batch=True)],
+                prompt_hash=state["prompt_hash"],
+                run_id=run_id
+            )
+            # Results first: a job is only marked scored once they are on disk
+            append_results(state_path, job_results)
+            job["status"] = "scored"
+            save_state(state_path, state)
+            print(f"✓ Scored batch {job['batch_id']}")
+
+        if any(job["status"] != "scored" for job in state["jobs"]):
+            print(f"⏳ Waiting for {len(open_jobs)} batch job(s)...")
+            time.sleep(poll_interval)
+
+    results = load_results(state_path)
+    scored = [r for r in results.values() if "eval" in r]
+    state["summary"] = {
+        "total": len(results),
+        "errors": sum(1 for r in results.values() if not r["success"]),
+        "passed": sum(1 for r in scored if r["eval"]["passed"]),
+        "cost": sum(record["cost"] or 0 for r in results.values()
+                    for record in usage_records(r, provider, batch=True)),
+        "estimated_cost": state.get("estimated_cost", 0.0)
+    }
+    save_state(state_path, state)
+    return state
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the eval suite through a provider batch API")
+    parser.add_argument("provider", choices=sorted(PROVIDERS))
+    parser.add_argument("--system-prompt-file", help="File containing the system prompt under test")
+    parser.add_argument("--state", default="data/batch_runs/latest.json",
+                        help="State file used to resume an interrupted run")
+    parser.add_argument("--cases", nargs="+", help="JSONL eval case files or globs (defaults to data/eval_cases.jsonl)")
+    parser.add_argument("--tag", action="append", dest="tags", help="Only run cases with this tag (repeatable)")
+    parser.add_argument("--shard", default="0/1", help="Shard to run as INDEX/COUNT, e.g. 2/8")
+    parser.add_argument("--model", help="Model to use (defaults to the provider's cheapest)")
+    parser.add_argument("--user-memory", action="store_true", help="Append Sarah's persona to the system prompt")
+    parser.add_argument("--poll-interval", type=float, default=60.0)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--judge", action="store_true", help="Also grade responses with the batched LLM judge")
+    parser.add_argument("--base-url", help="API base URL, e.g. a local stand-in batch endpoint")
+    parser.add_argument("--max-spend", type=float, help="Stop submitting once the estimated cost would exceed this (USD)")
+    parser.add_argument("--estimate", action="store_true", help="Print a local cost estimate and exit without submitting")
+    args = parser.parse_args()
+
+    system_prompt = ""
+    if args.system_prompt_file:
+        with open(args.system_prompt_file, "r") as f:
+            system_prompt = f.read()
+
+    shard_index, num_shards = (int(part) for part in args.shard.split("/"))
+    dataset = EvalDataset(args.cases) if args.cases else EVAL_DATASET
+
+    if args.estimate:
+        estimate = estimate_batch(
+            system_prompt,
+            dataset.iter_cases(tags=args.tags, shard_index=shard_index, num_shards=num_shards),
+            args.model or DEFAULT_MODELS[args.provider],
+            args.user_memory,
+            CostLedger()
+        )
+        print(f"💲 Estimated {format_cost(estimate['cost'])} for {estimate['questions']} cases "
+              f"(~{estimate['input']:,} input / {estimate['output']:,} output tokens, batch pricing)")
+        raise SystemExit(0)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    env_var = "ANTHROPIC_API_KEY" if args.provider == "anthropic" else "OPENAI_API_KEY"
+    api_key = os.environ.get(env_var)
+    if not api_key:
+        print(f"❌ {env_var} is not set")
+        raise SystemExit(1)
+
+    state = run_batch(
+        provider=args.provider,
+        api_key=api_key,
+        system_prompt=system_prompt,
+        state_path=args.state,
+        dataset=dataset,
+        tags=args.tags,
+        shard_index=shard_index,
+        num_shards=num_shards,
+        model=args.model,
+        use_user_memory=args.user_memory,
+        poll_interval=args.poll_interval,
+        chunk_size=args.chunk_size,
+        base_url=args.base_url,
+        use_judge=args.judge,
+        max_spend=args.max_spend
+    )
+
+    summary = state["summary"]
+    print(f"\n✅ Batch run complete: {summary['passed']}/{summary['total']} passed "
+          f"({summary['errors']} errors), {format_cost(summary['cost'])} "
+          f"(estimated {format_cost(summary['estimated_cost'])})")
@@ -1,9 +1,32 @@
 """
 Claude API integration for evaluation runs
 """
+import time
 import anthropic
-import sqlite3
 from typing import Dict, List
+from retrieval import format_review_context
+from db_pool import run_tool_query
+from assertions import CompiledAssertions
+
+def usage_tokens(*usages) -> Dict:
+    """
+    Token counts summed over a turn's API calls
+
+    'input' includes prompt-cache reads and writes, which are also counted
+    in 'cached' and 'cache_write' (billed at their own rates, see cost_ledger.py).
+    """
+    cached = sum(getattr(u, "cache_read_input_tokens", None) or 0 for u in usages)
+    cache_write = sum(getattr(u, "cache_creation_input_tokens", None) or 0 for u in usages)
+    return {
+        "input": sum(u.input_tokens for u in usages) + cached + cache_write,
+        "output": sum(u.output_tokens for u in usages),
+        "cached": cached,
+        "cache_write": cache_write
+    }
+
+def partial_usage(model: str, usages: List) -> Dict:
+    """'model' and 'tokens' of the requests a failed call completed (they are billed too)"""
+    return {"model": model, "tokens": usage_tokens(*usages)} if usages else {}
 
 def call_claude(
     api_key: str,
@@ -12,7 +35,8 @@ def call_claude(
     review_context: Dict = None,
     model: str = "claude-haiku-4-5-20251001",
     use_tool: bool = False,
-    conversation_history: List[Dict] = None
+    conversation_history: List[Dict] = None,
+    timeout: float = None
 ) -> Dict:
     """
     Call Claude API with given prompts
@@ -21,19 +45,31 @@ def call_claude(
         api_key: Anthropic API key
         system_prompt: System prompt configuration
         user_message: User's question
-        review_context: Optional review data to include as context
+        review_context: Optional retrieved reviews to include as context (see retrieval.py)
         model: Claude model to use
         use_tool: Whether to enable database query tool
         conversation_history: Optional list of previous messages for context
+        timeout: Optional deadline in seconds for the whole call, including the
+            tool round-trip; the SDK does not retry within it
         
     Returns:
-        Dict with response text and metadata
+        Dict with response text and metadata ('timed_out' is set if the deadline
+        passed); a failed call still reports the tokens of any request that
+        completed before it failed
     """
-    client = anthropic.Anthropic(api_key=api_key)
+    deadline = time.monotonic() + timeout if timeout else None
+    if deadline:
+        client = anthropic.Anthropic(api_key=api_key, max_retries=0)
+    else:
+        client = anthropic.Anthropic(api_key=api_key)
     
-    # Build the full user message (no additional review context)
+    # Build the full user message, appending retrieved reviews if provided
     full_message = user_message
+    if review_context:
+        full_message = f"{user_message}\n\n{format_review_context(review_context)}"
     
+    # Usage of each completed request, so a call that fails halfway still reports it
+    usages = []
     try:
         # Define tools if enabled
         tools = []
@@ -58,10 +94,15 @@ def call_claude(
                     - division_name: Product division
                     - department_name: Department (Tops, Dresses, Bottoms, etc.)
                     - class_name: Product class
+                    - canonical_id: NULL for original reviews; on near-duplicate copies, the id of the original
                     - created_at: Timestamp
     
+                    Precomputed per-product digests (rating summary, sizing verdict, quality complaints, quotes) are in the
+                    product_digests table; read the digest before pulling raw reviews:
+                    - SELECT summary FROM product_digests WHERE clothing_id = 1094
+
                     Example queries:
-                    - Get reviews for a product: SELECT * FROM feedback_submissions WHERE clothing_id = 1094
+                    - Get reviews for a product: SELECT * FROM feedback_submissions WHERE clothing_id = 1094 AND canonical_id IS NULL
                     - Filter by age: SELECT * FROM feedback_submissions WHERE clothing_id = 1094 AND age BETWEEN 30 AND 40
                     - Get average rating: SELECT AVG(rating) FROM feedback_submissions WHERE clothing_id = 1094""",
                         "input_schema": {
@@ -99,7 +140,10 @@ def call_claude(
 
         print("CLAUDE API: kwargs:", kwargs)
 
+        if deadline:
+            kwargs["timeout"] = deadline - time.monotonic()
         message = client.messages.create(**kwargs)
+        usages.append(message.usage)
         
         # Debug: print the initial Claude response for inspection
         # print("CLAUDE API: Claude initial response:", message)
@@ -107,20 +151,8 @@ def call_claude(
         # If tool usage is detected, handle it and send results back to Claude
         if message.stop_reason == "tool_use":
             tool_use = next(block for block in message.content if block.type == "tool_use")
-            # Execute the SQL query
-            conn = sqlite3.connect('data/evals_demo.db')
-            cursor = conn.cursor()
-            results = None
-            try:
-                cursor.execute(tool_use.input["sql_query"])
-                results = cursor.fetchall()
-                # print("CLAUDE API: Tool execution results:", results)
-                tool_result_text = "\n".join(str(row) for row in results)
-            except Exception as e:
-                tool_result_text = f"Error executing query: {e}"
-                results = []
-            finally:
-                conn.close()
+            # Execute the SQL query on a pooled read-only connection
+            tool_result_text = run_tool_query(tool_use.input["sql_query"], deadline=deadline)
             
             # print("CLAUDE API: Tool results:", results)
             
@@ -140,14 +172,21 @@ def call_claude(
                 ]
             })
             
-            # Get Claude's final response with the tool results
+            # Get Claude's final response with the tool results (in what is left of the deadline)
+            remaining = {}
+            if deadline:
+                if time.monotonic() >= deadline:
+                    raise anthropic.APITimeoutError(request=None)
+                remaining["timeout"] = deadline - time.monotonic()
             final_message = client.messages.create(
                 model=model,
                 max_tokens=2000,
                 system=system_prompt,
                 messages=messages,
-                tools=tools
+                tools=tools,
+                **remaining
             )
+            usages.append(final_message.usage)
             
             # print("CLAUDE API: Claude final response:", final_message)
             
@@ -155,26 +194,28 @@ def call_claude(
                 "success": True,
                 "response": final_message.content[0].text,
                 "model": model,
-                "tokens": {
-                    "input": message.usage.input_tokens + final_message.usage.input_tokens,
-                    "output": message.usage.output_tokens + final_message.usage.output_tokens
-                }
+                "tokens": usage_tokens(message.usage, final_message.usage)
             }
 
         return {
             "success": True,
             "response": message.content[0].text,
             "model": model,
-            "tokens": {
-                "input": message.usage.input_tokens,
-                "output": message.usage.output_tokens
-            }
+            "tokens": usage_tokens(message.usage)
         }
     
+    except anthropic.APITimeoutError:
+        return {
+            "success": False,
+            "error": f"Timed out after {timeout}s" if timeout else "Request timed out",
+            "timed_out": True,
+            **partial_usage(model, usages)
+        }
     except Exception as e:
         return {
             "success": False,
-            "error": str(e)
+            "error": str(e),
+            **partial_usage(model, usages)
         }
 
 def evaluate_response(
@@ -193,16 +234,12 @@ def evaluate_response(
     Returns:
         Dict with pass/fail and reasoning
     """
-    response_lower = response.lower()
-    
-    # Check if key elements are present
-    missing_elements = []
-    for element in must_include:
-        # Simple keyword matching (can be improved with LLM-as-judge)
-        element_keywords = element.lower().split()
-        found = any(keyword in response_lower for keyword in element_keywords)
-        if not found:
-            missing_elements.append(element)
+    # Each element is a phrase that must appear as written (same assertion language as
+    # the evals, but literal, so braces are not placeholders; see assertions.py, and
+    # judge.py for LLM-as-judge grading)
+    compiled = CompiledAssertions([{"check": element, "match": {"literal": element}} for element in must_include])
+    results = compiled.evaluate(response)
+    missing_elements = [element for element in must_include if not results[element]]
     
     passes = len(missing_elements) == 0
     
@@ -0,0 +1,374 @@
+"""
+Token and cost ledger, pre-flight estimates and spend limits
+
+Every provider call returns a 'tokens' dict (input, output, cached
+input and, for Anthropic, cache-write tokens). The ledger prices each call from MODEL_PRICES and stores
+one row per call in SQLite, labelled with the chat session, the hash of
+the system prompt and the eval run (a "Run all" sweep or a batch state
+file) it belongs to, so spend can be rolled up along any of them.
+
+Before a sweep, estimate_sweep counts tokens locally (history.estimate_tokens,
+no API call) and prices them. A SpendBudget then lets a sweep reserve each
+question's estimate before sending it, so the sweep stops before it would
+go over the limit rather than after.
+
+Usage:
+    python cost_ledger.py [session|prompt|run|model]
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List
+
+from history import estimate_tokens
+from retrieval import format_review_context
+from tool_format import DEFAULT_TOOL_TOKEN_BUDGET
+
+DEFAULT_LEDGER_PATH = Path(__file__).parent / "data" / "cost_ledger.db"
+
+# USD per million tokens: (input, output, cached input)
+MODEL_PRICES = {
+    "claude-haiku-4-5-20251001": (1.00, 5.00, 0.10),
+    "claude-sonnet-4-5-20250929": (3.00, 15.00, 0.30),
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-4o": (2.50, 10.00, 1.25)
+}
+
+# Anthropic bills prompt-cache writes at this multiple of the input price
+CACHE_WRITE_MULTIPLIER = 1.25
+
+# Both batch APIs bill half the interactive price
+BATCH_DISCOUNT = 0.5
+
+# Output tokens assumed per call until the ledger has seen the model answer
+DEFAULT_OUTPUT_TOKENS = 400
+
+# Approximate size of the query_reviews tool definition sent with each tool-enabled call
+TOOL_DEFINITION_TOKENS = 450
+
+# Calls per model averaged when estimating output tokens from the ledger
+OUTPUT_SAMPLE_SIZE = 200
+
+# Columns spend can be rolled up by
+ROLLUP_COLUMNS = {
+    "session": "session_id",
+    "prompt": "prompt_hash",
+    "run": "run_id",
+    "model": "model"
+}
+
+_ledger_lock = threading.Lock()
+
+
+def model_prices(model: str) -> tuple:
+    """Price row of a model, matching dated snapshots (gpt-4o-mini-2024-07-18) by prefix"""
+    if model in MODEL_PRICES:
+        return MODEL_PRICES[model]
+    prefixes = [name for name in MODEL_PRICES if model and model.startswith(name)]
+    return MODEL_PRICES[max(prefixes, key=len)] if prefixes else None
+
+
+def call_cost(model: str, tokens: Dict, batch: bool = False) -> float:
+    """
+    Price one call
+
+    Args:
+        model: Model that answered
+        tokens: {'input', 'output', 'cached', 'cache_write'}; 'input' includes
+            the cached and cache-write tokens
+        batch: Billed through a batch API (BATCH_DISCOUNT applies)
+
+    Returns:
+        Cost in USD, or None if the model is not in MODEL_PRICES
+    """
+    prices = model_prices(model)
+    if prices is None or not tokens:
+        return None
+    input_price, output_price, cached_price = prices
+    cached = tokens.get("cached") or 0
+    cache_write = tokens.get("cache_write") or 0
+    cost = ((tokens.get("input", 0) - cached - cache_write) * input_price
+            + cached * cached_price
+            + cache_write * input_price * CACHE_WRITE_MULTIPLIER
+            + tokens.get("output", 0) * output_price) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+def format_cost(cost: float) -> str:
+    """Dollar amount with enough digits for single calls"""
+    if cost is None:
+        return "n/a"
+    return f"${cost:,.2f}" if cost >= 1 else f"${cost:.4f}"
+
+
+def usage_records(result: Dict, provider: str = None, question_id=None, batch: bool = False) -> List[Dict]:
+    """
+    One priced record per model call behind a provider result
+
+    A routed result (providers.call_routed) also carries the tiers that
+    failed before it; each of those was a billed call too. A hedged request
+    that lost the race is not part of the result; it reaches the caller's
+    on_late_usage callback when it finishes (see providers.call_provider).
+
+    Returns:
+        Dicts with provider, model, question_id, input, output, cached,
+        cache_write and cost
+    """
+    calls = [(e["model"], e.get("tokens")) for e in result.get("escalations", [])]
+    calls.append((result.get("model"), result.get("tokens")))
+    records = []
+    for model, tokens in calls:
+        if not tokens:
+            continue
+        records.append({
+            "provider": provider or result.get("provider"),
+            "model": model,
+            "question_id": None if question_id is None else str(question_id),
+            "input": tokens.get("input", 0),
+            "output": tokens.get("output", 0),
+            "cached": tokens.get("cached") or 0,
+            "cache_write": tokens.get("cache_write") or 0,
+            "cost": call_cost(model, tokens, batch)
+        })
+    return records
+
+
+def results_cost(results: Dict[str, Dict]) -> float:
+    """Total cost of a turn's results ({brand: result}), escalations included"""
+    return sum(r["cost"] or 0 for result in results.values() for r in usage_records(result))
+
+
+def estimate_call(kwargs: Dict, output_tokens: int = DEFAULT_OUTPUT_TOKENS) -> Dict:
+    """
+    Local token estimate for one call_claude / call_openai call
+
+    With the database tool on, assumes one tool round-trip: the conversation
+    is sent twice, plus the tool definition and a full-budget tool result.
+
+    Args:
+        kwargs: The call's keyword arguments (system_prompt, user_message,
+            review_context, conversation_history, use_tool)
+        output_tokens: Expected answer length
+
+    Returns:
+        {'input', 'output', 'cached'} token counts
+    """
+    message = kwargs.get("user_message", "")
+    if kwargs.get("review_context"):
+        message += "\n\n" + format_review_context(kwargs["review_context"])
+    history = kwargs.get("conversation_history") or []
+    # A few tokens of per-message overhead for role markers
+    prompt = estimate_tokens(kwargs.get("system_prompt", "")) + estimate_tokens(message) + 4 + \
+        sum(estimate_tokens(m["content"]) + 4 for m in history)
+    if kwargs.get("use_tool"):
+        prompt = 2 * (prompt + TOOL_DEFINITION_TOKENS) + DEFAULT_TOOL_TOKEN_BUDGET
+    return {"input": prompt, "output": output_tokens, "cached": 0}
+
+
+def estimate_sweep(calls: Dict, output_tokens: Dict[str, int] = None, batch: bool = False) -> Dict:
+    """
+    Pre-flight estimate of a sweep, counted and priced locally
+
+    Args:
+        calls: {question ID: [(model, call kwargs), ...]}
+        output_tokens: Expected output tokens per model (e.g.
+            CostLedger.average_output_tokens()); DEFAULT_OUTPUT_TOKENS otherwise
+        batch: Priced at the batch discount
+
+    Returns:
+        Dict with 'questions', 'calls', 'input' and 'output' tokens, 'cost',
+        'per_question' ({question ID: cost}) and 'unpriced' (calls to models
+        missing from MODEL_PRICES, left out of the cost)
+    """
+    output_tokens = output_tokens or {}
+    estimate = {"questions": 0, "calls": 0, "input": 0, "output": 0, "cost": 0.0,
+                "per_question": {}, "unpriced": 0}
+    for question_id, question_calls in calls.items():
+        question_cost = 0.0
+        for model, kwargs in question_calls:
+            tokens = estimate_call(kwargs, output_tokens.get(model, DEFAULT_OUTPUT_TOKENS))
+            cost = call_cost(model, tokens, batch)
+            estimate["calls"] += 1
+            estimate["input"] += tokens["input"]
+            estimate["output"] += tokens["output"]
+            if cost is None:
+                estimate["unpriced"] += 1
+            else:
+                question_cost += cost
+        estimate["questions"] += 1
+        estimate["cost"] += question_cost
+        estimate["per_question"][question_id] = question_cost
+    return estimate
+
+
+class SpendBudget:
+    """
+    Spend limit for a sweep, safe to share between worker threads
+
+    A question reserves its estimated cost before it is sent and is settled
+    with its actual cost when it returns, so questions in flight count
+    against the limit too.
+
+    Args:
+        limit: Most the sweep may spend (USD)
+        estimates: {question ID: estimated cost}, e.g. estimate_sweep()['per_question']
+        cost_fn: Actual cost of a question's result (defaults to results_cost)
+    """
+
+    def __init__(self, limit: float, estimates: Dict, cost_fn: Callable[[Dict], float] = results_cost):
+        self.limit = limit
+        self.estimates = estimates
+        self.cost_fn = cost_fn
+        self.spent = 0.0
+        self._reserved = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, question_id) -> bool:
+        """Hold the question's estimate; False if sending it could go over the limit"""
+        estimate = self.estimates.get(question_id, 0.0)
+        with self._lock:
+            if self.spent + sum(self._reserved.values()) + estimate > self.limit:
+                return False
+            self._reserved[question_id] = estimate
+            return True
+
+    def settle(self, question_id, result: Dict) -> float:
+        """Replace the question's reservation with what its result actually cost"""
+        cost = self.cost_fn(result)
+        with self._lock:
+            self._reserved.pop(question_id, None)
+            self.spent += cost
+        return cost
+
+    def charge(self, cost: float):
+        """Add spend reported after its question was settled (a hedged request that lost)"""
+        with self._lock:
+            self.spent += cost or 0.0
+
+
+class CostLedger:
+    """SQLite log of priced calls by session, prompt hash and eval run"""
+
+    def __init__(self, db_path=DEFAULT_LEDGER_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS calls (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT,
+                    prompt_hash TEXT,
+                    run_id TEXT,
+                    question_id TEXT,
+                    provider TEXT,
+                    model TEXT,
+                    input_tokens INTEGER NOT NULL,
+                    output_tokens INTEGER NOT NULL,
+                    cached_tokens INTEGER NOT NULL DEFAULT 0,
+                    cache_write_tokens INTEGER NOT NULL DEFAULT 0,
+                    cost REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(calls)")}
+            if "cache_write_tokens" not in columns:
+                conn.execute("ALTER TABLE calls ADD COLUMN cache_write_tokens INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_calls_session ON calls(session_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_calls_prompt ON calls(prompt_hash)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_calls_run ON calls(run_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_calls_model ON calls(model, id)")
+
+    @contextmanager
+    def _connect(self):
+        """Connection that commits on success and is always closed"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record(self, records: Iterable[Dict], session_id: str = None, prompt_hash: str = None,
+               run_id: str = None) -> float:
+        """
+        Store priced call records (see usage_records)
+
+        Returns:
+            Their total cost
+        """
+        records = list(records)
+        if not records:
+            return 0.0
+        with _ledger_lock, self._connect() as conn:
+            conn.executemany("""
+                INSERT INTO calls (session_id, prompt_hash, run_id, question_id, provider, model,
+                                   input_tokens, output_tokens, cached_tokens, cache_write_tokens, cost)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(session_id, prompt_hash, run_id, r["question_id"], r["provider"], r["model"],
+                   r["input"], r["output"], r["cached"], r.get("cache_write", 0), r["cost"])
+                  for r in records])
+        return sum(r["cost"] or 0 for r in records)
+
+    def totals(self, session_id: str = None, prompt_hash: str = None, run_id: str = None) -> Dict:
+        """Calls, tokens and cost of the calls matching every given label"""
+        filters = {"session_id": session_id, "prompt_hash": prompt_hash, "run_id": run_id}
+        where = " AND ".join(f"{column} = ?" for column, value in filters.items() if value is not None)
+        with self._connect() as conn:
+            calls, input_tokens, output_tokens, cached, cost = conn.execute(f"""
+                SELECT COUNT(*), COALESCE(SUM(input_tokens), 0), COALESCE(SUM(output_tokens), 0),
+                       COALESCE(SUM(cached_tokens), 0), COALESCE(SUM(cost), 0)
+                FROM calls {'WHERE ' + where if where else ''}
+            """, [value for value in filters.values() if value is not None]).fetchone()
+        return {"calls": calls, "input": input_tokens, "output": output_tokens, "cached": cached, "cost": cost}
+
+    def rollup(self, by: str = "session", limit: int = 20) -> List[Dict]:
+        """
+        Spend grouped by session, prompt, run or model, most expensive first
+
+        Args:
+            by: One of ROLLUP_COLUMNS
+            limit: Groups returned
+        """
+        if by not in ROLLUP_COLUMNS:
+            raise ValueError(f"Unknown rollup '{by}' (expected one of {sorted(ROLLUP_COLUMNS)})")
+        column = ROLLUP_COLUMNS[by]
+        with self._connect() as conn:
+            rows = conn.execute(f"""
+                SELECT {column}, COUNT(*), SUM(input_tokens), SUM(output_tokens), SUM(cached_tokens),
+                       COALESCE(SUM(cost), 0), MIN(created_at), MAX(created_at)
+                FROM calls WHERE {column} IS NOT NULL
+                GROUP BY {column} ORDER BY 6 DESC LIMIT ?
+            """, (limit,)).fetchall()
+        keys = [by, "calls", "input", "output", "cached", "cost", "first", "last"]
+        return [dict(zip(keys, row)) for row in rows]
+
+    def average_output_tokens(self) -> Dict[str, int]:
+        """Mean output tokens of each model's last OUTPUT_SAMPLE_SIZE calls (for estimates)"""
+        with self._connect() as conn:
+            rows = conn.execute("""
+                SELECT model, AVG(output_tokens) FROM (
+                    SELECT model, output_tokens,
+                           ROW_NUMBER() OVER (PARTITION BY model ORDER BY id DESC) AS recency
+                    FROM calls
+                )
+                WHERE recency <= ? GROUP BY model
+            """, (OUTPUT_SAMPLE_SIZE,)).fetchall()
+        return {model: round(average) for model, average in rows}
+
+
+if __name__ == "__main__":
+    import sys
+
+    by = sys.argv[1] if len(sys.argv) > 1 else "session"
+    if by not in ROLLUP_COLUMNS:
+        print(f"Usage: python cost_ledger.py [{'|'.join(ROLLUP_COLUMNS)}]")
+        sys.exit(1)
+
+    ledger = CostLedger()
+    total = ledger.totals()
+    print(f"💰 {total['calls']} calls, {format_cost(total['cost'])} "
+          f"({total['input']:,} in / {total['output']:,} out / {total['cached']:,} cached tokens)")
+    for row in ledger.rollup(by):
+        print(f"  {row[by]:<34} {format_cost(row['cost']):>10}  {row['calls']:>5} calls  "
+              f"{row['input']:>10,} in  {row['output']:>8,} out  {row['cached']:>8,} cached")
@@ -0,0 +1,185 @@
+"""
+Shared read-only connection pool for the reviews database
+
+Tool calls, review retrieval and the app all read evals_demo.db. Instead of
+opening (and parsing the schema of) a fresh connection for every query,
+they borrow one from a small pool of read-only connections:
+  - opened with a file: URI in mode=ro (optionally immutable=1, which also
+    skips file locking when the database is never written while serving),
+  - with query_only set, so model-written SQL can never modify data,
+  - with mmap enabled, so pages are read straight from the OS page cache,
+  - with a per-connection prepared-statement cache for repeated queries.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List
+
+from tool_format import DEFAULT_TOOL_TOKEN_BUDGET, MAX_TOOL_ROWS, format_tool_result
+
+DEFAULT_DB_PATH = Path(__file__).parent / "data" / "evals_demo.db"
+
+# Connections per pool; a query waits for a free one beyond this
+DEFAULT_POOL_SIZE = 8
+
+# Bytes of the database file memory-mapped per connection
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+
+# Prepared statements cached per connection
+CACHED_STATEMENTS = 256
+
+# SQLite virtual-machine steps between deadline checks in tool queries
+DEADLINE_CHECK_STEPS = 10000
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ReadOnlyPool:
+    """
+    Thread-safe pool of read-only SQLite connections to one database
+
+    Args:
+        db_path: Path to the SQLite database
+        size: Maximum number of open connections
+        immutable: Open with immutable=1 (only safe while nothing writes the file)
+        mmap_size: Bytes to memory-map per connection
+    """
+
+    def __init__(
+        self,
+        db_path=DEFAULT_DB_PATH,
+        size: int = DEFAULT_POOL_SIZE,
+        immutable: bool = False,
+        mmap_size: int = DEFAULT_MMAP_SIZE
+    ):
+        self.db_path = Path(db_path).resolve()
+        self.size = size
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _uri(self) -> str:
+        uri = f"{self.db_path.as_uri()}?mode=ro"
+        if self.immutable:
+            uri += "&immutable=1"
+        return uri
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self._uri(),
+            uri=True,
+            check_same_thread=False,  # a connection is used by one thread at a time, but not always the same one
+            cached_statements=CACHED_STATEMENTS
+        )
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        # Reuse an idle connection (most recently used first, its cache is warm)
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+        if not can_open:
+            return self._idle.get()
+        try:
+            return self._open()
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with block"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def execute(self, sql: str, params=()) -> List[tuple]:
+        """Run one query and return all rows"""
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+
+def get_pool(db_path=DEFAULT_DB_PATH) -> ReadOnlyPool:
+    """
+    Process-wide pool for a database, created on first use
+
+    Set EVALS_DB_IMMUTABLE=1 when the database is never written while the
+    app is serving to open it with immutable=1.
+    """
+    key = str(Path(db_path).resolve())
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ReadOnlyPool(
+                key,
+                immutable=os.getenv("EVALS_DB_IMMUTABLE", "").lower() in ("1", "true", "yes")
+            )
+            _pools[key] = pool
+    return pool
+
+
+def run_tool_query(
+    sql_query: str,
+    db_path=DEFAULT_DB_PATH,
+    token_budget: int = DEFAULT_TOOL_TOKEN_BUDGET,
+    deadline: float = None
+) -> str:
+    """
+    Run a model-written SQL query for the database tool
+
+    Args:
+        sql_query: Query to run
+        db_path: Reviews database
+        token_budget: Approximate tokens the result may use
+        deadline: Optional time.monotonic() value; the query is interrupted
+            if it is still running then
+
+    Returns:
+        Compact table (see tool_format.py), or an error message the model can read
+    """
+    try:
+        with get_pool(db_path).connection() as conn:
+            if deadline is not None:
+                # A non-zero return makes SQLite abort the query ("interrupted")
+                conn.set_progress_handler(lambda: time.monotonic() > deadline, DEADLINE_CHECK_STEPS)
+            try:
+                cursor = conn.execute(sql_query)
+                rows = cursor.fetchmany(MAX_TOOL_ROWS + 1)
+                columns = [d[0] for d in cursor.description] if cursor.description else []
+            finally:
+                if deadline is not None:
+                    conn.set_progress_handler(None, 0)
+        truncated = len(rows) > MAX_TOOL_ROWS
+        return format_tool_result(columns, rows[:MAX_TOOL_ROWS], token_budget, truncated=truncated)
+    except Exception as e:
+        return f"Error executing query: {e}"
@@ -0,0 +1,174 @@
+"""
+File-backed eval dataset with lazy streaming
+
+Eval cases live in JSONL files, one case per line:
+
+    {"id": 1, "question": "...", "context": {"clothing_id": 1094},
+     "ground_truth": "...", "assertions": [...], "prompt_improvement": "...",
+     "tags": ["purchase_decision"]}
+
+Cases are streamed line by line, so a 10k-case suite never has to be held in
+memory. A small ID index (case ID -> file and byte offset) is built on first
+use and lets single cases be fetched by ID with one seek.
+"""
+import json
+import zlib
+from collections import OrderedDict
+from glob import glob
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Union
+
+# Number of recently fetched cases kept in memory by EvalDataset.get
+CASE_CACHE_SIZE = 256
+
+
+def shard_for(case_id, num_shards: int) -> int:
+    """Stable shard number for a case, independent of file order"""
+    return zlib.crc32(str(case_id).encode("utf-8")) % num_shards
+
+
+class EvalDataset:
+    """
+    Lazily streamed eval cases from one or more JSONL files
+
+    Args:
+        paths: JSONL file path, glob pattern, or a list of either
+    """
+
+    def __init__(self, paths: Union[str, Path, List[Union[str, Path]]]):
+        if isinstance(paths, (str, Path)):
+            paths = [paths]
+        self.paths = []
+        for pattern in paths:
+            matches = sorted(glob(str(pattern)))
+            self.paths.extend(Path(p) for p in (matches or [pattern]))
+
+        self._index = None
+        self._index_mtimes = None
+        self._cache = OrderedDict()
+
+    def _mtimes(self) -> List[float]:
+        return [p.stat().st_mtime for p in self.paths]
+
+    def _ensure_index(self) -> Dict[str, tuple]:
+        """Build (or rebuild, if a file changed) the case ID -> (file, offset) index"""
+        mtimes = self._mtimes()
+        if self._index is not None and mtimes == self._index_mtimes:
+            return self._index
+
+        index = {}
+        for file_no, path in enumerate(self.paths):
+            with open(path, "rb") as f:
+                offset = 0
+                for line_no, line in enumerate(f, start=1):
+                    if line.strip():
+                        case_id = str(json.loads(line)["id"])
+                        if case_id in index:
+                            raise ValueError(f"Duplicate eval case id {case_id} in {path}:{line_no}")
+                        index[case_id] = (file_no, offset)
+                    offset += len(line)
+
+        self._index = index
+        self._index_mtimes = mtimes
+        self._cache.clear()
+        return index
+
+    def __len__(self) -> int:
+        return len(self._ensure_index())
+
+    def __contains__(self, case_id) -> bool:
+        return str(case_id) in self._ensure_index()
+
+    def __iter__(self) -> Iterator[Dict]:
+        return self.iter_cases()
+
+    def ids(self) -> List[str]:
+        """All case IDs, in file order"""
+        return list(self._ensure_index())
+
+    def get(self, case_id) -> Dict:
+        """Fetch one case by ID, or None if it does not exist"""
+        key = str(case_id)
+        # Rebuilding the index (a file changed) also empties the cache
+        index = self._ensure_index()
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        location = index.get(key)
+        if location is None:
+            return None
+
+        file_no, offset = location
+        with open(self.paths[file_no], "rb") as f:
+            f.seek(offset)
+            case = json.loads(f.readline())
+
+        self._cache[key] = case
+        if len(self._cache) > CASE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return case
+
+    def iter_cases(
+        self,
+        tags: Iterable[str] = None,
+        shard_index: int = 0,
+        num_shards: int = 1,
+        start: int = 0,
+        limit: int = None
+    ) -> Iterator[Dict]:
+        """
+        Stream cases in file order without loading the whole suite
+
+        Args:
+            tags: Only yield cases carrying at least one of these tags
+            shard_index: Which shard this worker handles (0-based)
+            num_shards: Total number of workers splitting the suite
+            start: Skip this many matching cases (for pagination)
+            limit: Stop after yielding this many cases
+
+        Yields:
+            Eval case dicts
+        """
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}")
+        tags = set(tags) if tags else None
+
+        matched = 0
+        yielded = 0
+        for path in self.paths:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    case = json.loads(line)
+                    if tags and not tags.intersection(case.get("tags", [])):
+                        continue
+                    if num_shards > 1 and shard_for(case["id"], num_shards) != shard_index:
+                        continue
+                    matched += 1
+                    if matched <= start:
+                        continue
+                    yield case
+                    yielded += 1
+                    if limit is not None and yielded >= limit:
+                        return
+
+    def tags(self) -> List[str]:
+        """All tags used in the suite (streams the files once)"""
+        found = set()
+        for case in self.iter_cases():
+            found.update(case.get("tags", []))
+        return sorted(found)
+
+
+def write_cases(path: Union[str, Path], cases: Iterable[Dict]) -> int:
+    """Write eval cases to a JSONL file, one per line; returns the number written"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for case in cases:
+            f.write(json.dumps(case, ensure_ascii=False) + "\n")
+            count += 1
+    return count
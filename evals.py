@@ -0,0 +1,218 @@
+"""
+Eval cases, personas and rule-based scoring shared by the app and batch runner
+"""
+from pathlib import Path
+from typing import Dict, List
+
+from assertions import InvalidAssertion, compile_case
+from eval_dataset import EvalDataset
+from similarity import DEFAULT_SEMANTIC_THRESHOLD, semantic_match_scores, split_sentences
+
+# Evaluation Questions (one JSON case per line; see eval_dataset.py)
+DEFAULT_CASES_PATH = Path(__file__).parent / "data" / "eval_cases.jsonl"
+EVAL_DATASET = EvalDataset(DEFAULT_CASES_PATH)
+
+
+def get_question(question_id) -> Dict:
+    """Look up an eval case by ID in the default dataset (None if missing)"""
+    return EVAL_DATASET.get(question_id)
+
+
+# System prompts are separate - you test different prompts against the same questions
+SYSTEM_PROMPTS = {
+    "empty": "",
+    "basic": "You are a shopping assistant. Help customers make purchase decisions.",
+    "sales_driven": "You are a shopping assistant. Your goal is to drive purchases. Always include a purchase link: https://santra.com/clothing/{id}",
+    "customer_focused": "You are a shopping assistant. Your goal is customer satisfaction. Include purchase links only for items you confidently recommend. For risky items, suggest alternatives with links."
+}
+# Sarah's persona
+SARAH_PERSONA = {
+    "name": "Sarah",
+    "age": 32,
+    "context": "Needs professional clothing for upcoming work presentations",
+    "goal": "Find clothing that fits well and looks professional",
+    "pain_point": "Usually between sizes (struggles with fit)",
+    "time_constraint": "Needs it in 2 weeks",
+    "budget": "Willing to spend up to $150",
+    "behaviors": [
+        "Reads reviews carefully, especially about sizing",
+        "Anxious about online shopping",
+        "Values honest opinions over marketing fluff",
+        "Hates returns - wants to get it right the first time"
+    ]
+}
+
+def build_system_prompt(system_prompt: str, use_user_memory: bool = False) -> str:
+    """
+    Build the effective system prompt, optionally appending Sarah's persona
+    
+    Args:
+        system_prompt: System prompt written by the user
+        use_user_memory: Whether to append Sarah's persona as user memory
+        
+    Returns:
+        System prompt to send to the provider
+    """
+    if not use_user_memory:
+        return system_prompt
+    
+    user_memory_context = f"""
+                        You are helping {SARAH_PERSONA['name']}, a {SARAH_PERSONA['age']}-year-old customer who:
+                        - {SARAH_PERSONA['context']}
+                        - {SARAH_PERSONA['pain_point']}
+                        - Budget: {SARAH_PERSONA['budget']}
+                        - Goal: {SARAH_PERSONA['goal']}
+
+                        Customer behaviors:
+                        {chr(10).join(f'- {behavior}' for behavior in SARAH_PERSONA['behaviors'])}
+
+                        Tailor your recommendations to her specific situation, risk tolerance, and constraints."""
+    return system_prompt + user_memory_context
+
+def get_assertions(question_data: Dict, scenario: str = "neutral") -> tuple:
+    """
+    Resolve the assertions for an eval case (handles both old and new structure)
+    
+    Returns:
+        (assertions list, error message or None)
+    """
+    # Handle new scenario-based structure
+    if "scenarios" in question_data:
+        if scenario not in question_data["scenarios"]:
+            return [], f"Scenario '{scenario}' not found"
+        return question_data["scenarios"][scenario]["assertions"], None
+    # Handle old structure (direct assertions)
+    if "assertions" in question_data:
+        return question_data["assertions"], None
+    return [], "No assertions found in question"
+
+
+def semantic_references(assertion: Dict, question_data: Dict) -> List[str]:
+    """Reference phrasings a semantic assertion is scored against"""
+    references = list(assertion.get("references", []))
+    if assertion.get("include_ground_truth") and question_data.get("ground_truth"):
+        references.extend(split_sentences(question_data["ground_truth"]))
+    return references
+
+
+def evaluate_response_rule_based(
+    response: str,
+    question_id: int,
+    scenario: str = "neutral",
+    question_data: Dict = None,
+    semantic_scores: Dict = None,
+    stop_on_failure: bool = False
+) -> Dict:
+    """
+    Evaluate a response against its case's rule-based assertions.
+    
+    Each assertion's "match" expression (see assertions.py) is compiled once
+    per case, with {placeholders} filled from the case's "context":
+    
+        {"check": "links_right_product", "description": "...",
+         "match": {"regex": "santra\\.com/clothing/{clothing_id}\\b"}}
+    
+    Legacy "keywords" lists pass if any keyword appears. Assertions with
+    "type": "semantic" pass when the response is similar enough to any of
+    their reference phrasings (see similarity.py), e.g.
+    
+        {"check": "acknowledges_return_aversion", "type": "semantic",
+         "description": "...", "references": ["hates returns"],
+         "include_ground_truth": false, "threshold": 0.35}
+    
+    Args:
+        response: The AI's response text
+        question_id: The ID of the question being evaluated
+        scenario: Which scenario to evaluate against (neutral, sales_driven, customer_satisfaction)
+        question_data: Optional eval case to score against (defaults to looking up question_id in EVAL_DATASET)
+        semantic_scores: Optional precomputed {check: similarity} for semantic assertions
+        stop_on_failure: Stop at the first failing check (only the verdict is
+            needed, e.g. when sampling); 'details' then lists the checks run
+        
+    Returns:
+        dict with 'passed' (bool) and 'details' (dict of assertion results);
+        'scores' holds the similarity of each semantic assertion
+    """
+    # Find the question
+    if question_data is None:
+        question_data = get_question(question_id)
+    if not question_data:
+        return {"passed": False, "details": {}, "error": "Question not found"}
+    
+    assertions, error = get_assertions(question_data, scenario)
+    if error:
+        return {"passed": False, "details": {}, "error": error}
+    
+    try:
+        compiled = compile_case(assertions, question_data.get("context"))
+    except InvalidAssertion as e:
+        return {"passed": False, "details": {}, "error": str(e)}
+    
+    # Cheap rule-based checks first; semantic checks only if still needed
+    assertion_results = compiled.evaluate(response, stop_on_failure)
+    scores = {}
+    for assertion in compiled.semantic:
+        if stop_on_failure and not all(assertion_results.values()):
+            break
+        check_name = assertion["check"]
+        if semantic_scores and check_name in semantic_scores:
+            score = semantic_scores[check_name]
+        else:
+            references = semantic_references(assertion, question_data)
+            score = float(semantic_match_scores([response], [references])[0])
+        scores[check_name] = score
+        assertion_results[check_name] = score >= assertion.get("threshold", DEFAULT_SEMANTIC_THRESHOLD)
+    
+    # All assertions must pass
+    all_passed = all(assertion_results.values())
+    
+    result = {
+        "passed": all_passed,
+        "details": assertion_results
+    }
+    if scores:
+        result["scores"] = scores
+    return result
+
+
+def evaluate_responses_rule_based(
+    responses: List[str],
+    cases: List[Dict],
+    scenario: str = "neutral"
+) -> List[Dict]:
+    """
+    Evaluate many responses at once
+    
+    Semantic assertions across the whole batch are scored in a single
+    vectorized call; keyword assertions are checked per response.
+    
+    Args:
+        responses: Response texts
+        cases: The eval case each response answers (same order)
+        scenario: Which scenario to evaluate against
+        
+    Returns:
+        List of evaluate_response_rule_based results, in order
+    """
+    pairs = []  # (response index, check name, references)
+    for i, (response, case) in enumerate(zip(responses, cases)):
+        assertions, _ = get_assertions(case, scenario)
+        for assertion in assertions:
+            if assertion.get("type") == "semantic":
+                pairs.append((i, assertion["check"], semantic_references(assertion, case)))
+    
+    precomputed = [{} for _ in responses]
+    if pairs:
+        scores = semantic_match_scores(
+            [responses[i] for i, _, _ in pairs],
+            [references for _, _, references in pairs]
+        )
+        for (i, check_name, _), score in zip(pairs, scores):
+            precomputed[i][check_name] = float(score)
+    
+    return [
+        evaluate_response_rule_based(
+            response, case["id"], scenario, question_data=case, semantic_scores=precomputed[i]
+        )
+        for i, (response, case) in enumerate(zip(responses, cases))
+    ]
@@ -0,0 +1,208 @@
+"""
+Columnar (Parquet) export of review data and eval results for offline analysis
+
+Exports are written in streaming chunks, so memory use does not grow with
+the size of the table, and are read back memory-mapped, so analytics never
+touch the live SQLite files.
+
+Usage:
+    python export_data.py reviews [--out data/exports/reviews.parquet]
+    python export_data.py evals [--out data/exports/eval_history.parquet]
+    python export_data.py batch data/batch_runs/*.json [--out data/exports/batch_results.parquet]
+"""
+import json
+from pathlib import Path
+from typing import Iterable, Iterator, List
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from batch_runner import load_results
+from db_pool import DEFAULT_DB_PATH, get_pool
+from response_archive import ResponseArchive
+from scheduler import DEFAULT_HISTORY_PATH
+
+DEFAULT_EXPORT_DIR = Path(__file__).parent / "data" / "exports"
+
+# Rows per Parquet row group
+EXPORT_CHUNK_SIZE = 50000
+
+REVIEW_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("clothing_id", pa.int64()),
+    ("age", pa.int32()),
+    ("title", pa.string()),
+    ("review_text", pa.string()),
+    ("rating", pa.int8()),
+    ("recommended_ind", pa.int8()),
+    ("positive_feedback_count", pa.int32()),
+    ("division_name", pa.string()),
+    ("department_name", pa.string()),
+    ("class_name", pa.string()),
+    ("created_at", pa.string())
+])
+
+EVAL_HISTORY_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("run_key", pa.string()),
+    ("prompt_hash", pa.string()),
+    ("question_id", pa.string()),
+    ("passed", pa.bool_()),
+    ("details", pa.string()),  # JSON {check: passed}
+    ("created_at", pa.string())
+])
+
+BATCH_RESULT_SCHEMA = pa.schema([
+    ("run", pa.string()),
+    ("provider", pa.string()),
+    ("model", pa.string()),
+    ("prompt_hash", pa.string()),
+    ("custom_id", pa.string()),
+    ("success", pa.bool_()),
+    ("passed", pa.bool_()),
+    ("response", pa.string()),
+    ("error", pa.string()),
+    ("input_tokens", pa.int64()),
+    ("output_tokens", pa.int64()),
+    ("cached_tokens", pa.int64()),
+    ("details", pa.string())  # JSON {check: passed}
+])
+
+
+def _write_chunks(out_path, schema: pa.Schema, chunks: Iterable[List[tuple]]) -> int:
+    """Write row chunks to a Parquet file, one row group per chunk"""
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    rows_written = 0
+    with pq.ParquetWriter(out_path, schema, compression="zstd") as writer:
+        for rows in chunks:
+            if not rows:
+                continue
+            columns = list(zip(*rows))
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            rows_written += len(rows)
+    return rows_written
+
+
+def _query_chunks(db_path, sql: str, chunk_size: int) -> Iterator[List[tuple]]:
+    with get_pool(db_path).connection() as conn:
+        cursor = conn.execute(sql)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+
+def export_reviews(db_path=DEFAULT_DB_PATH, out_path=None, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """
+    Export feedback_submissions to Parquet
+
+    Args:
+        db_path: Reviews database
+        out_path: Parquet file to write (defaults to data/exports/reviews.parquet)
+        chunk_size: Rows read and written per chunk
+
+    Returns:
+        Number of rows exported
+    """
+    out_path = out_path or DEFAULT_EXPORT_DIR / "reviews.parquet"
+    sql = f"SELECT {', '.join(REVIEW_SCHEMA.names)} FROM feedback_submissions ORDER BY id"
+    return _write_chunks(out_path, REVIEW_SCHEMA, _query_chunks(db_path, sql, chunk_size))
+
+
+def export_eval_history(history_path=DEFAULT_HISTORY_PATH, out_path=None, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """
+    Export the app's eval verdict history (see scheduler.py) to Parquet
+
+    Returns:
+        Number of rows exported
+    """
+    out_path = out_path or DEFAULT_EXPORT_DIR / "eval_history.parquet"
+    sql = f"SELECT {', '.join(EVAL_HISTORY_SCHEMA.names)} FROM eval_history ORDER BY id"
+    chunks = (
+        [(*row[:4], bool(row[4]), *row[5:]) for row in rows]
+        for rows in _query_chunks(history_path, sql, chunk_size)
+    )
+    return _write_chunks(out_path, EVAL_HISTORY_SCHEMA, chunks)
+
+
+def _batch_result_rows(state_path, archive: ResponseArchive) -> List[tuple]:
+    with open(state_path, "r") as f:
+        state = json.load(f)
+    # State files written before results had their own file still hold them inline
+    results = state.get("results") or load_results(state_path)
+    # Response bodies live in the archive; results only reference them
+    bodies = archive.get_many([r["response_ref"] for r in results.values() if "response_ref" in r])
+    rows = []
+    for custom_id, result in results.items():
+        eval_result = result.get("eval") or {}
+        tokens = result.get("tokens") or {}
+        rows.append((
+            Path(state_path).stem,
+            state.get("provider"),
+            state.get("model"),
+            state.get("prompt_hash"),
+            custom_id,
+            bool(result.get("success")),
+            eval_result.get("passed"),
+            result.get("response", bodies.get(result.get("response_ref"))),
+            result.get("error"),
+            tokens.get("input"),
+            tokens.get("output"),
+            tokens.get("cached"),
+            json.dumps(eval_result.get("details", {}))
+        ))
+    return rows
+
+
+def export_batch_results(state_paths: List, out_path=None, archive: ResponseArchive = None) -> int:
+    """
+    Export batch_runner.py results to Parquet, one row group per state file
+
+    Returns:
+        Number of rows exported
+    """
+    out_path = out_path or DEFAULT_EXPORT_DIR / "batch_results.parquet"
+    archive = archive or ResponseArchive()
+    return _write_chunks(out_path, BATCH_RESULT_SCHEMA, (_batch_result_rows(p, archive) for p in state_paths))
+
+
+def load_parquet(path, columns: List[str] = None, filters=None) -> pa.Table:
+    """
+    Open an export memory-mapped, reading only the requested columns
+
+    Args:
+        path: Parquet file written by one of the exports
+        columns: Columns to read (all if omitted)
+        filters: Optional row filters, e.g. [("clothing_id", "=", 1094)]
+
+    Returns:
+        pyarrow Table (call .to_pandas() for a DataFrame)
+    """
+    return pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export reviews and eval results to Parquet")
+    parser.add_argument("what", choices=["reviews", "evals", "batch"])
+    parser.add_argument("state_files", nargs="*", help="Batch state files (for 'batch')")
+    parser.add_argument("--out", help="Parquet file to write")
+    parser.add_argument("--db", help="Source database (for 'reviews' and 'evals')")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.what == "reviews":
+        count = export_reviews(args.db or DEFAULT_DB_PATH, args.out, args.chunk_size)
+    elif args.what == "evals":
+        count = export_eval_history(args.db or DEFAULT_HISTORY_PATH, args.out, args.chunk_size)
+    else:
+        if not args.state_files:
+            parser.error("batch export needs at least one state file")
+        count = export_batch_results(args.state_files, args.out)
+    print(f"✓ Exported {count} rows")
@@ -0,0 +1,132 @@
+"""
+Token-budgeted conversation history for "Save context"
+
+Keeps the newest turns that fit in a token budget and folds the older ones
+into a short extractive summary, so per-turn input cost stays roughly
+constant however long the session gets. Turns that have left the app's
+in-memory window are folded into a summary carried forward with the session
+(see summarize_turns' `earlier`), so they aren't forgotten either.
+"""
+import re
+from typing import Dict, List
+
+DEFAULT_HISTORY_TOKEN_BUDGET = 2000
+
+# Upper bound on the folded summary, as a share of the history budget
+SUMMARY_BUDGET_RATIO = 0.25
+
+# Upper bound on the summary carried forward for turns no longer in memory
+CARRIED_SUMMARY_TOKENS = 2000
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate token count locally (no API call)
+
+    Counts word pieces and punctuation, and falls back to ~4 characters per
+    token for long unbroken strings such as URLs. Close enough to both
+    providers' tokenizers for budgeting.
+    """
+    if not text:
+        return 0
+    pieces = _TOKEN_RE.findall(text)
+    return max(len(pieces), len(text) // 4)
+
+
+def _message_tokens(message: Dict) -> int:
+    # A few tokens of per-message overhead for role markers
+    return estimate_tokens(message["content"]) + 4
+
+
+def _first_sentence(text: str, max_chars: int = 160) -> str:
+    sentence = re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars].rstrip() + "…"
+    return sentence
+
+
+def summarize_turns(messages: List[Dict], token_budget: int, earlier: str = None) -> str:
+    """
+    Fold older turns into a compact extractive summary
+
+    Keeps the first sentence of each message, newest last, and drops the
+    oldest lines until the summary fits the budget.
+
+    Args:
+        messages: Turns to fold (oldest first)
+        token_budget: Maximum estimated tokens of summary
+        earlier: Summary of the turns before `messages`, whose lines are
+            kept ahead of theirs while they fit
+    """
+    new_lines = [
+        f"- {'User' if m['role'] == 'user' else 'Assistant'}: {_first_sentence(m['content'])}"
+        for m in messages if m.get("content")
+    ]
+    all_lines = (earlier.splitlines() if earlier else []) + new_lines
+
+    lines = []
+    remaining = token_budget
+    for line in reversed(all_lines):
+        cost = estimate_tokens(line) + 1
+        if cost > remaining:
+            break
+        lines.append(line)
+        remaining -= cost
+    lines.reverse()
+    return "\n".join(lines)
+
+
+def build_history(
+    messages: List[Dict],
+    token_budget: int = DEFAULT_HISTORY_TOKEN_BUDGET,
+    summarize: bool = True,
+    earlier_summary: str = None
+) -> Dict:
+    """
+    Cap conversation history to a token budget, newest turns first
+
+    Args:
+        messages: Full chat history (oldest first), without the current question
+        token_budget: Maximum estimated tokens of history to send
+        summarize: Whether to fold dropped turns into a summary
+        earlier_summary: Summary of turns before `messages` (already out of
+            memory), folded in ahead of the dropped ones
+
+    Returns:
+        Dict with 'messages' (role/content only, starting with a user turn),
+        'summary' (str or None, to append to the system prompt) and
+        'dropped' (number of messages left out of 'messages')
+    """
+    summary_budget = int(token_budget * SUMMARY_BUDGET_RATIO) if summarize else 0
+    remaining = token_budget - summary_budget
+
+    kept = []
+    for message in reversed(messages):
+        cost = _message_tokens(message)
+        if cost > remaining:
+            break
+        kept.append({"role": message["role"], "content": message["content"]})
+        remaining -= cost
+    kept.reverse()
+
+    # Both providers expect history to open with a user turn
+    while kept and kept[0]["role"] != "user":
+        kept.pop(0)
+
+    older = messages[:len(messages) - len(kept)]
+    summary = None
+    if summarize and (older or earlier_summary):
+        summary = summarize_turns(older, summary_budget, earlier=earlier_summary) or None
+
+    return {
+        "messages": kept,
+        "summary": summary,
+        "dropped": len(older)
+    }
+
+
+def summary_prompt(summary: str) -> str:
+    """System-prompt suffix carrying the folded summary"""
+    return f"\n\nSummary of earlier conversation (older turns omitted):\n{summary}"
@@ -4,7 +4,13 @@ Ingest Kaggle Women's E-Commerce Clothing Reviews into SQLite
 import sqlite3
 import pandas as pd
 from pathlib import Path
+from collections import Counter
 from datetime import datetime
+from typing import Dict, Iterable
+
+from db_pool import DEFAULT_DB_PATH
+from near_duplicates import NearDuplicateIndex, ensure_canonical_column, index_existing_reviews
+from product_digests import refresh_digests
 
 def clean_text(text):
     """Clean text fields"""
@@ -12,37 +18,22 @@ def clean_text(text):
         return None
     return str(text).strip()
 
-def ingest_reviews(csv_path: str, db_path: str = "data/evals_demo.db", sample_size: int = None):
+# CSV rows read and written per chunk when streaming a large file
+INGEST_CHUNK_SIZE = 100000
+
+# What to do with near-duplicate reviews (see near_duplicates.py)
+NEAR_DUPLICATE_MODES = ("keep", "mark", "drop")
+
+def clean_reviews(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Load Kaggle reviews CSV into SQLite database
+    Map Kaggle CSV columns to our schema and drop rows with no review text
     
     Args:
-        csv_path: Path to the downloaded CSV file
-        db_path: Path to SQLite database
-        sample_size: Optional - load only N random reviews (for testing)
+        df: Rows with the Kaggle CSV columns:
+            ['Clothing ID', 'Age', 'Title', 'Review Text', 'Rating', 
+             'Recommended IND', 'Positive Feedback Count', 'Division Name', 
+             'Department Name', 'Class Name']
     """
-    print(f"📂 Reading CSV from: {csv_path}")
-    
-    # Read CSV
-    df = pd.read_csv(csv_path)
-    
-    print(f"✓ Loaded {len(df)} reviews")
-    print(f"✓ Columns: {list(df.columns)}")
-    
-    # Sample if requested
-    if sample_size and sample_size < len(df):
-        df = df.sample(n=sample_size, random_state=42)
-        print(f"✓ Sampled {sample_size} reviews for testing")
-    
-    # Clean and prepare data
-    print("\n🧹 Cleaning data...")
-    
-    # Map CSV columns to our schema
-    # Expected CSV columns from Kaggle:
-    # ['Clothing ID', 'Age', 'Title', 'Review Text', 'Rating', 
-    #  'Recommended IND', 'Positive Feedback Count', 'Division Name', 
-    #  'Department Name', 'Class Name']
-    
     df_clean = pd.DataFrame({
         'clothing_id': df['Clothing ID'],
         'age': df['Age'],
@@ -57,46 +48,151 @@ def ingest_reviews(csv_path: str, db_path: str = "data/evals_demo.db", sample_si
     })
     
     # Remove rows with no review text
-    df_clean = df_clean.dropna(subset=['review_text'])
-    print(f"✓ {len(df_clean)} reviews after removing empty text")
+    return df_clean.dropna(subset=['review_text'])
+
+def write_review_chunks(chunks: Iterable[pd.DataFrame], db_path=DEFAULT_DB_PATH, on_chunk=None,
+                        near_duplicates: str = "keep") -> Dict:
+    """
+    Clean and append chunks of Kaggle-format rows to feedback_submissions
     
-    # Data quality checks
-    print("\n📊 Data Quality Summary:")
-    print(f"  Rating distribution:")
-    print(df_clean['rating'].value_counts().sort_index())
-    print(f"\n  Reviews with text: {df_clean['review_text'].notna().sum()}")
-    print(f"  Average review length: {df_clean['review_text'].str.len().mean():.0f} chars")
-    print(f"  Department breakdown:")
-    print(df_clean['department_name'].value_counts())
+    Each chunk is written and committed on its own, so memory stays flat
+    however large the input is (the near-duplicate index is stored in the
+    database too).
     
-    # Connect to database
-    print(f"\n💾 Writing to database: {db_path}")
+    Args:
+        chunks: DataFrames with the Kaggle CSV columns
+        db_path: Path to SQLite database
+        on_chunk: Optional callback(rows_written_so_far) after each chunk
+        near_duplicates: "mark" sets canonical_id on near-duplicates of an
+            earlier review of the same product (including reviews already in
+            the database), "drop" leaves them out, "keep" skips detection
+    
+    Returns:
+        Dict with 'rows', 'ratings' and 'departments' counts,
+        'text_chars' (total review text length) and 'near_duplicates',
+        for a quality summary
+    """
+    if near_duplicates not in NEAR_DUPLICATE_MODES:
+        raise ValueError(f"near_duplicates must be one of {NEAR_DUPLICATE_MODES}, got {near_duplicates!r}")
+    summary = {"rows": 0, "ratings": Counter(), "departments": Counter(), "text_chars": 0, "near_duplicates": 0}
     conn = sqlite3.connect(db_path)
+    try:
+        if near_duplicates != "keep":
+            ensure_canonical_column(conn)
+            index = NearDuplicateIndex(conn)
+            index_existing_reviews(conn, index)
+            next_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM feedback_submissions").fetchone()[0]
+        
+        for chunk in chunks:
+            df_clean = clean_reviews(chunk).reset_index(drop=True)
+            if near_duplicates != "keep":
+                # IDs are assigned here so copies (and the stored index) can point at their canonical row
+                ids = range(next_id, next_id + len(df_clean))
+                next_id += len(df_clean)
+                canonical = index.add(ids, df_clean['clothing_id'].fillna(-1).astype('int64'), df_clean['review_text'])
+                is_copy = pd.Series([c is not None for c in canonical])
+                summary["near_duplicates"] += int(is_copy.sum())
+                df_clean.insert(0, 'id', ids)
+                if near_duplicates == "drop":
+                    df_clean = df_clean[~is_copy]
+                else:
+                    df_clean['canonical_id'] = pd.array(canonical, dtype='Int64')
+            df_clean.to_sql(
+                'feedback_submissions',
+                conn,
+                if_exists='append',  # append to existing table
+                index=False
+            )
+            conn.commit()
+            
+            summary["rows"] += len(df_clean)
+            summary["ratings"].update(df_clean['rating'].value_counts().to_dict())
+            summary["departments"].update(df_clean['department_name'].value_counts().to_dict())
+            summary["text_chars"] += int(df_clean['review_text'].str.len().sum())
+            if on_chunk:
+                on_chunk(summary["rows"])
+    finally:
+        conn.close()
+    return summary
+
+def ingest_reviews(csv_path: str, db_path=DEFAULT_DB_PATH, sample_size: int = None,
+                   chunk_size: int = INGEST_CHUNK_SIZE, near_duplicates: str = "mark"):
+    """
+    Load Kaggle reviews CSV into SQLite database
+    
+    Args:
+        csv_path: Path to the downloaded CSV file
+        db_path: Path to SQLite database
+        sample_size: Optional - load only N random reviews (for testing)
+        chunk_size: Rows read and written at a time (the whole file is read
+            at once only when sampling)
+        near_duplicates: "mark" (default), "drop" or "keep" near-duplicate
+            reviews (see write_review_chunks)
+    """
+    print(f"📂 Reading CSV from: {csv_path}")
+    
+    if sample_size:
+        # Sampling needs every row in memory
+        df = pd.read_csv(csv_path)
+        print(f"✓ Loaded {len(df)} reviews")
+        if sample_size < len(df):
+            df = df.sample(n=sample_size, random_state=42)
+            print(f"✓ Sampled {sample_size} reviews for testing")
+        chunks = [df]
+    else:
+        chunks = pd.read_csv(csv_path, chunksize=chunk_size)
     
-    # Insert data
-    df_clean.to_sql(
-        'feedback_submissions',
-        conn,
-        if_exists='append',  # append to existing table
-        index=False
+    # Clean, prepare and write data chunk by chunk
+    print(f"\n💾 Writing to database: {db_path}")
+    summary = write_review_chunks(
+        chunks,
+        db_path,
+        on_chunk=lambda rows: print(f"  ... {rows} reviews written"),
+        near_duplicates=near_duplicates
     )
+    print_ingest_summary(summary, db_path)
+    
+    # Only products that got new reviews are recomputed
+    print(f"🧾 Refreshed {refresh_digests(db_path)} product digests")
+    
+    return summary["rows"]
+
+def print_ingest_summary(summary: Dict, db_path=DEFAULT_DB_PATH):
+    """Print data quality checks for an ingest, plus a few sample rows"""
+    rows = summary["rows"]
+    print(f"✓ {rows} reviews after removing empty text")
+    if summary.get("near_duplicates"):
+        print(f"✓ {summary['near_duplicates']} near-duplicate reviews found")
+    
+    # Data quality checks
+    print("\n📊 Data Quality Summary:")
+    print(f"  Rating distribution:")
+    for rating, count in sorted(summary["ratings"].items()):
+        print(f"    {rating}: {count}")
+    print(f"\n  Average review length: {summary['text_chars'] / max(rows, 1):.0f} chars")
+    print(f"  Department breakdown:")
+    for department, count in summary["departments"].most_common():
+        print(f"    {department}: {count}")
     
     # Verify insertion
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     cursor.execute("SELECT COUNT(*) FROM feedback_submissions")
     total_count = cursor.fetchone()[0]
     
-    print(f"✓ Successfully inserted {len(df_clean)} reviews")
+    print(f"✓ Successfully inserted {rows} reviews")
     print(f"✓ Total reviews in database: {total_count}")
     
-    # Show some sample data
+    # Show some sample data (random IDs; ORDER BY RANDOM() scans the whole table)
     print("\n📝 Sample Reviews:")
     cursor.execute("""
         SELECT id, rating, department_name, 
                substr(review_text, 1, 100) || '...' as preview
         FROM feedback_submissions
-        ORDER BY RANDOM()
-        LIMIT 3
+        WHERE id IN (
+            SELECT abs(random()) % (SELECT MAX(id) FROM feedback_submissions) + 1
+            FROM feedback_submissions LIMIT 3
+        )
     """)
     
     for row in cursor.fetchall():
@@ -105,10 +201,8 @@ def ingest_reviews(csv_path: str, db_path: str = "data/evals_demo.db", sample_si
     
     conn.close()
     print("\n✅ Ingestion complete!")
-    
-    return len(df_clean)
 
-def get_stats(db_path: str = "data/evals_demo.db"):
+def get_stats(db_path=DEFAULT_DB_PATH):
     """Show database statistics"""
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
@@ -153,21 +247,24 @@ if __name__ == "__main__":
     import sys
     
     if len(sys.argv) < 2:
-        print("Usage: python ingest_data.py <path_to_csv> [sample_size]")
+        print("Usage: python ingest_data.py <path_to_csv> [sample_size] [--drop-duplicates]")
         print("\nExample:")
         print("  python ingest_data.py data/reviews.csv")
         print("  python ingest_data.py data/reviews.csv 100  # Load only 100 reviews")
+        print("  python ingest_data.py data/reviews.csv --drop-duplicates  # Leave out near-duplicate reviews")
         sys.exit(1)
     
-    csv_path = sys.argv[1]
-    sample_size = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    drop_duplicates = "--drop-duplicates" in sys.argv
+    args = [a for a in sys.argv[1:] if a != "--drop-duplicates"]
+    csv_path = args[0]
+    sample_size = int(args[1]) if len(args) > 1 else None
     
     if not Path(csv_path).exists():
         print(f"❌ File not found: {csv_path}")
         sys.exit(1)
     
     # Ingest data
-    ingest_reviews(csv_path, sample_size=sample_size)
+    ingest_reviews(csv_path, sample_size=sample_size, near_duplicates="drop" if drop_duplicates else "mark")
     
     # Show stats
     get_stats()
@@ -4,7 +4,12 @@ Initialize SQLite database for Evals Demo
 import sqlite3
 from pathlib import Path
 
-def init_database(db_path: str = "data/evals_demo.db"):
+from db_pool import DEFAULT_DB_PATH
+from near_duplicates import ensure_canonical_column
+
+SCHEMA_PATH = Path(__file__).parent / 'schema.sql'
+
+def init_database(db_path=DEFAULT_DB_PATH):
     """
     Initialize the SQLite database with schema from schema.sql
     
@@ -16,7 +21,7 @@ def init_database(db_path: str = "data/evals_demo.db"):
     db_file.parent.mkdir(parents=True, exist_ok=True)
     
     # Read schema
-    with open('schema.sql', 'r') as f:
+    with open(SCHEMA_PATH, 'r') as f:
         schema_sql = f.read()
     
     # Connect and execute schema
@@ -55,5 +60,31 @@ def init_database(db_path: str = "data/evals_demo.db"):
     conn.close()
     print("\n✓ Database ready!")
 
+def upgrade_database(db_path=DEFAULT_DB_PATH):
+    """
+    Bring a database created from an older schema.sql up to date, in place
+    
+    CREATE TABLE IF NOT EXISTS leaves existing tables alone, so columns added
+    since are added first; then any missing tables and indexes are created.
+    Safe to run on every start.
+    
+    Args:
+        db_path: Path to SQLite database file
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_canonical_column(conn)
+        with open(SCHEMA_PATH, 'r') as f:
+            conn.executescript(f.read())
+        conn.commit()
+    finally:
+        conn.close()
+
 if __name__ == "__main__":
-    init_database()
+    import sys
+    
+    if "--upgrade" in sys.argv:
+        upgrade_database()
+        print(f"✓ Database upgraded at: {DEFAULT_DB_PATH}")
+    else:
+        init_database()
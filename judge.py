@@ -0,0 +1,280 @@
+"""
+Batched LLM-as-judge with verdict caching
+
+Grades several responses against their ground_truth in a single structured
+(forced tool call) request, runs those requests concurrently, and caches
+verdicts by (response hash, rubric hash, judge model) so a response that has
+already been graded never costs another round-trip.
+"""
+import anthropic
+from openai import OpenAI
+import hashlib
+import json
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+from claude_api import usage_tokens as anthropic_usage_tokens
+from openai_api import usage_tokens as openai_usage_tokens
+
+DEFAULT_JUDGE_MODELS = {
+    "anthropic": "claude-haiku-4-5-20251001",
+    "openai": "gpt-4o-mini"
+}
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / "data" / "judge_cache.db"
+
+# Check name used when a judge verdict is added to an eval result's details
+JUDGE_CHECK = "matches_ground_truth"
+JUDGE_CHECK_DESCRIPTION = "LLM judge: response is consistent with the ground truth for this question"
+
+JUDGE_RUBRIC = """You are grading a shopping assistant's answers for an evaluation suite.
+For each item, compare the RESPONSE with the GROUND TRUTH for its QUESTION.
+An item passes when the response reaches the same substantive conclusion as the ground truth
+(risks, quality verdict, sizing advice) and addresses the customer's stated concerns,
+even if it is worded differently. It fails if it contradicts the ground truth or omits its key point.
+Score from 0.0 (completely wrong) to 1.0 (fully consistent). Keep each reason to one sentence.
+Record a verdict for every item ID by calling the record_verdicts tool exactly once."""
+
+VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "verdicts": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "passed": {"type": "boolean"},
+                    "score": {"type": "number"},
+                    "reason": {"type": "string"}
+                },
+                "required": ["id", "passed", "score", "reason"]
+            }
+        }
+    },
+    "required": ["verdicts"]
+}
+
+_cache_lock = threading.Lock()
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def rubric_hash(item: Dict, rubric: str = JUDGE_RUBRIC) -> str:
+    """Hash of everything the verdict is graded against (rubric, question, ground truth)"""
+    return _sha("\x1f".join([rubric, item.get("question", ""), item["ground_truth"]]))
+
+
+def _cache_key(item: Dict, judge_model: str, rubric: str) -> tuple:
+    return (_sha(item["response"]), rubric_hash(item, rubric), judge_model)
+
+
+def _connect_cache(cache_path) -> sqlite3.Connection:
+    Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(cache_path, timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS judge_verdicts (
+            response_hash TEXT NOT NULL,
+            rubric_hash TEXT NOT NULL,
+            judge_model TEXT NOT NULL,
+            passed INTEGER NOT NULL,
+            score REAL,
+            reason TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (response_hash, rubric_hash, judge_model)
+        )
+    """)
+    return conn
+
+
+def _format_items(items: List[Dict]) -> str:
+    blocks = []
+    for item in items:
+        blocks.append(
+            f"<item id=\"{item['id']}\">\n"
+            f"QUESTION: {item.get('question', '')}\n"
+            f"GROUND TRUTH: {item['ground_truth']}\n"
+            f"RESPONSE:\n{item['response']}\n"
+            f"</item>"
+        )
+    return "\n\n".join(blocks)
+
+
+def _judge_anthropic(client, items: List[Dict], model: str, rubric: str) -> tuple:
+    message = client.messages.create(
+        model=model,
+        max_tokens=300 + 150 * len(items),
+        system=rubric,
+        messages=[{"role": "user", "content": _format_items(items)}],
+        tools=[{
+            "name": "record_verdicts",
+            "description": "Record one verdict per graded item",
+            "input_schema": VERDICT_SCHEMA
+        }],
+        tool_choice={"type": "tool", "name": "record_verdicts"}
+    )
+    tool_use = next(block for block in message.content if block.type == "tool_use")
+    return tool_use.input["verdicts"], anthropic_usage_tokens(message.usage)
+
+
+def _judge_openai(client, items: List[Dict], model: str, rubric: str) -> tuple:
+    response = client.chat.completions.create(
+        model=model,
+        max_tokens=300 + 150 * len(items),
+        messages=[
+            {"role": "system", "content": rubric},
+            {"role": "user", "content": _format_items(items)}
+        ],
+        tools=[{
+            "type": "function",
+            "function": {
+                "name": "record_verdicts",
+                "description": "Record one verdict per graded item",
+                "parameters": VERDICT_SCHEMA
+            }
+        }],
+        tool_choice={"type": "function", "function": {"name": "record_verdicts"}}
+    )
+    tool_call = response.choices[0].message.tool_calls[0]
+    return json.loads(tool_call.function.arguments)["verdicts"], openai_usage_tokens(response.usage)
+
+
+def judge_responses(
+    items: List[Dict],
+    provider: str,
+    api_key: str,
+    model: str = None,
+    batch_size: int = 5,
+    max_workers: int = 4,
+    rubric: str = JUDGE_RUBRIC,
+    cache_path=DEFAULT_CACHE_PATH,
+    base_url: str = None,
+    return_usage: bool = False
+) -> Dict[str, Dict]:
+    """
+    Grade responses against their ground truth, several per judge call
+
+    Args:
+        items: Dicts with 'id', 'question', 'response' and 'ground_truth'
+        provider: "anthropic" or "openai" (which API runs the judge)
+        api_key: API key for that provider
+        model: Judge model (defaults to the provider's cheapest model)
+        batch_size: Responses graded per judge call
+        max_workers: Judge calls in flight at once
+        rubric: Grading instructions (part of the cache key)
+        cache_path: SQLite file holding cached verdicts
+        base_url: Optional API base URL (e.g. a local stand-in endpoint)
+        return_usage: Also return the judge calls' token usage
+
+    Returns:
+        Dict mapping item id to {'passed', 'score', 'reason', 'cached'} or
+        {'error'}; with return_usage, a (verdicts, usage) tuple where usage
+        has one {'model', 'tokens'} dict per judge call made (for
+        cost_ledger.usage_records)
+    """
+    if provider not in DEFAULT_JUDGE_MODELS:
+        raise ValueError(f"Unknown judge provider '{provider}'")
+    model = model or DEFAULT_JUDGE_MODELS[provider]
+    verdicts = {}
+    usage = []
+
+    # Serve what we can from the cache
+    pending = []
+    with _cache_lock:
+        conn = _connect_cache(cache_path)
+        try:
+            for item in items:
+                row = conn.execute(
+                    "SELECT passed, score, reason FROM judge_verdicts "
+                    "WHERE response_hash = ? AND rubric_hash = ? AND judge_model = ?",
+                    _cache_key(item, model, rubric)
+                ).fetchone()
+                if row:
+                    verdicts[str(item["id"])] = {
+                        "passed": bool(row[0]), "score": row[1], "reason": row[2], "cached": True
+                    }
+                else:
+                    pending.append(item)
+        finally:
+            conn.close()
+
+    if not pending:
+        return (verdicts, usage) if return_usage else verdicts
+
+    if provider == "anthropic":
+        client = anthropic.Anthropic(api_key=api_key, base_url=base_url)
+        judge_batch = _judge_anthropic
+    else:
+        client = OpenAI(api_key=api_key, base_url=base_url)
+        judge_batch = _judge_openai
+
+    def run(batch: List[Dict]) -> Dict[str, Dict]:
+        try:
+            raw, tokens = judge_batch(client, batch, model, rubric)
+        except Exception as e:
+            return {str(item["id"]): {"error": str(e)} for item in batch}
+        usage.append({"model": model, "tokens": tokens})
+        by_id = {str(v["id"]): v for v in raw if isinstance(v, dict) and "id" in v}
+        out = {}
+        for item in batch:
+            verdict = by_id.get(str(item["id"]))
+            if verdict is None:
+                out[str(item["id"])] = {"error": "Judge returned no verdict for this item"}
+                continue
+            # A malformed verdict only loses its own item, not the rest of the batch
+            try:
+                passed = verdict["passed"]
+                if not isinstance(passed, bool):
+                    raise ValueError(f"'passed' is {passed!r}, not a boolean")
+                score = verdict.get("score")
+                out[str(item["id"])] = {
+                    "passed": passed,
+                    "score": float(score) if score is not None else (1.0 if passed else 0.0),
+                    "reason": str(verdict.get("reason") or ""),
+                    "cached": False
+                }
+            except (KeyError, TypeError, ValueError) as e:
+                out[str(item["id"])] = {"error": f"Malformed judge verdict: {e!r}"}
+        return out
+
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch_verdicts in executor.map(run, batches):
+            verdicts.update(batch_verdicts)
+
+    # Persist fresh verdicts
+    items_by_id = {str(item["id"]): item for item in pending}
+    with _cache_lock:
+        conn = _connect_cache(cache_path)
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO judge_verdicts "
+                "(response_hash, rubric_hash, judge_model, passed, score, reason) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (*_cache_key(items_by_id[item_id], model, rubric),
+                     int(v["passed"]), v["score"], v["reason"])
+                    for item_id, v in verdicts.items()
+                    if item_id in items_by_id and "error" not in v
+                ]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    return (verdicts, usage) if return_usage else verdicts
+
+
+def apply_verdict(eval_result: Dict, verdict: Dict) -> Dict:
+    """Fold a judge verdict into a rule-based eval result as one more assertion"""
+    if verdict is None or "error" in verdict:
+        eval_result["judge"] = verdict
+        return eval_result
+    eval_result["details"][JUDGE_CHECK] = verdict["passed"]
+    eval_result["judge"] = verdict
+    eval_result["passed"] = all(eval_result["details"].values())
+    return eval_result
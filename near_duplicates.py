@@ -0,0 +1,327 @@
+"""
+Near-duplicate review detection (MinHash with LSH banding)
+
+Review exports contain reposts and templated text that differ only in a
+word or two. Each review is reduced to a MinHash signature of its word
+3-grams. Signatures are split into bands, and reviews of the same product
+that share a band are candidates. A candidate counts as a copy when the
+estimated Jaccard similarity reaches DUPLICATE_THRESHOLD. Each review is
+looked up once against the bucket table, so a pass is linear in the
+number of reviews. Buckets and signatures of canonical reviews are stored
+in the database next to the reviews, so an ingest reads only the buckets
+its new rows fall into instead of loading every earlier review.
+
+Copies are marked with the id of the first (canonical) review in
+feedback_submissions.canonical_id; canonical reviews have canonical_id NULL,
+so queries skip copies with `canonical_id IS NULL`.
+
+Usage:
+    python near_duplicates.py [db_path]    # mark copies in an existing database
+"""
+import re
+import sqlite3
+import zlib
+from itertools import chain
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from db_pool import DEFAULT_DB_PATH
+
+# MinHash functions per signature
+NUM_PERM = 64
+
+# LSH bands (NUM_PERM / LSH_BANDS rows each); 8 bands of 8 make pairs above
+# ~0.77 Jaccard similarity likely to share a band
+LSH_BANDS = 8
+
+# Estimated Jaccard similarity at which a review counts as a copy
+DUPLICATE_THRESHOLD = 0.8
+
+# Words per shingle
+SHINGLE_WORDS = 3
+
+# Rows read per query when scanning an existing table
+SCAN_CHUNK_SIZE = 10000
+
+# Distinct words whose hashes are memoised
+WORD_CACHE_SIZE = 200000
+
+MINHASH_SEED = 1094
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_EMPTY = np.iinfo(np.uint32).max
+
+_rng = np.random.default_rng(MINHASH_SEED)
+_PERM_A = (_rng.integers(0, 2 ** 32, NUM_PERM, dtype=np.uint64) | np.uint64(1)).astype(np.uint32)
+_PERM_B = _rng.integers(0, 2 ** 32, NUM_PERM, dtype=np.uint64).astype(np.uint32)
+_SHINGLE_MULT = _rng.integers(1, 2 ** 63, SHINGLE_WORDS, dtype=np.uint64) | np.uint64(1)
+_BAND_MULT = _rng.integers(1, 2 ** 63, NUM_PERM // LSH_BANDS, dtype=np.uint64) | np.uint64(1)
+_BAND_SALT = _rng.integers(0, 2 ** 63, LSH_BANDS, dtype=np.uint64)
+_PRODUCT_MULT = np.uint64(0x9E3779B97F4A7C15)
+
+_word_hashes = {}
+
+
+def _word_hash(word: str) -> int:
+    h = _word_hashes.get(word)
+    if h is None:
+        if len(_word_hashes) >= WORD_CACHE_SIZE:
+            _word_hashes.clear()
+        h = _word_hashes[word] = zlib.crc32(word.encode("utf-8"))
+    return h
+
+
+def shingle_hashes(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    32-bit hashes of the word 3-grams of each text (texts of one or two
+    words are a single shingle)
+
+    Returns:
+        (hashes of all texts' shingles concatenated, shingles per text)
+    """
+    words = [[_word_hash(w) for w in _WORD_RE.findall((text or "").lower())] for text in texts]
+    words = [w + [0] * (SHINGLE_WORDS - len(w)) if 0 < len(w) < SHINGLE_WORDS else w for w in words]
+    lengths = np.array([len(w) for w in words], dtype=np.int64)
+    counts = np.maximum(lengths - SHINGLE_WORDS + 1, 0)
+    flat = np.fromiter(chain.from_iterable(words), dtype=np.uint64, count=int(lengths.sum()))
+    if len(flat) < SHINGLE_WORDS:
+        return np.empty(0, dtype=np.uint32), counts
+
+    # Hash every window of the concatenated words, then drop windows that cross texts
+    windows = len(flat) - SHINGLE_WORDS + 1
+    with np.errstate(over="ignore"):
+        combined = sum(flat[k:k + windows] * _SHINGLE_MULT[k] for k in range(SHINGLE_WORDS))
+    valid = np.ones(windows, dtype=bool)
+    ends = np.cumsum(lengths)
+    for k in range(1, SHINGLE_WORDS):
+        crossing = ends - k
+        valid[crossing[(crossing >= 0) & (crossing < windows)]] = False
+    return (combined[valid] >> np.uint64(32)).astype(np.uint32), counts
+
+
+def minhash_signatures(texts: Sequence[str]) -> np.ndarray:
+    """
+    MinHash signatures of texts
+
+    Returns:
+        uint32 array of shape (len(texts), NUM_PERM); texts without words get
+        an all-max signature
+    """
+    shingles, counts = shingle_hashes(texts)
+    signatures = np.full((NUM_PERM, len(counts)), _EMPTY, dtype=np.uint32)
+    filled = counts > 0
+    if filled.any():
+        offsets = (np.cumsum(counts) - counts)[filled]
+        hashed = np.empty_like(shingles)
+        # One permutation at a time (multiply, add, xor-shift: a bijection on
+        # 32-bit values), so the working set is a single array of shingles
+        for p in range(NUM_PERM):
+            np.multiply(shingles, _PERM_A[p], out=hashed)
+            hashed += _PERM_B[p]
+            hashed ^= hashed >> np.uint32(15)
+            signatures[p, filled] = np.minimum.reduceat(hashed, offsets)
+    return np.ascontiguousarray(signatures.T)
+
+
+def band_keys(signatures: np.ndarray, clothing_ids: Sequence[int]) -> np.ndarray:
+    """
+    LSH bucket keys, one per band, scoped to the review's product
+
+    Returns:
+        uint64 array of shape (len(signatures), LSH_BANDS)
+    """
+    bands = signatures.astype(np.uint64).reshape(len(signatures), LSH_BANDS, -1)
+    products = np.asarray(clothing_ids, dtype=np.int64).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        return (bands * _BAND_MULT).sum(axis=2) + _BAND_SALT + (products * _PRODUCT_MULT)[:, None]
+
+
+# Band keys per IN (...) lookup, below SQLite's host-parameter limit
+LOOKUP_BATCH_SIZE = 900
+
+
+def ensure_canonical_column(conn: sqlite3.Connection):
+    """Add feedback_submissions.canonical_id to databases created before it existed"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(feedback_submissions)")}
+    if "canonical_id" not in columns:
+        conn.execute("ALTER TABLE feedback_submissions ADD COLUMN canonical_id INTEGER")
+        conn.commit()
+
+
+def ensure_band_tables(conn: sqlite3.Connection):
+    """Create the tables that hold the LSH buckets and signatures of canonical reviews"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS near_duplicate_bands (
+            band_key INTEGER PRIMARY KEY,   -- the first canonical review with this key keeps it
+            review_id INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS near_duplicate_signatures (
+            review_id INTEGER PRIMARY KEY,
+            signature BLOB NOT NULL         -- NUM_PERM uint32 values
+        )
+    """)
+    conn.commit()
+
+
+class NearDuplicateIndex:
+    """
+    LSH buckets of canonical reviews, built up as reviews are added in order
+
+    Buckets and signatures live in SQLite (near_duplicate_bands and
+    near_duplicate_signatures, a few hundred bytes per canonical review on
+    disk); copies are not stored. Each add() reads only the buckets its
+    reviews fall into, so memory stays flat however large the table is.
+    Writes go through the caller's connection and commit with it.
+
+    Args:
+        conn: Connection to the reviews database
+        threshold: Estimated Jaccard similarity at which a review is a copy
+    """
+
+    def __init__(self, conn: sqlite3.Connection, threshold: float = DUPLICATE_THRESHOLD):
+        self.conn = conn
+        self.threshold = threshold
+        ensure_band_tables(conn)
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM near_duplicate_signatures").fetchone()[0]
+
+    def last_review_id(self) -> int:
+        """Highest review ID in the index (0 if it is empty)"""
+        return self.conn.execute("SELECT COALESCE(MAX(review_id), 0) FROM near_duplicate_signatures").fetchone()[0]
+
+    def clear(self):
+        """Forget every review (before re-marking a whole table)"""
+        self.conn.execute("DELETE FROM near_duplicate_bands")
+        self.conn.execute("DELETE FROM near_duplicate_signatures")
+
+    def _stored(self, keys: List[int]) -> Tuple[Dict[int, int], Dict[int, np.ndarray]]:
+        """Stored buckets among keys, and the signatures of the reviews they point at"""
+        buckets = {}
+        for i in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            batch = keys[i:i + LOOKUP_BATCH_SIZE]
+            buckets.update(self.conn.execute(f"""
+                SELECT band_key, review_id FROM near_duplicate_bands
+                WHERE band_key IN ({",".join("?" * len(batch))})
+            """, batch).fetchall())
+        review_ids = list(set(buckets.values()))
+        signatures = {}
+        for i in range(0, len(review_ids), LOOKUP_BATCH_SIZE):
+            batch = review_ids[i:i + LOOKUP_BATCH_SIZE]
+            for review_id, blob in self.conn.execute(f"""
+                SELECT review_id, signature FROM near_duplicate_signatures
+                WHERE review_id IN ({",".join("?" * len(batch))})
+            """, batch):
+                signatures[review_id] = np.frombuffer(blob, dtype=np.uint32)
+        return buckets, signatures
+
+    def add(self, review_ids: Sequence[int], clothing_ids: Sequence[int], texts: Sequence[str]) -> List[int]:
+        """
+        Add reviews in order, matching each against the canonical reviews so far
+
+        Args:
+            review_ids: IDs the reviews are (or will be) stored under
+            clothing_ids: Product of each review; only reviews of the same
+                product are compared
+            texts: Review texts
+
+        Returns:
+            For each review, the ID of the canonical review it copies, or
+            None if it is canonical itself
+        """
+        signatures = minhash_signatures(texts)
+        # SQLite integers are signed, so keys are stored as their int64 bit pattern
+        keys = band_keys(signatures, clothing_ids).view(np.int64)
+        has_words = (signatures != _EMPTY).any(axis=1).tolist()  # texts without words never match
+        buckets, stored = self._stored(np.unique(keys).tolist())
+        new_buckets, new_signatures = {}, []
+        canonical = []
+        for review_id, signature, row_keys, matchable in zip(review_ids, signatures, keys.tolist(), has_words):
+            match = None
+            if matchable:
+                for key in row_keys:
+                    candidate = buckets.get(key)
+                    if candidate is not None and \
+                            np.count_nonzero(stored[candidate] == signature) >= self.threshold * NUM_PERM:
+                        match = candidate
+                        break
+            if match is None:
+                review_id = int(review_id)
+                stored[review_id] = signature
+                new_signatures.append((review_id, signature.tobytes()))
+                for key in row_keys:
+                    if key not in buckets:
+                        buckets[key] = new_buckets[key] = review_id
+            canonical.append(match)
+        self.conn.executemany("INSERT OR REPLACE INTO near_duplicate_signatures VALUES (?, ?)", new_signatures)
+        self.conn.executemany("INSERT OR IGNORE INTO near_duplicate_bands VALUES (?, ?)", new_buckets.items())
+        return canonical
+
+
+def _scan(conn: sqlite3.Connection, where: str = ""):
+    """Yield (ids, clothing_ids, texts) chunks of feedback_submissions in id order"""
+    last_id = 0
+    while True:
+        rows = conn.execute(f"""
+            SELECT id, COALESCE(clothing_id, -1), review_text FROM feedback_submissions
+            WHERE id > ? {where} ORDER BY id LIMIT ?
+        """, (last_id, SCAN_CHUNK_SIZE)).fetchall()
+        if not rows:
+            break
+        ids, clothing_ids, texts = zip(*rows)
+        yield ids, clothing_ids, texts
+        last_id = ids[-1]
+
+
+def index_existing_reviews(conn: sqlite3.Connection, index: NearDuplicateIndex):
+    """
+    Add the canonical reviews the index has not seen yet (rows written before
+    it existed, or by an ingest that skipped detection), so new rows are
+    matched against them too
+    """
+    for ids, clothing_ids, texts in _scan(conn, f"AND canonical_id IS NULL AND id > {int(index.last_review_id())}"):
+        index.add(ids, clothing_ids, texts)
+        conn.commit()
+
+
+def mark_near_duplicates(db_path=DEFAULT_DB_PATH, threshold: float = DUPLICATE_THRESHOLD) -> Dict:
+    """
+    Recompute canonical_id for every review in an existing database
+
+    Args:
+        db_path: Path to SQLite database
+        threshold: Estimated Jaccard similarity at which a review is a copy
+
+    Returns:
+        Dict with 'rows' scanned and 'duplicates' marked
+    """
+    summary = {"rows": 0, "duplicates": 0}
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_canonical_column(conn)
+        index = NearDuplicateIndex(conn, threshold)
+        index.clear()
+        for ids, clothing_ids, texts in _scan(conn):
+            canonical = index.add(ids, clothing_ids, texts)
+            conn.executemany(
+                "UPDATE feedback_submissions SET canonical_id = ? WHERE id = ?",
+                zip(canonical, ids)
+            )
+            conn.commit()
+            summary["rows"] += len(ids)
+            summary["duplicates"] += sum(1 for c in canonical if c is not None)
+    finally:
+        conn.close()
+    return summary
+
+
+if __name__ == "__main__":
+    import sys
+
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DB_PATH
+    print(f"🔍 Marking near-duplicate reviews in {db_path}...")
+    summary = mark_near_duplicates(db_path)
+    print(f"✓ {summary['duplicates']} of {summary['rows']} reviews are near-duplicates of an earlier review")
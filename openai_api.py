@@ -1,11 +1,31 @@
 """
 OpenAI API integration for evaluation runs
 """
-from openai import OpenAI
-import sqlite3
+import time
+from openai import APITimeoutError, OpenAI
 from typing import Dict, List
+from retrieval import format_review_context
+from db_pool import run_tool_query
 import json
 
+def usage_tokens(*usages) -> Dict:
+    """
+    Token counts summed over a turn's API calls
+
+    'input' includes cached prompt tokens, which are also counted in 'cached'
+    (billed at the cached rate, see cost_ledger.py).
+    """
+    return {
+        "input": sum(u.prompt_tokens for u in usages),
+        "output": sum(u.completion_tokens for u in usages),
+        "cached": sum(getattr(u.prompt_tokens_details, "cached_tokens", None) or 0
+                      for u in usages if getattr(u, "prompt_tokens_details", None))
+    }
+
+def partial_usage(model: str, usages: List) -> Dict:
+    """'model' and 'tokens' of the requests a failed call completed (they are billed too)"""
+    return {"model": model, "tokens": usage_tokens(*usages)} if usages else {}
+
 def call_openai(
     api_key: str,
     system_prompt: str,
@@ -13,7 +33,8 @@ def call_openai(
     review_context: Dict = None,
     model: str = "gpt-4o-mini",
     use_tool: bool = False,
-    conversation_history: List[Dict] = None
+    conversation_history: List[Dict] = None,
+    timeout: float = None
 ) -> Dict:
     """
     Call OpenAI API with given prompts
@@ -22,19 +43,31 @@ def call_openai(
         api_key: OpenAI API key
         system_prompt: System prompt configuration
         user_message: User's question
-        review_context: Optional review data to include as context
+        review_context: Optional retrieved reviews to include as context (see retrieval.py)
         model: OpenAI model to use (gpt-4o-mini is the cheapest)
         use_tool: Whether to enable database query tool
         conversation_history: Optional list of previous messages for context
+        timeout: Optional deadline in seconds for the whole call, including the
+            tool round-trip; the SDK does not retry within it
         
     Returns:
-        Dict with response text and metadata
+        Dict with response text and metadata ('timed_out' is set if the deadline
+        passed); a failed call still reports the tokens of any request that
+        completed before it failed
     """
-    client = OpenAI(api_key=api_key)
+    deadline = time.monotonic() + timeout if timeout else None
+    if deadline:
+        client = OpenAI(api_key=api_key, max_retries=0)
+    else:
+        client = OpenAI(api_key=api_key)
     
-    # Build the full user message
+    # Build the full user message, appending retrieved reviews if provided
     full_message = user_message
+    if review_context:
+        full_message = f"{user_message}\n\n{format_review_context(review_context)}"
     
+    # Usage of each completed request, so a call that fails halfway still reports it
+    usages = []
     try:
         # Define tools if enabled
         tools = []
@@ -57,10 +90,15 @@ Available columns in feedback_submissions table:
 - division_name: Product division
 - department_name: Department (Tops, Dresses, Bottoms, etc.)
 - class_name: Product class
+- canonical_id: NULL for original reviews; on near-duplicate copies, the id of the original
 - created_at: Timestamp
 
+Precomputed per-product digests (rating summary, sizing verdict, quality complaints, quotes) are in the
+product_digests table; read the digest before pulling raw reviews:
+- SELECT summary FROM product_digests WHERE clothing_id = 1094
+
 Example queries:
-- Get reviews for a product: SELECT * FROM feedback_submissions WHERE clothing_id = 1094
+- Get reviews for a product: SELECT * FROM feedback_submissions WHERE clothing_id = 1094 AND canonical_id IS NULL
 - Filter by age: SELECT * FROM feedback_submissions WHERE clothing_id = 1094 AND age BETWEEN 30 AND 40
 - Get average rating: SELECT AVG(rating) FROM feedback_submissions WHERE clothing_id = 1094""",
                     "parameters": {
@@ -104,26 +142,21 @@ Example queries:
         # print("OPENAI API: Calling with model:", model)
         print("OPENAI API: kwargs:", kwargs)
 
+        if deadline:
+            kwargs["timeout"] = deadline - time.monotonic()
         response = client.chat.completions.create(**kwargs)
+        usages.append(response.usage)
         
         # Check if tool was called
         if response.choices[0].message.tool_calls:
             tool_call = response.choices[0].message.tool_calls[0]
             
-            # Execute the SQL query
-            conn = sqlite3.connect('data/evals_demo.db')
-            cursor = conn.cursor()
-            results = None
+            # Execute the SQL query on a pooled read-only connection
             try:
                 args = json.loads(tool_call.function.arguments)
-                cursor.execute(args["sql_query"])
-                results = cursor.fetchall()
-                tool_result_text = "\n".join(str(row) for row in results)
+                tool_result_text = run_tool_query(args["sql_query"], deadline=deadline)
             except Exception as e:
                 tool_result_text = f"Error executing query: {e}"
-                results = []
-            finally:
-                conn.close()
             
             # print("OPENAI API: Tool results:", results)
             
@@ -135,35 +168,44 @@ Example queries:
                 "content": tool_result_text
             })
             
-            # Get OpenAI's final response with the tool results
+            # Get OpenAI's final response with the tool results (in what is left of the deadline)
+            remaining = {}
+            if deadline:
+                if time.monotonic() >= deadline:
+                    raise APITimeoutError(request=None)
+                remaining["timeout"] = deadline - time.monotonic()
             final_response = client.chat.completions.create(
                 model=model,
                 messages=messages,
-                max_tokens=2000
+                max_tokens=2000,
+                **remaining
             )
+            usages.append(final_response.usage)
             
             return {
                 "success": True,
                 "response": final_response.choices[0].message.content,
                 "model": model,
-                "tokens": {
-                    "input": response.usage.prompt_tokens + final_response.usage.prompt_tokens,
-                    "output": response.usage.completion_tokens + final_response.usage.completion_tokens
-                }
+                "tokens": usage_tokens(response.usage, final_response.usage)
             }
 
         return {
             "success": True,
             "response": response.choices[0].message.content,
             "model": model,
-            "tokens": {
-                "input": response.usage.prompt_tokens,
-                "output": response.usage.completion_tokens
-            }
+            "tokens": usage_tokens(response.usage)
         }
     
+    except APITimeoutError:
+        return {
+            "success": False,
+            "error": f"Timed out after {timeout}s" if timeout else "Request timed out",
+            "timed_out": True,
+            **partial_usage(model, usages)
+        }
     except Exception as e:
         return {
             "success": False,
-            "error": str(e)
+            "error": str(e),
+            **partial_usage(model, usages)
         }
@@ -0,0 +1,261 @@
+"""
+Precomputed per-product review digests
+
+Answering "Should I order 1094?" from raw rows means sending the model a
+handful of reviews and having it summarise them again on every request.
+This offline job condenses all reviews of each clothing_id into a short
+digest instead:
+  - rating summary and recommend rate
+  - sizing verdict ("runs small", "runs large", "true to size") from how
+    many reviews say so
+  - quality complaint themes (pilling, see-through, seams...) counted over
+    the 1-3 star reviews
+  - the most helpful positive and critical review as representative quotes
+
+Digests live in the product_digests table of the reviews database and are
+refreshed incrementally: only products with reviews newer than the last
+refresh are recomputed. They reach the model as review context (see
+retrieval.format_review_context) or through the database tool.
+
+Usage:
+    python product_digests.py [db_path] [--full]
+    python product_digests.py show 1094
+"""
+import json
+import re
+import sqlite3
+from collections import Counter
+from typing import Dict, List
+
+from db_pool import DEFAULT_DB_PATH, get_pool
+from near_duplicates import ensure_canonical_column
+
+# Sizing verdicts and the phrases that count as a vote for them
+SIZING_PATTERNS = {
+    "runs small": re.compile(
+        r"runs? (very |a bit |a little |really )?small|too (small|tight|snug)|size up|sized up|"
+        r"(ordered|order|get|got) (a |one )?(size )?(larger|bigger|size up)|could(n't| not) (zip|button)",
+        re.IGNORECASE
+    ),
+    "runs large": re.compile(
+        r"runs? (very |a bit |a little |really )?(large|big)|too (large|big|loose|baggy)|size down|sized down|"
+        r"(ordered|order|get|got) (a |one )?(size )?(smaller|size down)|tent[- ]like",
+        re.IGNORECASE
+    ),
+    "true to size": re.compile(r"true to size|\btts\b|fits? (perfectly|as expected)|my usual size", re.IGNORECASE)
+}
+
+# Share of sizing votes a verdict needs to be reported as the product's sizing
+SIZING_MIN_SHARE = 0.5
+
+# Complaint themes, counted over reviews rated at or below COMPLAINT_MAX_RATING
+QUALITY_THEMES = {
+    "thin / see-through": re.compile(r"see[- ]?through|transparent|sheer|too thin|thin (fabric|material)", re.IGNORECASE),
+    "pilling": re.compile(r"\bpill(s|ed|ing)?\b", re.IGNORECASE),
+    "seams / fraying / holes": re.compile(r"\bseams?\b|fray|unravel|\bholes?\b|ripped|\btore\b|\btorn\b", re.IGNORECASE),
+    "shrinks / changes in the wash": re.compile(r"shr[iu]nk|after (one|the first) wash|dry clean", re.IGNORECASE),
+    "wrinkles": re.compile(r"wrinkl", re.IGNORECASE),
+    "colour differs from photos": re.compile(
+        r"colou?r (was|is) (not|nothing|different|off)|nothing like the (picture|photo)|not as pictured|"
+        r"colou?r (completely )?changed",
+        re.IGNORECASE
+    ),
+    "zipper / buttons": re.compile(r"\bzip(per)?\b|buttons? (fell|came|popped)", re.IGNORECASE),
+    "unflattering cut": re.compile(r"unflattering|boxy|bunch(es|ed)?|tent[- ]like|frumpy", re.IGNORECASE)
+}
+COMPLAINT_MAX_RATING = 3
+
+# Themes listed per digest
+MAX_THEMES = 3
+
+# Characters kept per representative quote
+QUOTE_CHARS = 200
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def ensure_digest_table(conn: sqlite3.Connection):
+    """Create product_digests in databases created before it existed"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS product_digests (
+            clothing_id INTEGER PRIMARY KEY,
+            review_count INTEGER NOT NULL,
+            max_review_id INTEGER NOT NULL,
+            summary TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+
+def _quote(review: Dict) -> Dict:
+    text = " ".join((review["review_text"] or "").split())
+    if len(text) > QUOTE_CHARS:
+        # Cut at the last sentence end that fits, or mid-sentence if there is none
+        cut = [m.start() for m in _SENTENCE_END_RE.finditer(text[:QUOTE_CHARS])]
+        text = text[:cut[-1]] if cut else text[:QUOTE_CHARS - 1].rstrip() + "…"
+    return {"text": text, "rating": review["rating"], "helpful": review["positive_feedback_count"] or 0}
+
+
+def build_digest(clothing_id: int, reviews: List[Dict]) -> Dict:
+    """
+    Condense one product's reviews into a digest
+
+    Args:
+        clothing_id: Product the reviews belong to
+        reviews: Dicts with rating, recommended_ind, positive_feedback_count,
+            title and review_text
+
+    Returns:
+        Digest dict (see format_digest for how it is rendered)
+    """
+    ratings = Counter(r["rating"] for r in reviews if r["rating"] is not None)
+    rated = sum(ratings.values())
+
+    sizing = Counter()
+    themes = Counter()
+    for review in reviews:
+        text = f"{review['title'] or ''}. {review['review_text'] or ''}"
+        sizing.update(verdict for verdict, pattern in SIZING_PATTERNS.items() if pattern.search(text))
+        if (review["rating"] or 0) <= COMPLAINT_MAX_RATING:
+            themes.update(theme for theme, pattern in QUALITY_THEMES.items() if pattern.search(text))
+
+    sizing_votes = sum(sizing.values())
+    if not sizing_votes:
+        sizing_verdict = "no sizing feedback"
+    else:
+        verdict, votes = sizing.most_common(1)[0]
+        sizing_verdict = verdict if votes / sizing_votes >= SIZING_MIN_SHARE else "mixed sizing feedback"
+
+    by_helpful = sorted(reviews, key=lambda r: r["positive_feedback_count"] or 0, reverse=True)
+    positive = next((r for r in by_helpful if (r["rating"] or 0) > COMPLAINT_MAX_RATING), None)
+    critical = next((r for r in by_helpful if (r["rating"] or 0) <= COMPLAINT_MAX_RATING), None)
+
+    return {
+        "clothing_id": clothing_id,
+        "review_count": len(reviews),
+        "average_rating": round(sum(k * v for k, v in ratings.items()) / rated, 2) if rated else None,
+        "ratings": {str(k): ratings[k] for k in sorted(ratings, reverse=True)},
+        "recommend_rate": round(sum(1 for r in reviews if r["recommended_ind"]) / len(reviews), 2) if reviews else None,
+        "sizing": {"verdict": sizing_verdict, "votes": dict(sizing.most_common())},
+        "complaints": dict(themes.most_common(MAX_THEMES)),
+        "complaint_reviews": sum(1 for r in reviews if (r["rating"] or 0) <= COMPLAINT_MAX_RATING),
+        "quotes": {
+            "positive": _quote(positive) if positive else None,
+            "critical": _quote(critical) if critical else None
+        }
+    }
+
+
+def format_digest(digest: Dict) -> str:
+    """Render a digest as a few compact lines for the model"""
+    lines = [f"Review digest for clothing ID {digest['clothing_id']} "
+             f"({digest['review_count']} reviews, precomputed from the reviews database):"]
+    if digest["average_rating"] is not None:
+        stars = ", ".join(f"{k}★ {v}" for k, v in digest["ratings"].items())
+        lines.append(f"- Rating {digest['average_rating']}/5 ({stars}); "
+                     f"{digest['recommend_rate']:.0%} recommend")
+    votes = digest["sizing"]["votes"]
+    detail = f" ({', '.join(f'{v} say {k}' for k, v in votes.items())})" if votes else ""
+    lines.append(f"- Sizing: {digest['sizing']['verdict']}{detail}")
+    if digest["complaints"]:
+        themes = ", ".join(f"{theme} ({n})" for theme, n in digest["complaints"].items())
+        lines.append(f"- Quality complaints in {digest['complaint_reviews']} reviews rated 1-3★: {themes}")
+    else:
+        lines.append("- No recurring quality complaints")
+    for kind in ("positive", "critical"):
+        quote = digest["quotes"][kind]
+        if quote:
+            lines.append(f"- Most helpful {kind} review [{quote['rating']}★, {quote['helpful']} helpful]: "
+                         f"\"{quote['text']}\"")
+    return "\n".join(lines)
+
+
+def _product_reviews(conn: sqlite3.Connection, clothing_id: int) -> List[Dict]:
+    columns = ["rating", "recommended_ind", "positive_feedback_count", "title", "review_text"]
+    rows = conn.execute(f"""
+        SELECT {', '.join(columns)} FROM feedback_submissions
+        WHERE clothing_id = ? AND canonical_id IS NULL
+    """, (clothing_id,)).fetchall()
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def refresh_digests(db_path=DEFAULT_DB_PATH, full: bool = False) -> int:
+    """
+    Recompute the digests of products with new reviews
+
+    Args:
+        db_path: Path to SQLite database
+        full: Recompute every product (e.g. after near_duplicates.py has
+            re-marked copies)
+
+    Returns:
+        Number of digests written
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_canonical_column(conn)
+        ensure_digest_table(conn)
+        watermark = 0 if full else conn.execute(
+            "SELECT COALESCE(MAX(max_review_id), 0) FROM product_digests"
+        ).fetchone()[0]
+        changed = conn.execute("""
+            SELECT clothing_id, MAX(id) FROM feedback_submissions
+            WHERE clothing_id IN (SELECT DISTINCT clothing_id FROM feedback_submissions WHERE id > ?)
+            GROUP BY clothing_id
+        """, (watermark,)).fetchall()
+
+        written = 0
+        for clothing_id, max_review_id in changed:
+            reviews = _product_reviews(conn, clothing_id)
+            if not reviews:
+                continue
+            digest = build_digest(clothing_id, reviews)
+            conn.execute("""
+                INSERT OR REPLACE INTO product_digests
+                    (clothing_id, review_count, max_review_id, summary, digest, updated_at)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, (clothing_id, len(reviews), max_review_id, format_digest(digest), json.dumps(digest)))
+            written += 1
+        conn.commit()
+        return written
+    finally:
+        conn.close()
+
+
+def load_digest(clothing_id: int, db_path=DEFAULT_DB_PATH) -> Dict:
+    """
+    A product's digest, read through the shared read-only pool
+
+    Returns:
+        Digest dict with its rendered 'summary', or None if the product has
+        no digest (or the database has none yet)
+    """
+    try:
+        rows = get_pool(db_path).execute(
+            "SELECT summary, digest FROM product_digests WHERE clothing_id = ?", (clothing_id,)
+        )
+    except sqlite3.OperationalError:
+        return None
+    if not rows:
+        return None
+    summary, digest = rows[0]
+    return {**json.loads(digest), "summary": summary}
+
+
+if __name__ == "__main__":
+    import sys
+
+    args = [a for a in sys.argv[1:] if a != "--full"]
+    if args and args[0] == "show":
+        if len(args) < 2:
+            print("Usage: python product_digests.py show <clothing_id> [db_path]")
+            sys.exit(1)
+        digest = load_digest(int(args[1]), args[2] if len(args) > 2 else DEFAULT_DB_PATH)
+        print(digest["summary"] if digest else f"No digest for clothing ID {args[1]}")
+    else:
+        db_path = args[0] if args else DEFAULT_DB_PATH
+        full = "--full" in sys.argv
+        print(f"🧾 {'Rebuilding' if full else 'Refreshing'} product digests in {db_path}...")
+        print(f"✓ {refresh_digests(db_path, full)} product digests written")
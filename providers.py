@@ -0,0 +1,247 @@
+"""
+Provider dispatch shared by the app and eval runners
+
+Calls can carry a deadline (a time.monotonic() value shared by everything a
+turn does: escalations, hedges and the tool round-trip). With hedging on, a
+call that runs longer than the HEDGE_PERCENTILE latency of recent calls to
+the same model gets a duplicate request, and whichever answers first wins.
+The losing request cannot be cancelled once sent: it runs to completion (or
+the deadline) and is billed, so its usage is handed to an on_late_usage
+callback when it finishes.
+"""
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from typing import Callable, Dict, List
+
+from claude_api import call_claude
+from openai_api import call_openai
+
+PROVIDER_CALLS = {
+    "Anthropic": call_claude,
+    "OpenAI": call_openai
+}
+
+# Model each provider call uses when none is given (call_claude / call_openai defaults)
+DEFAULT_MODELS = {
+    "Anthropic": "claude-haiku-4-5-20251001",
+    "OpenAI": "gpt-4o-mini"
+}
+
+# Models tried in order by routed calls: the cheapest first, escalating when an answer fails
+MODEL_TIERS = {
+    "Anthropic": ["claude-haiku-4-5-20251001", "claude-sonnet-4-5-20250929"],
+    "OpenAI": ["gpt-4o-mini", "gpt-4o"]
+}
+
+# Default deadlines (seconds) for one provider call and for a whole turn
+DEFAULT_CALL_TIMEOUT = 60
+DEFAULT_TURN_DEADLINE = 120
+
+# Recent successful latencies kept per provider, model and tool use
+LATENCY_WINDOW = 200
+
+# Latencies needed before hedging trusts the percentile
+HEDGE_MIN_SAMPLES = 20
+
+# A duplicate request is sent once a call has run longer than this percentile of recent calls
+HEDGE_PERCENTILE = 95
+
+
+class LatencyTracker:
+    """Recent call latencies per (provider, model, tool use), shared across threads"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: tuple, seconds: float):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key: tuple, pct: float = HEDGE_PERCENTILE, min_samples: int = HEDGE_MIN_SAMPLES) -> float:
+        """Latency below which pct% of recent calls finished, or None with too few samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(pct / 100 * len(samples)) - 1)]
+
+
+latency_tracker = LatencyTracker()
+
+
+def _attempt(brand: str, deadline: float, kwargs: Dict) -> Dict:
+    """One request, given whatever is left of the deadline (and at most the call's own timeout)"""
+    started = time.perf_counter()
+    if deadline is not None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return {"success": False, "error": "Turn deadline passed before the call started",
+                    "timed_out": True, "latency": 0.0}
+        kwargs = {**kwargs, "timeout": min(kwargs.get("timeout") or remaining, remaining)}
+    result = PROVIDER_CALLS[brand](**kwargs)
+    result["latency"] = time.perf_counter() - started
+    return result
+
+
+def _report_late_usage(brand: str, on_late_usage: Callable[[str, Dict], None], future):
+    """Hand a losing attempt's result to on_late_usage once it has finished (if it used any tokens)"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    result = future.result()
+    if result.get("tokens"):
+        on_late_usage(brand, result)
+
+
+def _hedged_attempt(brand: str, deadline: float, kwargs: Dict, hedge_after: float,
+                    on_late_usage: Callable[[str, Dict], None] = None) -> Dict:
+    """Send a duplicate if the first request outlives hedge_after; the first success wins"""
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hedge")
+    try:
+        attempts = [executor.submit(_attempt, brand, deadline, kwargs)]
+        done, _ = wait(attempts, timeout=hedge_after)
+        if not done:
+            attempts.append(executor.submit(_attempt, brand, deadline, kwargs))
+        pending = set(attempts)
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # Prefer a success; a failure only counts once nothing else is in flight
+            finished = sorted(done, key=attempts.index)
+            winner = next((f for f in finished if f.result()["success"]), None)
+            if winner is None and not pending:
+                winner = finished[-1]
+            if winner is not None:
+                result = winner.result()
+                result["hedge"] = {"after": hedge_after, "sent": len(attempts) > 1,
+                                   "won_by_duplicate": winner is not attempts[0]}
+                if on_late_usage is not None:
+                    # The loser is still billed; report it now or when it finishes
+                    for attempt in attempts:
+                        if attempt is not winner:
+                            attempt.add_done_callback(partial(_report_late_usage, brand, on_late_usage))
+                return result
+    finally:
+        # The loser keeps running (an HTTP request cannot be recalled) until it
+        # answers or the shared deadline passes; this only stops the pool waiting for it
+        executor.shutdown(wait=False)
+
+
+def call_provider(brand: str, deadline: float = None, hedge: bool = False,
+                  on_late_usage: Callable[[str, Dict], None] = None, **kwargs) -> Dict:
+    """
+    Call one provider and time it
+
+    Args:
+        brand: "Anthropic" or "OpenAI"
+        deadline: Optional time.monotonic() value by which the call must end
+            (caps the call's own timeout)
+        hedge: Send a duplicate request if this one is slower than
+            HEDGE_PERCENTILE of recent calls to the same model
+        on_late_usage: Called with (brand, result) for the losing request of
+            a hedge, from a worker thread, once it finishes; its tokens are
+            billed but are not part of the returned result
+        **kwargs: Arguments for call_claude / call_openai
+
+    Returns:
+        The provider's result dict plus 'provider' and 'latency' (seconds),
+        and 'hedge' if hedging was possible
+    """
+    started = time.perf_counter()
+    key = (brand, kwargs.get("model") or DEFAULT_MODELS[brand], bool(kwargs.get("use_tool")))
+    hedge_after = latency_tracker.percentile(key) if hedge else None
+    if hedge_after is None:
+        result = _attempt(brand, deadline, kwargs)
+    else:
+        result = _hedged_attempt(brand, deadline, kwargs, hedge_after, on_late_usage)
+    if result.get("success"):
+        latency_tracker.record(key, result["latency"])
+    result["provider"] = brand
+    result["latency"] = time.perf_counter() - started
+    return result
+
+
+def with_deadline(requests: Dict[str, Dict], turn_deadline: float = None, hedge: bool = False,
+                  on_late_usage: Callable[[str, Dict], None] = None) -> Dict[str, Dict]:
+    """
+    Start a turn's clock: add a shared deadline (and hedging) to each brand's call kwargs
+
+    Args:
+        requests: Mapping of brand to call_provider keyword arguments
+        turn_deadline: Seconds from now the whole turn may take (None for no limit)
+        hedge: Hedge slow calls (see call_provider)
+        on_late_usage: Receives the usage of hedged requests that lost (see call_provider)
+    """
+    deadline = time.monotonic() + turn_deadline if turn_deadline else None
+    return {brand: {**kwargs, "deadline": deadline, "hedge": hedge, "on_late_usage": on_late_usage}
+            for brand, kwargs in requests.items()}
+
+
+def call_routed(brand: str, passes: Callable[[Dict], bool], tiers: List[str] = None, **kwargs) -> Dict:
+    """
+    Answer with the cheapest model, re-asking stronger ones only while the answer fails
+
+    Args:
+        brand: "Anthropic" or "OpenAI"
+        passes: Scores a call_provider result right away (e.g. the rule-based
+            assertions); a failing answer is escalated to the next tier
+        tiers: Models to try in order (defaults to MODEL_TIERS[brand])
+        **kwargs: Arguments for call_claude / call_openai (without model)
+
+    Returns:
+        The accepted (or last tier's) call_provider result, plus 'tier' (0 is
+        the cheapest), 'escalations' (model, tokens and latency of each tier
+        that failed) and 'latency' including those failed tiers
+    """
+    tiers = tiers or MODEL_TIERS[brand]
+    deadline = kwargs.get("deadline")
+    escalations = []
+    for tier, model in enumerate(tiers):
+        result = call_provider(brand, model=model, **kwargs)
+        result.setdefault("model", model)
+        if tier == len(tiers) - 1 or passes(result):
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            # No time left for a stronger model; keep the answer we have
+            break
+        escalations.append({"model": result["model"], "tokens": result.get("tokens"), "latency": result["latency"]})
+    result["tier"] = tier
+    result["escalations"] = escalations
+    result["latency"] += sum(e["latency"] for e in escalations)
+    return result
+
+
+def call_providers(requests: Dict[str, Dict], route: Dict[str, Callable[[Dict], bool]] = None) -> Dict[str, Dict]:
+    """
+    Call several providers at the same time
+
+    The calls run on separate threads (the SDKs block on network I/O), so
+    the total time is that of the slowest call rather than the sum.
+
+    Args:
+        requests: Mapping of brand to call_provider keyword arguments
+        route: Optional mapping of brand to a pass check; those brands are
+            called with call_routed (cheapest model first)
+
+    Returns:
+        Mapping of brand to call_provider result
+    """
+    def call(brand, kwargs):
+        if route and brand in route:
+            return call_routed(brand, route[brand], **kwargs)
+        return call_provider(brand, **kwargs)
+
+    if len(requests) == 1:
+        (brand, kwargs), = requests.items()
+        return {brand: call(brand, kwargs)}
+
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        futures = {
+            brand: executor.submit(call, brand, kwargs)
+            for brand, kwargs in requests.items()
+        }
+        return {brand: future.result() for brand, future in futures.items()}
@@ -0,0 +1,247 @@
+"""
+Deduplicated, compressed archive of model responses
+
+Running the same suite over many prompt variants produces many identical
+or near-identical answers. Each distinct response body is stored once,
+keyed by its SHA-256, and run records (eval history, batch state files)
+keep only that hash.
+
+Bodies are zlib-compressed against a shared preset dictionary built from
+phrases that recur across stored responses ("Hi Sarah", buy links, sizing
+boilerplate...), which is where short, similar answers get most of their
+savings. Dictionaries are versioned, so retraining never invalidates older
+bodies.
+
+Usage:
+    python response_archive.py stats
+    python response_archive.py train
+"""
+import hashlib
+import sqlite3
+import threading
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List
+
+DEFAULT_ARCHIVE_PATH = Path(__file__).parent / "data" / "responses.db"
+
+# zlib only looks back 32 KB, so a larger dictionary would be wasted
+MAX_DICTIONARY_BYTES = 32 * 1024
+
+# Words per phrase considered for the dictionary
+PHRASE_WORDS = 6
+
+# Responses sampled when training a dictionary
+TRAINING_SAMPLE_SIZE = 2000
+
+COMPRESSION_LEVEL = 9
+
+# Rows fetched per query when scanning the archive
+SCAN_CHUNK_SIZE = 1000
+
+_archive_lock = threading.Lock()
+
+
+def response_hash(text: str) -> str:
+    """Content hash a response is stored under"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def train_dictionary(samples: Iterable[str], max_bytes: int = MAX_DICTIONARY_BYTES) -> bytes:
+    """
+    Build a zlib preset dictionary from sample responses
+
+    Keeps the word phrases that occur in more than one sample, ranked by the
+    bytes they would save (occurrences x length). The most valuable go last,
+    where zlib finds matches most cheaply.
+    """
+    counts = Counter()
+    for text in samples:
+        words = text.split()
+        counts.update({
+            " ".join(words[i:i + PHRASE_WORDS])
+            for i in range(max(len(words) - PHRASE_WORDS + 1, 1))
+        })
+    common = sorted(
+        (phrase for phrase, n in counts.items() if n > 1),
+        key=lambda phrase: counts[phrase] * len(phrase),
+        reverse=True
+    )
+
+    chosen, size = [], 0
+    for phrase in common:
+        encoded = phrase.encode("utf-8") + b" "
+        if size + len(encoded) > max_bytes:
+            break
+        chosen.append(encoded)
+        size += len(encoded)
+    return b"".join(reversed(chosen))
+
+
+class ResponseArchive:
+    """SQLite store of distinct response bodies, keyed by content hash"""
+
+    def __init__(self, db_path=DEFAULT_ARCHIVE_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._dictionaries = {}
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dictionaries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    data BLOB NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    hash TEXT PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    dictionary_id INTEGER NOT NULL DEFAULT 0,
+                    raw_size INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        """Connection that commits on success and is always closed"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _dictionary(self, conn, dictionary_id: int) -> bytes:
+        if dictionary_id == 0:
+            return b""
+        if dictionary_id not in self._dictionaries:
+            row = conn.execute("SELECT data FROM dictionaries WHERE id = ?", (dictionary_id,)).fetchone()
+            self._dictionaries[dictionary_id] = row[0]
+        return self._dictionaries[dictionary_id]
+
+    def _current_dictionary(self, conn) -> tuple:
+        row = conn.execute("SELECT MAX(id) FROM dictionaries").fetchone()
+        dictionary_id = row[0] or 0
+        return dictionary_id, self._dictionary(conn, dictionary_id)
+
+    def _decompress(self, conn, body: bytes, dictionary_id: int) -> str:
+        dictionary = self._dictionary(conn, dictionary_id)
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        return (decompressor.decompress(body) + decompressor.flush()).decode("utf-8")
+
+    def put_many(self, texts: Iterable[str]) -> List[str]:
+        """
+        Store responses, skipping bodies that are already archived
+
+        Returns:
+            The content hash of each text, in order
+        """
+        texts = list(texts)
+        hashes = [response_hash(text) for text in texts]
+        with _archive_lock, self._connect() as conn:
+            dictionary_id, dictionary = self._current_dictionary(conn)
+            placeholders = ",".join("?" * len(set(hashes)))
+            known = {row[0] for row in conn.execute(
+                f"SELECT hash FROM responses WHERE hash IN ({placeholders})", list(set(hashes))
+            )} if hashes else set()
+
+            rows = {}
+            for text, digest in zip(texts, hashes):
+                if digest in known or digest in rows:
+                    continue
+                compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=dictionary) if dictionary \
+                    else zlib.compressobj(COMPRESSION_LEVEL)
+                body = compressor.compress(text.encode("utf-8")) + compressor.flush()
+                rows[digest] = (digest, body, dictionary_id, len(text.encode("utf-8")))
+            conn.executemany(
+                "INSERT OR IGNORE INTO responses (hash, body, dictionary_id, raw_size) VALUES (?, ?, ?, ?)",
+                rows.values()
+            )
+        return hashes
+
+    def put(self, text: str) -> str:
+        """Store one response and return its content hash"""
+        return self.put_many([text])[0]
+
+    def get_many(self, hashes: List[str]) -> Dict[str, str]:
+        """Response texts by hash (unknown hashes are left out)"""
+        if not hashes:
+            return {}
+        with self._connect() as conn:
+            placeholders = ",".join("?" * len(hashes))
+            rows = conn.execute(
+                f"SELECT hash, body, dictionary_id FROM responses WHERE hash IN ({placeholders})", list(hashes)
+            ).fetchall()
+            return {digest: self._decompress(conn, body, dictionary_id) for digest, body, dictionary_id in rows}
+
+    def get(self, digest: str) -> str:
+        """One response text by hash, or None"""
+        return self.get_many([digest]).get(digest)
+
+    def iter_responses(self) -> Iterator[tuple]:
+        """Yield (hash, text) for every stored response, e.g. to re-score them all"""
+        last_rowid = 0
+        with self._connect() as conn:
+            while True:
+                rows = conn.execute("""
+                    SELECT rowid, hash, body, dictionary_id FROM responses
+                    WHERE rowid > ? ORDER BY rowid LIMIT ?
+                """, (last_rowid, SCAN_CHUNK_SIZE)).fetchall()
+                if not rows:
+                    break
+                for rowid, digest, body, dictionary_id in rows:
+                    yield digest, self._decompress(conn, body, dictionary_id)
+                last_rowid = rows[-1][0]
+
+    def train(self, sample_size: int = TRAINING_SAMPLE_SIZE) -> int:
+        """
+        Build a new shared dictionary from the newest responses
+
+        Responses stored from now on are compressed with it; older ones keep
+        the dictionary they were written with.
+
+        Returns:
+            The new dictionary's size in bytes (0 if there was too little data)
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT body, dictionary_id FROM responses ORDER BY rowid DESC LIMIT ?", (sample_size,)
+            ).fetchall()
+            samples = [self._decompress(conn, body, dictionary_id) for body, dictionary_id in rows]
+        dictionary = train_dictionary(samples)
+        if dictionary:
+            with _archive_lock, self._connect() as conn:
+                conn.execute("INSERT INTO dictionaries (data) VALUES (?)", (dictionary,))
+        return len(dictionary)
+
+    def stats(self) -> Dict:
+        """Counts and sizes: distinct responses, raw bytes and stored bytes"""
+        with self._connect() as conn:
+            count, raw, stored = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(LENGTH(body)), 0) FROM responses"
+            ).fetchone()
+            dictionaries = conn.execute("SELECT COUNT(*) FROM dictionaries").fetchone()[0]
+        return {"responses": count, "raw_bytes": raw, "stored_bytes": stored, "dictionaries": dictionaries}
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("stats", "train"):
+        print("Usage:")
+        print("  python response_archive.py stats")
+        print("  python response_archive.py train")
+        sys.exit(1)
+
+    archive = ResponseArchive()
+    if sys.argv[1] == "train":
+        size = archive.train()
+        print(f"✓ Trained a {size}-byte dictionary" if size else "Not enough repeated text to train a dictionary yet")
+    stats = archive.stats()
+    ratio = stats["raw_bytes"] / stats["stored_bytes"] if stats["stored_bytes"] else 0
+    print(f"📦 {stats['responses']} distinct responses, {stats['raw_bytes']:,} bytes raw, "
+          f"{stats['stored_bytes']:,} bytes stored ({ratio:.1f}x), {stats['dictionaries']} dictionaries")
@@ -0,0 +1,322 @@
+"""
+Offline vector retrieval index over customer reviews
+
+Builds hashed TF-IDF vectors (see similarity.py) for every canonical row
+of feedback_submissions (near-duplicate copies are skipped, see
+near_duplicates.py) and stores them as NumPy arrays that are memory-mapped
+at query time. Rows are sorted by clothing_id, so restricting a search to
+one product is a binary search plus a slice. The top-k reviews are passed
+to the providers as review_context, which answers most questions without a
+second, tool-driven model call.
+
+meta.json records the canonical row count and highest canonical review id
+the index was built at; once the database's index_watermark differs (reviews
+ingested, copies re-marked), the index is stale and should be rebuilt.
+
+Usage:
+    python retrieval.py build [db_path]
+    python retrieval.py query "Does 829 have quality issues?" [clothing_id]
+"""
+import json
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from db_pool import DEFAULT_DB_PATH, get_pool
+from near_duplicates import ensure_canonical_column
+from similarity import HashingVectorizer
+
+DEFAULT_INDEX_DIR = Path(__file__).parent / "data" / "review_index"
+DEFAULT_TOP_K = 5
+
+# Rows vectorized per chunk while building, to bound memory on large tables
+BUILD_CHUNK_SIZE = 5000
+
+# Index files, replaced (not overwritten in place) on rebuild so open memory maps stay valid
+INDEX_FILES = ("vectors.npy", "review_ids.npy", "clothing_ids.npy", "idf.npy")
+
+_CLOTHING_ID_RE = re.compile(r"(?:clothing\s*id|product\s*id|#)\s*(\d+)", re.IGNORECASE)
+_NUMBER_RE = re.compile(r"(?<![\d-])\d{2,6}(?![\d-])")
+
+
+def _review_text(title, review_text) -> str:
+    return f"{title}. {review_text}" if title else (review_text or "")
+
+
+def build_index(db_path=DEFAULT_DB_PATH, index_dir=DEFAULT_INDEX_DIR, n_features: int = 1024) -> Dict:
+    """
+    Build the review index from the canonical reviews in feedback_submissions
+
+    Makes two streaming passes over the table (document frequencies, then
+    vectors), writing vectors straight into a memory-mapped .npy file.
+    Near-duplicate copies are left out, so they cannot fill the top-k.
+
+    Args:
+        db_path: Path to SQLite database
+        index_dir: Directory the index files are written to
+        n_features: Vector dimensionality
+
+    Returns:
+        Index metadata dict
+    """
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    vectorizer = HashingVectorizer(n_features=n_features)
+
+    # The read-only pool cannot add canonical_id to databases created before it existed
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_canonical_column(conn)
+    finally:
+        conn.close()
+
+    for name in INDEX_FILES:
+        (index_dir / name).unlink(missing_ok=True)
+
+    with get_pool(db_path).connection() as conn:
+        total, max_review_id = conn.execute(
+            "SELECT COUNT(*), COALESCE(MAX(id), 0) FROM feedback_submissions WHERE canonical_id IS NULL"
+        ).fetchone()
+        query = """
+            SELECT id, clothing_id, title, review_text
+            FROM feedback_submissions
+            WHERE canonical_id IS NULL
+            ORDER BY clothing_id, id
+        """
+
+        # Pass 1: document frequencies for IDF weighting
+        df = np.zeros(n_features, dtype=np.int64)
+        cursor = conn.execute(query)
+        while True:
+            rows = cursor.fetchmany(BUILD_CHUNK_SIZE)
+            if not rows:
+                break
+            df += vectorizer.document_frequencies([_review_text(r[2], r[3]) for r in rows])
+        vectorizer.set_idf(df, total)
+
+        # Pass 2: vectors, IDs and clothing IDs in clothing_id order
+        vectors = np.lib.format.open_memmap(
+            index_dir / "vectors.npy", mode="w+", dtype=np.float32, shape=(total, n_features)
+        )
+        review_ids = np.zeros(total, dtype=np.int64)
+        clothing_ids = np.zeros(total, dtype=np.int64)
+        offset = 0
+        cursor = conn.execute(query)
+        while True:
+            rows = cursor.fetchmany(BUILD_CHUNK_SIZE)
+            if not rows:
+                break
+            end = offset + len(rows)
+            vectors[offset:end] = vectorizer.transform([_review_text(r[2], r[3]) for r in rows])
+            review_ids[offset:end] = [r[0] for r in rows]
+            # NULL clothing IDs sort first; -1 keeps them out of product searches
+            clothing_ids[offset:end] = [r[1] if r[1] is not None else -1 for r in rows]
+            offset = end
+        vectors.flush()
+        del vectors
+
+    np.save(index_dir / "review_ids.npy", review_ids)
+    np.save(index_dir / "clothing_ids.npy", clothing_ids)
+    np.save(index_dir / "idf.npy", vectorizer.idf)
+    meta = {
+        "db_path": str(db_path),
+        "rows": int(total),
+        "max_review_id": int(max_review_id),
+        "n_features": n_features,
+        "built_at": datetime.now().isoformat(timespec="seconds")
+    }
+    with open(index_dir / "meta.json", "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def index_watermark(db_path=DEFAULT_DB_PATH) -> tuple:
+    """
+    Canonical row count and highest canonical review id of the database
+
+    Returns:
+        (rows, max_review_id), or None if the database predates canonical_id
+    """
+    try:
+        rows = get_pool(db_path).execute(
+            "SELECT COUNT(*), COALESCE(MAX(id), 0) FROM feedback_submissions WHERE canonical_id IS NULL"
+        )
+    except sqlite3.OperationalError:
+        return None
+    return tuple(rows[0])
+
+
+def index_is_stale(index_dir=DEFAULT_INDEX_DIR, watermark: tuple = None, db_path=DEFAULT_DB_PATH) -> bool:
+    """
+    Whether the index is missing or was built at a different watermark
+
+    Args:
+        index_dir: Directory of the index
+        watermark: index_watermark of the database (read from db_path if omitted)
+        db_path: Path to SQLite database
+    """
+    meta_path = Path(index_dir) / "meta.json"
+    if not meta_path.exists():
+        return True
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+    if watermark is None:
+        watermark = index_watermark(db_path)
+    return watermark is None or (meta.get("rows"), meta.get("max_review_id")) != tuple(watermark)
+
+
+class ReviewIndex:
+    """Memory-mapped review index built by build_index"""
+
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR, db_path: str = None):
+        index_dir = Path(index_dir)
+        with open(index_dir / "meta.json", "r") as f:
+            self.meta = json.load(f)
+        self.db_path = db_path or self.meta["db_path"]
+        self.vectors = np.load(index_dir / "vectors.npy", mmap_mode="r")
+        self.review_ids = np.load(index_dir / "review_ids.npy", mmap_mode="r")
+        self.clothing_ids = np.load(index_dir / "clothing_ids.npy", mmap_mode="r")
+        self.vectorizer = HashingVectorizer(n_features=self.meta["n_features"])
+        self.vectorizer.idf = np.load(index_dir / "idf.npy")
+
+    def has_product(self, clothing_id: int) -> bool:
+        """Whether any indexed review belongs to this product"""
+        i = int(np.searchsorted(self.clothing_ids, clothing_id, side="left"))
+        return i < len(self.clothing_ids) and int(self.clothing_ids[i]) == clothing_id
+
+    def search(self, question: str, clothing_id: int = None, k: int = DEFAULT_TOP_K) -> List[tuple]:
+        """
+        Find the k reviews most similar to a question
+
+        Args:
+            question: User question
+            clothing_id: Only search reviews of this product (None searches everything)
+            k: Number of reviews to return
+
+        Returns:
+            List of (review_id, score) tuples, best first
+        """
+        start, end = 0, len(self.review_ids)
+        if clothing_id is not None:
+            start = int(np.searchsorted(self.clothing_ids, clothing_id, side="left"))
+            end = int(np.searchsorted(self.clothing_ids, clothing_id, side="right"))
+        if start >= end:
+            return []
+
+        query = self.vectorizer.transform([question])[0]
+        scores = self.vectors[start:end] @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.review_ids[start + i]), float(scores[i])) for i in top]
+
+    def fetch_reviews(self, review_ids: List[int]) -> List[Dict]:
+        """Load review rows by ID, preserving the given order"""
+        if not review_ids:
+            return []
+        placeholders = ",".join("?" * len(review_ids))
+        rows = get_pool(self.db_path).execute(f"""
+            SELECT id, clothing_id, title, review_text, rating, recommended_ind,
+                   positive_feedback_count, age
+            FROM feedback_submissions
+            WHERE id IN ({placeholders})
+        """, review_ids)
+
+        columns = ["id", "clothing_id", "title", "review_text", "rating",
+                   "recommended_ind", "positive_feedback_count", "age"]
+        by_id = {row[0]: dict(zip(columns, row)) for row in rows}
+        return [by_id[i] for i in review_ids if i in by_id]
+
+
+def extract_clothing_id(question: str, index: "ReviewIndex" = None) -> int:
+    """
+    Pull a clothing ID out of a question like 'Should I order clothing ID 1094?'
+
+    With an index, a bare number ('Does 829 have quality issues?') is also
+    accepted if the index has reviews for that product.
+    """
+    match = _CLOTHING_ID_RE.search(question or "")
+    if match:
+        return int(match.group(1))
+    if index is not None:
+        for number in _NUMBER_RE.findall(question or ""):
+            if index.has_product(int(number)):
+                return int(number)
+    return None
+
+
+def retrieve_review_context(
+    index: ReviewIndex,
+    question: str,
+    clothing_id: int = None,
+    k: int = DEFAULT_TOP_K
+) -> Dict:
+    """
+    Build a review_context dict for call_claude / call_openai
+
+    Args:
+        index: Loaded ReviewIndex
+        question: User question
+        clothing_id: Product to search (parsed from the question if omitted)
+        k: Number of reviews to include
+
+    Returns:
+        Dict with 'clothing_id' and 'reviews', or None if nothing relevant was found
+    """
+    if clothing_id is None:
+        clothing_id = extract_clothing_id(question, index)
+    hits = index.search(question, clothing_id=clothing_id, k=k)
+    if not hits:
+        return None
+    return {
+        "clothing_id": clothing_id,
+        "reviews": index.fetch_reviews([review_id for review_id, _ in hits])
+    }
+
+
+def format_review_context(review_context: Dict) -> str:
+    """Render review_context (a product digest and/or reviews) as a compact block to append to the user message"""
+    if not review_context:
+        return ""
+    digest = review_context.get("digest")
+    if not review_context.get("reviews"):
+        return digest["summary"] if digest else ""
+    header = "Relevant customer reviews"
+    if review_context.get("clothing_id") is not None:
+        header += f" for clothing ID {review_context['clothing_id']}"
+    lines = [f"{header} (retrieved from the reviews database; query the database only if you need more):"]
+    for review in review_context["reviews"]:
+        recommended = "recommends" if review.get("recommended_ind") else "does not recommend"
+        title = f" \"{review['title']}\"" if review.get("title") else ""
+        lines.append(
+            f"- [{review.get('rating')}★, {recommended}, {review.get('positive_feedback_count') or 0} helpful]"
+            f"{title} {review['review_text']}"
+        )
+    if digest:
+        lines.insert(0, digest["summary"])
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("build", "query"):
+        print("Usage:")
+        print("  python retrieval.py build [db_path]")
+        print("  python retrieval.py query \"<question>\" [clothing_id]")
+        sys.exit(1)
+
+    if sys.argv[1] == "build":
+        db_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_DB_PATH
+        print(f"🔨 Building review index from {db_path}...")
+        meta = build_index(db_path)
+        print(f"✓ Indexed {meta['rows']} reviews into {DEFAULT_INDEX_DIR}")
+    else:
+        question = sys.argv[2]
+        clothing_id = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        context = retrieve_review_context(ReviewIndex(), question, clothing_id)
+        print(format_review_context(context) or "No matching reviews")
@@ -0,0 +1,147 @@
+"""
+Repeated-sampling flakiness mode with sequential early stopping
+
+The same prompt can pass on one try and fail on the next, so a single call
+gives a noisy verdict. sample_pass_rate calls the model repeatedly (several
+calls in flight at once), tracks a Wilson confidence interval on the pass
+rate, and stops as soon as the answer is settled: the interval is narrow
+enough, it lies entirely below the target pass rate, or it lies above the
+target less the margin (a pass rate that close to the target counts as
+passing; requiring the whole interval above the target would take more than
+ten samples even when every one passes).
+
+Calls still running when sampling stops cannot be recalled and are billed
+anyway; on_late_result receives their results once they finish.
+"""
+import math
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from statistics import NormalDist
+from typing import Callable, Dict
+
+DEFAULT_MAX_SAMPLES = 10
+DEFAULT_MIN_SAMPLES = 3
+DEFAULT_CONCURRENCY = 3
+
+# Pass rate a prompt must reach to count as passing a question
+DEFAULT_TARGET_PASS_RATE = 0.8
+
+# Stop once the confidence interval's half-width is at most this, or its
+# lower end is within this of the target
+DEFAULT_MARGIN = 0.15
+
+
+def wilson_interval(passes: int, samples: int, confidence: float = 0.95) -> tuple:
+    """Wilson score interval for a binomial proportion, as (low, high)"""
+    if samples == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = passes / samples
+    denominator = 1 + z * z / samples
+    centre = (p + z * z / (2 * samples)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / samples + z * z / (4 * samples * samples)) / denominator
+    return max(0.0, centre - half_width), min(1.0, centre + half_width)
+
+
+def is_settled(
+    passes: int,
+    samples: int,
+    target: float = DEFAULT_TARGET_PASS_RATE,
+    margin: float = DEFAULT_MARGIN,
+    confidence: float = 0.95,
+    min_samples: int = DEFAULT_MIN_SAMPLES
+) -> bool:
+    """Whether more samples could still change the verdict in a meaningful way"""
+    if samples < min_samples:
+        return False
+    low, high = wilson_interval(passes, samples, confidence)
+    return (high - low) / 2 <= margin or low >= target - margin or high < target
+
+
+def _report_late_result(on_late_result: Callable[[Dict], None], future):
+    """Hand an abandoned sample's result to on_late_result once it has finished"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    on_late_result(future.result())
+
+
+def sample_pass_rate(
+    call_fn: Callable[[], Dict],
+    score_fn: Callable[[Dict], bool],
+    max_samples: int = DEFAULT_MAX_SAMPLES,
+    min_samples: int = DEFAULT_MIN_SAMPLES,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    target: float = DEFAULT_TARGET_PASS_RATE,
+    margin: float = DEFAULT_MARGIN,
+    confidence: float = 0.95,
+    on_late_result: Callable[[Dict], None] = None
+) -> Dict:
+    """
+    Sample a model repeatedly and estimate its pass rate
+
+    Args:
+        call_fn: Makes one provider call and returns its result dict
+        score_fn: Returns True if a result passes the eval
+        max_samples: Hard cap on calls
+        min_samples: Never stop before this many scored samples
+        concurrency: Calls in flight at once
+        target: Pass rate that counts as passing
+        margin: Stop once the interval half-width is at most this, or its
+            lower end is within this of the target
+        confidence: Confidence level of the interval
+        on_late_result: Called with the result of each call that was still
+            running when sampling stopped, from a worker thread, once it
+            finishes; it is not scored or part of the returned results
+
+    Returns:
+        Dict with 'samples', 'passes', 'pass_rate', 'ci_low', 'ci_high',
+        'passed' (pass rate >= target), 'stopped_early' and 'results'
+        (each call's result with its 'passed' flag, in completion order)
+    """
+    results = []
+    passes = 0
+    submitted = 0
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    in_flight = set()
+    try:
+        while True:
+            # Keep the pipeline full, but never exceed max_samples in total
+            while len(in_flight) < concurrency and submitted < max_samples:
+                in_flight.add(executor.submit(call_fn))
+                submitted += 1
+            if not in_flight:
+                break
+
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                result["passed"] = bool(result.get("success")) and score_fn(result)
+                passes += result["passed"]
+                results.append(result)
+
+            if is_settled(passes, len(results), target, margin, confidence, min_samples):
+                break
+    finally:
+        # Drop queued calls; calls already running finish in the background and
+        # are only reported (a cancelled call never reaches on_late_result)
+        executor.shutdown(wait=False, cancel_futures=True)
+        if on_late_result:
+            for future in in_flight:
+                future.add_done_callback(partial(_report_late_result, on_late_result))
+
+    samples = len(results)
+    low, high = wilson_interval(passes, samples, confidence)
+    pass_rate = passes / samples if samples else 0.0
+    return {
+        "samples": samples,
+        "passes": passes,
+        "pass_rate": pass_rate,
+        "ci_low": low,
+        "ci_high": high,
+        "confidence": confidence,
+        "target": target,
+        "passed": samples > 0 and pass_rate >= target,
+        "stopped_early": samples < max_samples,
+        "results": results
+    }
@@ -0,0 +1,256 @@
+"""
+Failure-first, fail-fast scheduling for "run all" prompt iteration
+
+Every verdict is recorded in a small SQLite history keyed by a hash of the
+prompt and settings. A run then:
+  - skips questions whose verdict for the identical prompt/model/settings is
+    already known,
+  - runs the remaining questions most-recently-failing first, several at once,
+  - optionally cancels everything still queued on the first failure,
+  - optionally stops before a question would take it over a spend limit
+    (see cost_ledger.SpendBudget).
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, List
+
+DEFAULT_HISTORY_PATH = Path(__file__).parent / "data" / "eval_history.db"
+
+# Number of recent verdicts per question used to rank failures
+RECENT_RUNS = 5
+
+_history_lock = threading.Lock()
+
+
+def run_key(system_prompt: str, models: Dict[str, str], settings: Dict) -> str:
+    """
+    Hash identifying an exact configuration (prompt, provider models, settings)
+
+    Args:
+        system_prompt: Effective system prompt sent to the provider
+        models: Mapping of provider brand to model name
+        settings: Any other options that change the answer (tools, retrieval, ...)
+    """
+    payload = json.dumps(
+        {"system_prompt": system_prompt, "models": models, "settings": settings},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def prompt_hash(system_prompt: str) -> str:
+    """Short hash of a system prompt"""
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+class EvalHistory:
+    """SQLite log of eval verdicts by prompt hash and run key"""
+
+    def __init__(self, db_path=DEFAULT_HISTORY_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS eval_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_key TEXT NOT NULL,
+                    prompt_hash TEXT NOT NULL,
+                    question_id TEXT NOT NULL,
+                    passed INTEGER NOT NULL,
+                    details TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            # Added later: {provider: content hash} of the answers (see response_archive.py)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(eval_history)")}
+            if "response_refs" not in columns:
+                conn.execute("ALTER TABLE eval_history ADD COLUMN response_refs TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_run ON eval_history(run_key, question_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_question ON eval_history(question_id, id)")
+
+    @contextmanager
+    def _connect(self):
+        """Connection that commits on success and is always closed"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record(self, key: str, prompt: str, question_id, eval_result: Dict, response_refs: Dict = None):
+        """Store one verdict, with references to the archived answers it was based on"""
+        with _history_lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO eval_history (run_key, prompt_hash, question_id, passed, details, response_refs) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, prompt_hash(prompt), str(question_id), int(eval_result["passed"]),
+                 json.dumps(eval_result.get("details", {})),
+                 json.dumps(response_refs) if response_refs else None)
+            )
+
+    def known_verdicts(self, key: str, question_ids: List) -> Dict[str, Dict]:
+        """Latest verdict per question for this exact run key"""
+        if not question_ids:
+            return {}
+        placeholders = ",".join("?" * len(question_ids))
+        with self._connect() as conn:
+            rows = conn.execute(f"""
+                SELECT question_id, passed, details FROM eval_history
+                WHERE id IN (
+                    SELECT MAX(id) FROM eval_history
+                    WHERE run_key = ? AND question_id IN ({placeholders})
+                    GROUP BY question_id
+                )
+            """, [key, *[str(q) for q in question_ids]]).fetchall()
+        return {
+            question_id: {"passed": bool(passed), "details": json.loads(details or "{}")}
+            for question_id, passed, details in rows
+        }
+
+    def failure_priority(self, question_ids: List) -> Dict[str, tuple]:
+        """
+        Sort key per question: recently failing first, then never run, then passing
+
+        Looks at each question's last RECENT_RUNS verdicts across all prompts,
+        so a question that failed under the previous prompt edit comes first.
+        """
+        if not question_ids:
+            return {}
+        placeholders = ",".join("?" * len(question_ids))
+        with self._connect() as conn:
+            rows = conn.execute(f"""
+                SELECT question_id, passed FROM (
+                    SELECT question_id, passed,
+                           ROW_NUMBER() OVER (PARTITION BY question_id ORDER BY id DESC) AS recency
+                    FROM eval_history
+                    WHERE question_id IN ({placeholders})
+                )
+                WHERE recency <= ?
+                ORDER BY question_id, recency
+            """, [*[str(q) for q in question_ids], RECENT_RUNS]).fetchall()
+
+        recent = {}
+        for question_id, passed in rows:
+            recent.setdefault(question_id, []).append(bool(passed))
+
+        priority = {}
+        for question_id in question_ids:
+            verdicts = recent.get(str(question_id))
+            if not verdicts:
+                priority[str(question_id)] = (1, 0)
+            else:
+                failures = sum(1 for passed in verdicts if not passed)
+                priority[str(question_id)] = (0 if not verdicts[0] else 2, -failures)
+        return priority
+
+    def order_failures_first(self, question_ids: List) -> List:
+        """Question IDs reordered failure-first (stable for ties)"""
+        priority = self.failure_priority(question_ids)
+        return sorted(question_ids, key=lambda q: priority[str(q)])
+
+
+def run_all(
+    question_ids: List,
+    call_fn: Callable[[object], Dict],
+    score_fn: Callable[[object, Dict], Dict],
+    history: EvalHistory,
+    key: str,
+    system_prompt: str,
+    fail_fast: bool = False,
+    skip_known: bool = True,
+    max_workers: int = 3,
+    budget=None,
+    judge_fn: Callable[[Dict], None] = None
+) -> Dict:
+    """
+    Run eval questions failure-first, skipping known verdicts
+
+    Args:
+        question_ids: Questions to run
+        call_fn: Makes the provider call(s) for a question ID, returns a result
+        score_fn: Scores (question ID, result) and returns an eval result dict with 'passed'
+            (and optionally 'response_refs', recorded with the verdict)
+        history: Verdict store
+        key: run_key for the current prompt/model/settings
+        system_prompt: System prompt (its hash is recorded with each verdict)
+        fail_fast: Cancel queued questions on the first failure
+        skip_known: Reuse verdicts already recorded for this exact run key
+        max_workers: Questions in flight at once
+        budget: Optional cost_ledger.SpendBudget; each question reserves its
+            estimate before it is sent and scheduling stops at the first one
+            that does not fit
+        judge_fn: Optional grader run once over every answered question
+            ({question ID: (result, eval_result)}, updated in place), e.g. the
+            batched LLM judge; verdicts are then recorded after it runs, and
+            fail_fast only sees the verdicts of score_fn
+
+    Returns:
+        Dict with 'order' (question IDs in scheduled order), 'results'
+        ({question ID: (result, eval_result)} for questions that ran),
+        'skipped' ({question ID: known verdict}), 'cancelled' (question IDs
+        never run after a failure), 'over_budget' (question IDs never run
+        because of the spend limit) and 'first_failure' (question ID or None)
+    """
+    order = history.order_failures_first(list(question_ids))
+    skipped = history.known_verdicts(key, order) if skip_known else {}
+    to_run = [q for q in order if str(q) not in skipped]
+
+    results = {}
+    first_failure = None
+    over_budget = []
+    queue = list(to_run)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        in_flight = {}
+        while queue or in_flight:
+            # Submit in priority order, keeping at most max_workers in flight
+            while queue and len(in_flight) < max_workers:
+                if budget is not None and not budget.reserve(queue[0]):
+                    # Sending the next question could go over the limit; stop the sweep here
+                    over_budget, queue = queue, []
+                    break
+                question_id = queue.pop(0)
+                in_flight[executor.submit(call_fn, question_id)] = question_id
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                question_id = in_flight.pop(future)
+                result = future.result()
+                if budget is not None:
+                    budget.settle(question_id, result)
+                eval_result = score_fn(question_id, result)
+                if judge_fn is None:
+                    history.record(key, system_prompt, question_id, eval_result, eval_result.get("response_refs"))
+                results[question_id] = (result, eval_result)
+                if not eval_result["passed"] and first_failure is None:
+                    first_failure = question_id
+
+            if fail_fast and first_failure is not None:
+                # Stop scheduling; questions already in flight are abandoned
+                break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if judge_fn is not None and results:
+        # One grading pass over the whole run, so judge calls can batch across questions
+        judge_fn(results)
+        for question_id, (_, eval_result) in results.items():
+            history.record(key, system_prompt, question_id, eval_result, eval_result.get("response_refs"))
+        first_failure = next((q for q, (_, e) in results.items() if not e["passed"]), None)
+
+    return {
+        "order": order,
+        "results": results,
+        "skipped": skipped,
+        "cancelled": [q for q in to_run if q not in results and q not in over_budget],
+        "over_budget": over_budget,
+        "first_failure": first_failure
+    }
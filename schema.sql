@@ -14,8 +14,20 @@ CREATE TABLE IF NOT EXISTS feedback_submissions (
     division_name TEXT,
     department_name TEXT,
     class_name TEXT,
+    canonical_id INTEGER,  -- id of the review this one near-duplicates; NULL for originals
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Precomputed per-product review digests (see product_digests.py)
+CREATE TABLE IF NOT EXISTS product_digests (
+    clothing_id INTEGER PRIMARY KEY,
+    review_count INTEGER NOT NULL,
+    max_review_id INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Index for common queries
 CREATE INDEX IF NOT EXISTS idx_feedback_rating ON feedback_submissions(rating);
+CREATE INDEX IF NOT EXISTS idx_feedback_clothing ON feedback_submissions(clothing_id);
@@ -0,0 +1,158 @@
+"""
+Disk-backed chat sessions for multi-user hosting
+
+Streamlit keeps st.session_state in memory for every open session, so a
+long chat costs RAM for as long as the tab is open. SessionStore writes each
+message to SQLite (zlib-compressed JSON, one row per message) as it is
+added, so the app only needs to keep the newest MEMORY_WINDOW messages in
+memory. Eval results, try counters and the system prompt are saved per
+session too, and a whole session can be reloaded from its ID.
+"""
+import json
+import sqlite3
+import threading
+import uuid
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+DEFAULT_SESSIONS_PATH = Path(__file__).parent / "data" / "sessions.db"
+
+# Messages kept in memory per session; older ones are read back from disk on demand
+MEMORY_WINDOW = 50
+
+_sessions_lock = threading.Lock()
+
+
+def new_session_id() -> str:
+    """Random, URL-safe session ID"""
+    return uuid.uuid4().hex
+
+
+def _pack(value) -> bytes:
+    return zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+
+def _unpack(blob: bytes):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class SessionStore:
+    """SQLite store of chat transcripts and per-session eval state"""
+
+    def __init__(self, db_path=DEFAULT_SESSIONS_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    state BLOB,
+                    message_count INTEGER NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_messages (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    message BLOB NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                ) WITHOUT ROWID
+            """)
+
+    @contextmanager
+    def _connect(self):
+        """Connection that commits on success and is always closed"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def append_message(self, session_id: str, message: Dict) -> int:
+        """
+        Append a message to a session's transcript
+
+        Returns:
+            The message's position in the transcript (0-based)
+        """
+        with _sessions_lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT message_count FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            seq = row[0] if row else 0
+            conn.execute(
+                "INSERT INTO session_messages (session_id, seq, message) VALUES (?, ?, ?)",
+                (session_id, seq, _pack(message))
+            )
+            conn.execute("""
+                INSERT INTO sessions (session_id, message_count) VALUES (?, 1)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    message_count = message_count + 1,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (session_id,))
+        return seq
+
+    def message_count(self, session_id: str) -> int:
+        """Number of messages in a session's transcript"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT message_count FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def load_messages(self, session_id: str, start: int = 0, end: int = None) -> List[Dict]:
+        """Messages start..end (exclusive) of a transcript, oldest first"""
+        end = self.message_count(session_id) if end is None else end
+        if start >= end:
+            return []
+        with self._connect() as conn:
+            rows = conn.execute("""
+                SELECT message FROM session_messages
+                WHERE session_id = ? AND seq >= ? AND seq < ?
+                ORDER BY seq
+            """, (session_id, start, end)).fetchall()
+        return [_unpack(blob) for blob, in rows]
+
+    def save_state(self, session_id: str, state: Dict):
+        """Save a session's non-transcript state (eval results, try counters, ...)"""
+        with _sessions_lock, self._connect() as conn:
+            conn.execute("""
+                INSERT INTO sessions (session_id, state) VALUES (?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    state = excluded.state,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (session_id, _pack(state)))
+
+    def load_state(self, session_id: str) -> Dict:
+        """Saved state of a session, or None if the session is unknown"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT state, message_count FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        state = _unpack(row[0]) if row[0] else {}
+        state["message_count"] = row[1]
+        return state
+
+    def load_session(self, session_id: str, window: int = MEMORY_WINDOW) -> Dict:
+        """
+        Everything needed to resume a session, reading only the newest messages
+
+        Returns:
+            The saved state plus 'messages' (the newest `window` messages) and
+            'message_offset' (position of the first of them), or None if the
+            session is unknown
+        """
+        state = self.load_state(session_id)
+        if state is None:
+            return None
+        offset = max(0, state["message_count"] - window)
+        state["messages"] = self.load_messages(session_id, offset, state["message_count"])
+        state["message_offset"] = offset
+        return state
@@ -0,0 +1,189 @@
+"""
+Local, offline semantic similarity for eval assertions
+
+Texts are embedded with signed feature hashing of word n-grams and character
+n-grams (no model download, no network), L2-normalised, and compared with a
+single NumPy matrix product. Whole batches of responses are scored in one
+call, so semantic pass/fail runs at rule-based speed.
+"""
+import re
+import zlib
+from itertools import chain
+from typing import List, Sequence
+
+import numpy as np
+
+DEFAULT_N_FEATURES = 1024
+
+# Default pass mark for semantic assertions (cosine similarity, 0..1)
+DEFAULT_SEMANTIC_THRESHOLD = 0.35
+
+# Distinct words whose n-gram hashes are memoised per vectorizer
+WORD_CACHE_SIZE = 200000
+
+# Responses scored per matrix product in semantic_match_scores
+SCORE_CHUNK_SIZE = 256
+
+_WORD_RE = re.compile(r"[a-z0-9$']+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into non-empty sentences (short fragments are kept as-is)"""
+    return [s.strip() for s in _SENTENCE_RE.split(text or "") if s.strip()]
+
+
+class HashingVectorizer:
+    """
+    Stateless text vectorizer based on signed feature hashing
+
+    Args:
+        n_features: Output dimensionality
+        word_ngrams: (min, max) word n-gram lengths
+        char_ngrams: (min, max) character n-gram lengths, taken inside word
+            boundaries so "return", "returns" and "returning" overlap
+    """
+
+    def __init__(
+        self,
+        n_features: int = DEFAULT_N_FEATURES,
+        word_ngrams: tuple = (1, 2),
+        char_ngrams: tuple = (3, 5)
+    ):
+        self.n_features = n_features
+        self.word_ngrams = word_ngrams
+        self.char_ngrams = char_ngrams
+        self.idf = None
+        self._word_cache = {}
+
+    def _word_features(self, word: str) -> List[int]:
+        """Hashes of a word's unigram and character n-grams (cached; words repeat a lot)"""
+        hashes = self._word_cache.get(word)
+        if hashes is None:
+            grams = ["w:" + word] if self.word_ngrams[0] <= 1 <= self.word_ngrams[1] else []
+            padded = f" {word} "
+            lo, hi = self.char_ngrams
+            for n in range(lo, hi + 1):
+                grams.extend("c:" + padded[i:i + n] for i in range(len(padded) - n + 1))
+            hashes = [zlib.crc32(g.encode("utf-8")) for g in grams]
+            if len(self._word_cache) < WORD_CACHE_SIZE:
+                self._word_cache[word] = hashes
+        return hashes
+
+    def _text_hashes(self, text: str) -> List[int]:
+        words = _WORD_RE.findall(text.lower())
+        hashes = []
+        for word in words:
+            hashes.extend(self._word_features(word))
+        lo, hi = self.word_ngrams
+        for n in range(max(lo, 2), hi + 1):
+            hashes.extend(
+                zlib.crc32(("w:" + " ".join(words[i:i + n])).encode("utf-8"))
+                for i in range(len(words) - n + 1)
+            )
+        return hashes
+
+    def _hash_rows(self, texts: Sequence[str]):
+        per_text = [self._text_hashes(text) for text in texts]
+        lengths = np.fromiter((len(h) for h in per_text), dtype=np.int64, count=len(per_text))
+        hashes = np.fromiter(chain.from_iterable(per_text), dtype=np.uint32, count=int(lengths.sum()))
+        rows = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+        cols = (hashes % self.n_features).astype(np.int64)
+        # Top bit picks the sign so collisions cancel out on average
+        signs = np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32)
+        return rows, cols, signs
+
+    def document_frequencies(self, texts: Sequence[str]) -> np.ndarray:
+        """Number of texts each hash bucket occurs in (sum these over chunks of a large corpus)"""
+        rows, cols, _ = self._hash_rows(texts)
+        pairs = np.unique(rows * self.n_features + cols)
+        return np.bincount(pairs % self.n_features, minlength=self.n_features)
+
+    def set_idf(self, document_frequencies: np.ndarray, n_documents: int) -> "HashingVectorizer":
+        """Set per-bucket inverse document frequencies from precomputed counts"""
+        self.idf = (np.log((1 + n_documents) / (1 + document_frequencies)) + 1).astype(np.float32)
+        return self
+
+    def fit_idf(self, texts: Sequence[str]) -> "HashingVectorizer":
+        """Learn per-bucket inverse document frequencies from a corpus"""
+        return self.set_idf(self.document_frequencies(texts), len(texts))
+
+    def transform(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed texts as an (n_texts, n_features) float32 matrix of unit rows"""
+        if not len(texts):
+            return np.zeros((0, self.n_features), dtype=np.float32)
+        rows, cols, signs = self._hash_rows(texts)
+        matrix = np.bincount(
+            rows * self.n_features + cols, weights=signs, minlength=len(texts) * self.n_features
+        ).astype(np.float32).reshape(len(texts), self.n_features)
+        if self.idf is not None:
+            matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+_default_vectorizer = HashingVectorizer()
+
+
+def semantic_match_scores(
+    responses: Sequence[str],
+    references: Sequence[Sequence[str]],
+    vectorizer: HashingVectorizer = None
+) -> np.ndarray:
+    """
+    Score each response against its own reference phrasings, all in one pass
+
+    A response is split into sentences and its score is the best cosine
+    similarity between any of its sentences and any of its references, so a
+    single on-point sentence in a long answer still counts.
+
+    Args:
+        responses: Response texts
+        references: For each response, the phrasings it should match
+        vectorizer: Vectorizer to embed with (defaults to a shared HashingVectorizer)
+
+    Returns:
+        float32 array of shape (len(responses),) with scores in [-1, 1]
+        (0.0 for responses with no sentences or no references)
+    """
+    if len(responses) != len(references):
+        raise ValueError("responses and references must have the same length")
+    vectorizer = vectorizer or _default_vectorizer
+
+    scores = np.zeros(len(responses), dtype=np.float32)
+    # Chunk very large batches so the sentence x reference matrix stays small
+    for start in range(0, len(responses), SCORE_CHUNK_SIZE):
+        end = start + SCORE_CHUNK_SIZE
+        scores[start:end] = _score_chunk(responses[start:end], references[start:end], vectorizer)
+    return scores
+
+
+def _score_chunk(responses, references, vectorizer) -> np.ndarray:
+    sentences, sentence_owner = [], []
+    refs, ref_owner = [], []
+    for i, (response, ref_list) in enumerate(zip(responses, references)):
+        for sentence in split_sentences(response):
+            sentences.append(sentence)
+            sentence_owner.append(i)
+        for ref in ref_list:
+            refs.append(ref)
+            ref_owner.append(i)
+
+    scores = np.zeros(len(responses), dtype=np.float32)
+    if not sentences or not refs:
+        return scores
+
+    sentence_owner = np.asarray(sentence_owner)
+    ref_owner = np.asarray(ref_owner)
+    similarity = vectorizer.transform(sentences) @ vectorizer.transform(refs).T
+
+    # Only compare a response's sentences with that response's own references
+    similarity[sentence_owner[:, None] != ref_owner[None, :]] = -np.inf
+    best_per_sentence = similarity.max(axis=1)
+
+    # Sentences are grouped by owner in order, so reduce each contiguous run
+    owners, starts = np.unique(sentence_owner, return_index=True)
+    scores[owners] = np.maximum.reduceat(best_per_sentence, starts)
+    scores[~np.isfinite(scores)] = 0.0
+    return scores
@@ -0,0 +1,290 @@
+"""
+Synthetic review corpus for scale testing
+
+Generates Kaggle-format review rows (the same columns as the real CSV) with
+distributions modelled on the Women's E-Commerce Clothing Reviews dataset,
+and writes them through the normal ingest path (ingest_data.py) in chunks:
+  - clothing_id: heavy-tailed popularity over a fixed product catalog, each
+    product with its own division, department and class
+  - rating: mostly 4-5 stars; recommended_ind follows the rating
+  - age: roughly normal around 43
+  - review length: centred near 300 characters, capped at 500 like the
+    original site; text and title sentiment follow the rating
+  - review text: sentence templates with slots (color, fabric, size,
+    height, occasion, ...) filled independently per sentence, so rows are
+    rarely near-duplicates of each other
+  - positive_feedback_count: mostly 0-3 with a long tail
+
+The text is still template prose: fine for load testing (ingest, query
+latency, dedup and index sizes), not for judging answer quality.
+
+Usage:
+    python synth_reviews.py 1000000 [--db data/scale_test.db] [--seed 42]
+"""
+from string import Formatter
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from db_pool import DEFAULT_DB_PATH
+from ingest_data import INGEST_CHUNK_SIZE, print_ingest_summary, write_review_chunks
+
+# Distinct products in the catalog (the Kaggle dataset has ~1,200)
+DEFAULT_CATALOG_SIZE = 1200
+
+# Zipf exponent of product popularity
+POPULARITY_EXPONENT = 1.1
+
+RATING_PROBS = {1: 0.036, 2: 0.067, 3: 0.122, 4: 0.216, 5: 0.559}
+RECOMMEND_PROBS = {1: 0.02, 2: 0.10, 3: 0.42, 4: 0.96, 5: 0.99}
+
+# (department, share, {class: share}); intimates use the dataset's own "Initmates" division
+DEPARTMENTS = [
+    ("Tops", 0.446, {"Knits": 0.45, "Blouses": 0.30, "Sweaters": 0.15, "Fine gauge": 0.10}),
+    ("Dresses", 0.270, {"Dresses": 1.0}),
+    ("Bottoms", 0.161, {"Pants": 0.36, "Jeans": 0.30, "Skirts": 0.25, "Shorts": 0.09}),
+    ("Intimate", 0.074, {"Lounge": 0.40, "Sleep": 0.20, "Intimates": 0.20, "Swim": 0.12, "Legwear": 0.08}),
+    ("Jackets", 0.044, {"Jackets": 0.50, "Outerwear": 0.50}),
+    ("Trend", 0.005, {"Trend": 1.0})
+]
+PETITE_SHARE = 0.35
+
+# How a review refers to a product of each class
+ITEM_NAMES = {
+    "Knits": "top", "Blouses": "blouse", "Sweaters": "sweater", "Fine gauge": "sweater",
+    "Dresses": "dress", "Pants": "pair of pants", "Jeans": "pair of jeans", "Skirts": "skirt",
+    "Shorts": "pair of shorts", "Lounge": "lounge set", "Sleep": "pajama set", "Intimates": "bra",
+    "Swim": "swimsuit", "Legwear": "pair of leggings", "Jackets": "jacket", "Outerwear": "coat",
+    "Trend": "piece"
+}
+
+MIN_REVIEW_CHARS = 20
+MAX_REVIEW_CHARS = 500
+TITLE_MISSING_RATE = 0.16
+
+# Values for the slots in SENTENCES; each sentence fills its slots independently,
+# so the same template rarely yields the same sentence twice
+ATTRIBUTES = {
+    "color": ["black", "navy", "ivory", "olive", "blush pink", "rust", "cobalt", "heather grey",
+              "burgundy", "mustard", "emerald", "cream", "coral", "charcoal"],
+    "fabric": ["cotton", "linen", "rayon", "jersey", "silky", "ribbed knit", "modal", "chiffon", "wool blend",
+               "cashmere blend"],
+    "size": ["XXS", "XS", "S", "M", "L", "XL", "0", "2", "4", "6", "8", "10", "12", "14", "16"],
+    "height": ["4'11\"", "5'0\"", "5'1\"", "5'2\"", "5'3\"", "5'4\"", "5'5\"", "5'6\"", "5'7\"", "5'8\"",
+               "5'9\"", "5'10\"", "6'0\""],
+    "occasion": ["work", "a wedding", "date night", "brunch", "travel", "the office", "weekends", "a baby shower",
+                 "vacation", "church", "a graduation", "errands", "happy hour"],
+    "build": ["broad shoulders", "a long torso", "curvy hips", "a small bust", "a larger bust", "an athletic build",
+              "short legs", "a petite frame", "long arms", "a short waist"],
+    "feature": ["waistband", "neckline", "buttons", "zipper", "pockets", "lining", "hem", "sleeves", "straps",
+                "collar", "side slits", "tie belt"],
+    "praise": ["flattering", "comfortable", "elegant", "versatile", "cozy", "polished", "easy to wear", "chic",
+               "well made", "figure-friendly"],
+    "wait": ["one wash", "two washes", "a few wears", "a week", "two weeks", "a month", "one season"],
+    "fix": ["a slip", "a camisole", "a belt", "a tailor", "a size up", "a size down", "safety pins", "a cardigan"],
+    "pair": ["jeans", "sandals", "ankle boots", "a denim jacket", "heels", "sneakers", "a blazer", "tights",
+             "a long necklace", "leggings"]
+}
+
+SENTENCES = {
+    "positive": [
+        "I love this {item}!",
+        "I love this {item} in {color}.",
+        "The {fabric} fabric is soft and feels really high quality.",
+        "Fits true to size, I ordered my usual {size} and it was perfect.",
+        "The {color} is even prettier in person.",
+        "I got so many compliments the first time I wore it to {occasion}.",
+        "It washes well and still looks new after {wait}.",
+        "Very {praise} cut, even with {build}.",
+        "Great for {occasion} and dresses up or down easily.",
+        "Worth every penny, I might buy it in {color} too.",
+        "The length is just right on me at {height}.",
+        "Comfortable enough to wear all day at {occasion}.",
+        "I love the detail on the {feature}.",
+        "I'm {height} and took a {size}, the fit is spot on.",
+        "Looks great with {pair} for {occasion}.",
+        "So {praise}, I've worn it to {occasion} twice already.",
+        "The {fabric} drapes nicely and doesn't cling.",
+        "I have {build} and this {item} is one of the few that works for me."
+    ],
+    "mixed": [
+        "The {item} is cute but runs a bit large, consider sizing down from a {size}.",
+        "Nice design, though the {fabric} is thinner than I expected.",
+        "The {color} was not quite what the photos showed.",
+        "It's okay for the price, but I wouldn't pay full price.",
+        "The fit is boxy on me, it might work better on someone with {build}.",
+        "I had to have it hemmed, it was too long at {height}.",
+        "It wrinkles easily, so plan on steaming it before {occasion}.",
+        "I'm keeping it, but it wasn't love at first sight.",
+        "The fit around the {feature} is a little odd, but it's fine with {fix}.",
+        "Pretty enough for {occasion}, though not my favorite.",
+        "I'd call it {praise} but not special.",
+        "The stitching around the {feature} loosened after {wait}."
+    ],
+    "negative": [
+        "Unfortunately this {item} runs very small, I couldn't zip the {size}.",
+        "The {fabric} started pilling after {wait}.",
+        "Poor quality, the seams at the {feature} were already fraying.",
+        "It looked nothing like the picture and is going back.",
+        "Very see-through, I would need {fix} underneath.",
+        "The sizing is completely off, I usually wear a {size} and the next size up was tight.",
+        "Cheap {fabric} and an unflattering cut.",
+        "I was so disappointed, I had high hopes for this one for {occasion}.",
+        "The {color} faded after {wait}.",
+        "Even at {height} it was far too short.",
+        "Not made for anyone with {build}, it pulled everywhere.",
+        "The stitching at the {feature} came apart the first time I wore it."
+    ]
+}
+
+# Slot names per template, parsed once
+_SLOTS = {
+    template: [name for _, name, _, _ in Formatter().parse(template) if name and name != "item"]
+    for templates in SENTENCES.values() for template in templates
+}
+
+TITLES = {
+    "positive": ["Love it!", "Perfect", "Beautiful", "So comfortable", "Great buy", "Must have", "Gorgeous color", "Flattering"],
+    "mixed": ["Cute but", "Runs large", "Just okay", "Mixed feelings", "Nice but thin", "Size down"],
+    "negative": ["Disappointed", "Runs small", "Poor quality", "Returned", "Not as pictured", "Sadly going back"]
+}
+
+
+def _sentiment(rating: int) -> str:
+    return "positive" if rating >= 4 else "mixed" if rating == 3 else "negative"
+
+
+def build_catalog(catalog_size: int = DEFAULT_CATALOG_SIZE, seed: int = 42) -> pd.DataFrame:
+    """Product catalog: clothing_id with a fixed division, department and class"""
+    rng = np.random.default_rng(seed)
+    shares = np.array([share for _, share, _ in DEPARTMENTS])
+    departments = rng.choice(len(DEPARTMENTS), size=catalog_size, p=shares / shares.sum())
+    rows = []
+    for clothing_id, d in enumerate(departments):
+        department, _, classes = DEPARTMENTS[d]
+        class_names = list(classes)
+        class_probs = np.array(list(classes.values()))
+        class_name = class_names[rng.choice(len(class_names), p=class_probs / class_probs.sum())]
+        if department == "Intimate" and rng.random() > PETITE_SHARE:
+            division = "Initmates"
+        else:
+            division = "General Petite" if rng.random() < PETITE_SHARE else "General"
+        rows.append((clothing_id, division, department, class_name))
+    return pd.DataFrame(rows, columns=["clothing_id", "division", "department", "class_name"])
+
+
+def _fill(template: str, item: str, pick: int) -> str:
+    # The remaining digits of the pick choose each slot's value
+    values = {"item": item}
+    for name in _SLOTS[template]:
+        options = ATTRIBUTES[name]
+        pick, index = divmod(pick, len(options))
+        values[name] = options[index]
+    return template.format(**values)
+
+
+def _review_texts(rng, ratings: np.ndarray, items: np.ndarray) -> list:
+    # Target lengths: roughly normal around 300 chars, clipped to the site's limits
+    targets = np.clip(rng.normal(300, 130, len(ratings)), MIN_REVIEW_CHARS, MAX_REVIEW_CHARS)
+    picks = rng.integers(0, 1 << 62, size=(len(ratings), 12)).tolist()
+    texts = []
+    for rating, item, target, row_picks in zip(ratings, items, targets, picks):
+        pool = SENTENCES[_sentiment(rating)]
+        # Mostly same-sentiment sentences, with the odd mixed remark
+        parts, used, length = [], set(), 0
+        for pick in row_picks:
+            pick, mixed = divmod(pick, 5)
+            sentence_pool = SENTENCES["mixed"] if mixed == 0 else pool
+            pick, index = divmod(pick, len(sentence_pool))
+            if (sentence_pool is pool, index) in used:
+                continue
+            used.add((sentence_pool is pool, index))
+            sentence = _fill(sentence_pool[index], item, pick)
+            if length + len(sentence) + 1 > MAX_REVIEW_CHARS:
+                break
+            parts.append(sentence)
+            length += len(sentence) + 1
+            if length >= target:
+                break
+        texts.append(" ".join(parts))
+    return texts
+
+
+def generate_reviews(
+    n_rows: int,
+    chunk_size: int = INGEST_CHUNK_SIZE,
+    seed: int = 42,
+    catalog_size: int = DEFAULT_CATALOG_SIZE
+) -> Iterator[pd.DataFrame]:
+    """
+    Yield synthetic reviews as DataFrames with the Kaggle CSV columns
+
+    Args:
+        n_rows: Total rows to generate
+        chunk_size: Rows per DataFrame
+        seed: Random seed (the same seed always yields the same corpus)
+        catalog_size: Number of distinct clothing IDs
+    """
+    rng = np.random.default_rng(seed)
+    catalog = build_catalog(catalog_size, seed)
+    # Popularity rank -> product, so the most reviewed products aren't simply the lowest IDs
+    popularity = rng.permutation(catalog_size)
+    weights = 1.0 / np.arange(1, catalog_size + 1) ** POPULARITY_EXPONENT
+    weights /= weights.sum()
+    rating_values = np.array(list(RATING_PROBS))
+    rating_probs = np.array(list(RATING_PROBS.values()))
+    recommend_probs = np.array([0.0, *RECOMMEND_PROBS.values()])
+
+    for start in range(0, n_rows, chunk_size):
+        size = min(chunk_size, n_rows - start)
+        products = catalog.iloc[popularity[rng.choice(catalog_size, size=size, p=weights)]]
+        ratings = rng.choice(rating_values, size=size, p=rating_probs / rating_probs.sum())
+        items = products["class_name"].map(ITEM_NAMES).to_numpy()
+
+        titles = [TITLES[_sentiment(r)][i % len(TITLES[_sentiment(r)])]
+                  for r, i in zip(ratings, rng.integers(0, 1 << 30, size=size))]
+        missing_title = rng.random(size) < TITLE_MISSING_RATE
+
+        yield pd.DataFrame({
+            "Clothing ID": products["clothing_id"].to_numpy(),
+            "Age": np.clip(rng.normal(43, 12, size), 18, 99).round().astype(int),
+            "Title": np.where(missing_title, None, titles),
+            "Review Text": _review_texts(rng, ratings, items),
+            "Rating": ratings,
+            "Recommended IND": (rng.random(size) < recommend_probs[ratings]).astype(int),
+            "Positive Feedback Count": rng.negative_binomial(0.5, 0.17, size),
+            "Division Name": products["division"].to_numpy(),
+            "Department Name": products["department"].to_numpy(),
+            "Class Name": products["class_name"].to_numpy()
+        })
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from pathlib import Path
+
+    from init_db import init_database
+
+    parser = argparse.ArgumentParser(description="Generate synthetic reviews for scale testing")
+    parser.add_argument("rows", type=int, help="Number of reviews, e.g. 1000000")
+    parser.add_argument("--db", default=str(Path(DEFAULT_DB_PATH).parent / "scale_test.db"),
+                        help="Database to write to (a separate file by default, so the demo data is untouched)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE)
+    parser.add_argument("--catalog-size", type=int, default=DEFAULT_CATALOG_SIZE)
+    args = parser.parse_args()
+
+    if not Path(args.db).exists():
+        init_database(args.db)
+
+    print(f"🧪 Generating {args.rows} synthetic reviews into {args.db}")
+    started = time.perf_counter()
+    summary = write_review_chunks(
+        generate_reviews(args.rows, args.chunk_size, args.seed, args.catalog_size),
+        args.db,
+        on_chunk=lambda rows: print(f"  ... {rows} reviews written "
+                                    f"({rows / (time.perf_counter() - started):,.0f} rows/s)")
+    )
+    print_ingest_summary(summary, args.db)
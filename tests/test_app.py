@@ -0,0 +1,224 @@
+"""
+The Streamlit app end to end (streamlit.testing), with a fake provider
+
+Each test runs a copy of the app in tmp_path, so the sessions, ledger and
+eval history it writes (and the schema upgrade of the demo database) never
+touch the repo's data directory.
+"""
+import importlib
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+REPO = Path(__file__).resolve().parent.parent
+APP_MODULES = [path.stem for path in REPO.glob("*.py")]
+
+# An answer that passes question 1's assertions
+PASSING_ANSWER = "Sarah, clothing ID 1094 runs small, so size up: https://santra.com/clothing/1094"
+
+
+class FakeProvider:
+    """Stands in for call_claude and call_openai; calls can be held until released"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.error = None
+
+    def __call__(self, **kwargs):
+        self.calls.append(kwargs)
+        self.release.wait(10)
+        if self.error:
+            raise self.error
+        return {"success": True, "response": PASSING_ANSWER, "model": kwargs.get("model"),
+                "tokens": {"input": 1000, "output": 50, "cached": 0}}
+
+
+@pytest.fixture
+def provider():
+    return FakeProvider()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch, provider):
+    for path in REPO.glob("*.py"):
+        shutil.copy(path, tmp_path)
+    shutil.copy(REPO / "schema.sql", tmp_path)
+    (tmp_path / "data").mkdir()
+    for name in ("evals_demo.db", "eval_cases.jsonl"):
+        shutil.copy(REPO / "data" / name, tmp_path / "data")
+
+    # Import the copied modules (whose data paths are under tmp_path) instead of the repo's
+    for name in APP_MODULES:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    providers = importlib.import_module("providers")
+    for brand in ("Anthropic", "OpenAI"):
+        monkeypatch.setitem(providers.PROVIDER_CALLS, brand, provider)
+
+    at = AppTest.from_file(str(tmp_path / "app.py"), default_timeout=30)
+    at.run()
+    at.sidebar.text_input(key="anthropic_api_key").set_value("key").run()
+    yield at
+
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    for name in APP_MODULES:
+        sys.modules.pop(name, None)
+
+
+def send(at, question_id):
+    """Select an eval question and send it"""
+    at.button(key=f"q_{question_id}").click().run()
+    next(b for b in at.button if b.label == "Send").click().run()
+
+
+def wait_for_answers(at, timeout=10):
+    """Rerun until every background call has been collected"""
+    end = time.monotonic() + timeout
+    while at.session_state.pending_jobs and time.monotonic() < end:
+        time.sleep(0.1)
+        at.run()
+    assert not at.session_state.pending_jobs
+
+
+def test_assistant_messages_carry_their_own_eval_record(app):
+    send(app, 1)
+    wait_for_answers(app)
+    send(app, 1)
+    wait_for_answers(app)
+
+    assert not app.exception
+    answers = [m for m in app.session_state.messages if m["role"] == "assistant"]
+    assert len(answers) == 2
+    assert all(answer["eval"]["passed"] for answer in answers)
+    assert [answer["eval"]["try_number"] for answer in answers] == [1, 2]
+
+
+def test_only_the_newest_messages_are_rendered(app):
+    window = app.session_state.history_window
+    messages = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"} for i in range(30)]
+    app.session_state.messages = messages
+    app.run()
+
+    rendered = [m.markdown[0].value for m in app.chat_message]
+    assert rendered == [m["content"] for m in messages[-window:]]
+    show_earlier = next(b for b in app.button if b.label.startswith("⬆️ Show"))
+    show_earlier.click().run()
+    assert len(app.chat_message) == 30
+
+
+def test_compare_mode_answers_with_both_providers(app, provider):
+    app.sidebar.radio[0].set_value("Compare both").run()
+    app.sidebar.text_input(key="openai_api_key").set_value("key").run()
+    send(app, 1)
+    wait_for_answers(app)
+
+    assert not app.exception
+    assert len(provider.calls) == 2
+    answer = app.session_state.messages[-1]
+    assert set(answer["compare"]) == {"Anthropic", "OpenAI"}
+    assert all(side["eval"]["passed"] for side in answer["compare"].values())
+    assert answer["eval"]["compare"] == {"Anthropic": True, "OpenAI": True}
+
+
+def test_a_resumed_session_keeps_only_the_newest_messages_in_memory(app):
+    sessions = importlib.import_module("sessions")
+    store = sessions.SessionStore()
+    messages = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"}
+                for i in range(sessions.MEMORY_WINDOW + 10)]
+    for message in messages:
+        store.append_message("saved-session", message)
+    store.save_state("saved-session", {"system_prompt": "Be brief"})
+
+    app.sidebar.text_input(key="resume_session_id").set_value("saved-session").run()
+    assert app.session_state.session_id == "saved-session"
+    assert app.session_state.message_offset == 10
+    assert app.session_state.messages == messages[10:]
+    # Messages already out of memory are carried in the session's summary
+    assert app.session_state.earlier_summary.splitlines() == [
+        f"- {'User' if i % 2 == 0 else 'Assistant'}: message {i}" for i in range(10)
+    ]
+
+    # Paging back past the in-memory window reads the older messages from disk
+    while any(b.label.startswith("⬆️ Show") for b in app.button):
+        next(b for b in app.button if b.label.startswith("⬆️ Show")).click().run()
+    assert [m.markdown[0].value for m in app.chat_message] == [m["content"] for m in messages]
+
+
+def test_turns_out_of_memory_still_reach_the_model_as_a_summary(app, provider, monkeypatch):
+    monkeypatch.setattr(importlib.import_module("sessions"), "MEMORY_WINDOW", 4)
+    next(c for c in app.checkbox if c.label == "Save context").check().run()
+    for _ in range(3):
+        send(app, 1)
+        wait_for_answers(app)
+    assert app.session_state.message_offset == 2
+
+    # The carried summary is saved with the session and restored with it
+    app.sidebar.text_input(key="resume_session_id").set_value(app.session_state.session_id).run()
+    assert app.session_state.earlier_summary.splitlines()[0].startswith("- User: I need professional clothing")
+    send(app, 1)
+    wait_for_answers(app)
+    assert "Summary of earlier conversation" in provider.calls[-1]["system_prompt"]
+    assert app.session_state.earlier_summary.splitlines()[0] in provider.calls[-1]["system_prompt"]
+
+
+def test_answers_are_generated_in_the_background(app, provider):
+    provider.release.clear()
+    send(app, 1)
+    # The script run has finished while the call is still in flight
+    assert len(app.session_state.pending_jobs) == 1
+    assert app.session_state.messages[-1]["role"] == "user"
+    assert app.chat_message[-1].markdown[0].value.startswith("⏳ *Working on:")
+
+    # The UI stays usable: a second question can be sent meanwhile
+    send(app, 2)
+    assert len(app.session_state.pending_jobs) == 2
+
+    provider.release.set()
+    wait_for_answers(app)
+    assert not app.exception
+    answers = [m for m in app.session_state.messages if m["role"] == "assistant"]
+    assert len(answers) == 2
+    assert set(app.session_state.eval_results) == {1, 2}
+
+
+def test_a_failed_background_call_is_reported_in_the_chat(app, provider):
+    provider.error = RuntimeError("connection reset")
+    send(app, 1)
+    wait_for_answers(app)
+    assert app.session_state.messages[-1]["content"] == "Error: connection reset"
+
+
+def test_a_prefetched_answer_is_used_on_send(app, provider):
+    next(c for c in app.checkbox if c.label == "Speculative prefetch").check().run()
+    app.button(key="q_1").click().run()
+    # The call starts as soon as the question is selected
+    assert app.session_state.prefetch is not None
+    app.session_state.prefetch["future"].result(10)
+    assert len(provider.calls) == 1
+
+    next(b for b in app.button if b.label == "Send").click().run()
+    wait_for_answers(app)
+    assert len(provider.calls) == 1
+    assert app.session_state.eval_results[1]["passed"]
+
+
+def test_a_prefetch_for_an_edited_question_is_not_used(app, provider):
+    next(c for c in app.checkbox if c.label == "Speculative prefetch").check().run()
+    app.button(key="q_1").click().run()
+    app.text_area(key="chat_input_val").set_value("Should I order clothing ID 1094 in petite?").run()
+    next(b for b in app.button if b.label == "Send").click().run()
+    wait_for_answers(app)
+
+    assert app.session_state.prefetch is None
+    assert provider.calls[-1]["user_message"].startswith("Should I order clothing ID 1094 in petite?")
@@ -0,0 +1,75 @@
+"""Assertion language: parsing, placeholders and the compiled-case cache"""
+import pytest
+
+from assertions import CompiledAssertions, InvalidAssertion, compile_case, compile_expression
+
+
+def check(expr, response, context=None):
+    return compile_expression(expr, context)(response, response.lower())
+
+
+@pytest.mark.parametrize("expr, response, expected", [
+    ("Runs Small", "this runs small, size up", True),
+    ({"contains": "size up"}, "Size Up!", True),
+    ({"regex": r"\bpill(s|ing)?\b"}, "It started pilling", True),
+    ({"regex": r"\bpill(s|ing)?\b"}, "spilled coffee", False),
+    ({"any": ["small", "large"]}, "runs large", True),
+    ({"all": ["small", "large"]}, "runs large", False),
+    ({"not": "return"}, "keep it", True),
+    ({"count": "sarah", "min": 2}, "Sarah... sarah", True),
+    ({"count": "sarah", "min": 2, "max": 2}, "Sarah sarah SARAH", False),
+    ({"count": {"any": ["a1", "b2", "c3"]}, "min": 2}, "a1 and c3", True),
+    ({"literal": "{clothing_id}"}, "see {clothing_id}", True),
+])
+def test_operators(expr, response, expected):
+    assert check(expr, response) is expected
+
+
+def test_placeholders_are_filled_and_escaped_in_patterns():
+    expr = {"regex": r"santra\.com/clothing/{clothing_id}\b"}
+    context = {"clothing_id": "10.4"}
+    assert check(expr, "https://santra.com/clothing/10.4", context)
+    # The value is regex-escaped, so '.' does not match any character
+    assert not check(expr, "https://santra.com/clothing/1044", context)
+
+
+def test_contains_placeholder_uses_the_raw_value():
+    assert check("clothing id {clothing_id}", "About clothing ID 1094", {"clothing_id": 1094})
+
+
+@pytest.mark.parametrize("expr", [
+    {"contains": "{missing}"},
+    {"unknown_op": "x"},
+    {},
+    42,
+    {"count": {"not": "x"}},
+])
+def test_invalid_expressions_raise(expr):
+    with pytest.raises(InvalidAssertion):
+        compile_expression(expr, {"clothing_id": 1})
+
+
+def test_legacy_keywords_and_semantic_assertions():
+    compiled = CompiledAssertions([
+        {"check": "size", "keywords": ["small", "large"]},
+        {"check": "tone", "type": "semantic", "references": ["friendly"]},
+    ])
+    assert compiled.evaluate("Runs small") == {"size": True}
+    assert [a["check"] for a in compiled.semantic] == ["tone"]
+
+
+def test_stop_on_failure_skips_the_remaining_checks():
+    compiled = CompiledAssertions([
+        {"check": "first", "match": "yes"},
+        {"check": "second", "match": "no"},
+        {"check": "third", "match": "maybe"},
+    ])
+    assert compiled.evaluate("yes", stop_on_failure=True) == {"first": True, "second": False}
+
+
+def test_compile_case_reuses_the_compilation_of_the_same_case():
+    assertions = [{"check": "a", "match": "x"}]
+    context = {"clothing_id": 1}
+    assert compile_case(assertions, context) is compile_case(assertions, context)
+    # An equal but separately loaded case is compiled on its own
+    assert compile_case([dict(assertions[0])], context) is not compile_case(assertions, context)
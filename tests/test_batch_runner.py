@@ -0,0 +1,136 @@
+"""
+Batch runner against a fake Message Batches client: submission, scoring
+and resuming from a saved state file
+"""
+from types import SimpleNamespace
+
+import pytest
+
+import batch_runner
+from batch_runner import append_results, load_results, load_state, results_path, run_batch, save_state
+from cost_ledger import CostLedger
+from eval_dataset import EvalDataset, write_cases
+from response_archive import ResponseArchive
+
+CASES = [
+    {"id": i, "question": f"Should I order clothing ID {i}?",
+     "assertions": [{"check": "mentions_sarah", "match": "sarah"}]}
+    for i in (1, 2, 3)
+]
+
+
+class FakeBatches:
+    """In-memory stand-in for client.messages.batches"""
+
+    def __init__(self):
+        self.created = {}
+        self.polls_until_lost = None  # raise on this many more retrieve() calls
+
+    def create(self, requests):
+        batch_id = f"batch_{len(self.created) + 1}"
+        self.created[batch_id] = requests
+        return SimpleNamespace(id=batch_id)
+
+    def retrieve(self, batch_id):
+        if self.polls_until_lost is not None:
+            if self.polls_until_lost == 0:
+                raise ConnectionError("connection lost")
+            self.polls_until_lost -= 1
+        return SimpleNamespace(processing_status="ended")
+
+    def results(self, batch_id):
+        for request in self.created[batch_id]:
+            message = SimpleNamespace(
+                content=[SimpleNamespace(type="text", text="Sarah, this one runs small.")],
+                usage=SimpleNamespace(input_tokens=100, output_tokens=20)
+            )
+            yield SimpleNamespace(custom_id=request["custom_id"],
+                                  result=SimpleNamespace(type="succeeded", message=message))
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    fake = FakeBatches()
+    client = SimpleNamespace(messages=SimpleNamespace(batches=fake))
+    monkeypatch.setitem(batch_runner.PROVIDERS["anthropic"], "client", lambda api_key, base_url: client)
+    return fake
+
+
+@pytest.fixture
+def run(tmp_path):
+    dataset_path = tmp_path / "cases.jsonl"
+    write_cases(dataset_path, CASES)
+    dataset = EvalDataset(dataset_path)
+    archive = ResponseArchive(tmp_path / "responses.db")
+    ledger = CostLedger(tmp_path / "ledger.db")
+    state_path = tmp_path / "run.json"
+
+    def run_once(system_prompt="You are a shopping assistant."):
+        return run_batch("anthropic", "key", system_prompt, str(state_path), dataset=dataset,
+                         poll_interval=0, chunk_size=2, archive=archive, ledger=ledger)
+    run_once.state_path = state_path
+    run_once.ledger = ledger
+    return run_once
+
+
+def test_run_submits_chunks_and_scores_every_case(batches, run):
+    state = run()
+
+    assert list(batches.created) == ["batch_1", "batch_2"]
+    assert state["summary"]["total"] == 3
+    assert state["summary"]["passed"] == 3
+    results = load_results(run.state_path)
+    assert sorted(results) == sorted(job_id for job in state["jobs"] for job_id in job["custom_ids"])
+    assert all("response_ref" in r and "response" not in r for r in results.values())
+    # The state file only tracks jobs; results are appended next to it
+    assert "results" not in load_state(run.state_path)
+
+
+def test_resume_polls_saved_jobs_instead_of_resubmitting(batches, run):
+    # Both chunks are submitted, then polling fails after the first job is scored
+    batches.polls_until_lost = 1
+    with pytest.raises(ConnectionError):
+        run()
+    saved = load_state(run.state_path)
+    assert [job["status"] for job in saved["jobs"]] == ["scored", "submitted"]
+
+    batches.polls_until_lost = None
+    state = run()
+
+    assert list(batches.created) == ["batch_1", "batch_2"]
+    assert [job["status"] for job in state["jobs"]] == ["scored", "scored"]
+    assert state["summary"]["passed"] == 3
+    # Each case is billed once, however many times the run was started
+    assert run.ledger.totals()["calls"] == 3
+
+
+def test_resume_refuses_a_state_file_from_another_prompt(batches, run):
+    run()
+    with pytest.raises(ValueError, match="different run"):
+        run(system_prompt="Another prompt")
+
+
+def test_a_line_cut_short_by_a_crash_is_skipped(tmp_path):
+    state_path = tmp_path / "run.json"
+    append_results(state_path, {"q-1": {"success": True}})
+    with open(results_path(state_path), "a") as f:
+        f.write('{"custom_id": "q-2", "succ')
+    append_results(state_path, {"q-2": {"success": False}, "q-1": {"success": False, "error": "retried"}})
+    assert load_results(state_path) == {
+        "q-1": {"success": False, "error": "retried"},
+        "q-2": {"success": False}
+    }
+    assert load_results(tmp_path / "missing.json") == {}
+
+
+def test_inline_results_of_an_older_state_file_are_moved_out(batches, run):
+    run()
+    state = load_state(run.state_path)
+    state["results"] = load_results(run.state_path)
+    results_path(run.state_path).unlink()
+    save_state(run.state_path, state)
+
+    state = run()
+    assert state["summary"]["total"] == 3
+    assert "results" not in load_state(run.state_path)
+    assert len(load_results(run.state_path)) == 3
@@ -0,0 +1,72 @@
+"""call_claude deadlines and token usage, against a fake Anthropic client"""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import claude_api
+from claude_api import call_claude, usage_tokens
+
+
+def usage(input_tokens, output_tokens, cache_read=0, cache_write=0):
+    return SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens,
+                           cache_read_input_tokens=cache_read, cache_creation_input_tokens=cache_write)
+
+
+class FakeMessages:
+    """Answers with a tool call first, then text; the first answer takes `delay` seconds"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.requests = []
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        if len(self.requests) == 1:
+            time.sleep(self.delay)
+            tool_use = SimpleNamespace(type="tool_use", id="tool_1",
+                                       input={"sql_query": "SELECT COUNT(*) FROM feedback_submissions"})
+            return SimpleNamespace(stop_reason="tool_use", content=[tool_use], usage=usage(500, 40, cache_read=100))
+        return SimpleNamespace(stop_reason="end_turn", content=[SimpleNamespace(type="text", text="Runs small.")],
+                               usage=usage(700, 60))
+
+
+@pytest.fixture
+def messages(monkeypatch):
+    messages = FakeMessages()
+    monkeypatch.setattr(claude_api.anthropic, "Anthropic",
+                        lambda **kwargs: SimpleNamespace(messages=messages, options=kwargs))
+    monkeypatch.setattr(claude_api, "run_tool_query", lambda sql, deadline=None: "COUNT(*)\n190")
+    return messages
+
+
+def test_usage_counts_cache_reads_and_writes_as_input():
+    assert usage_tokens(usage(500, 40, cache_read=100, cache_write=50), usage(700, 60)) == {
+        "input": 1350, "output": 100, "cached": 100, "cache_write": 50
+    }
+
+
+def test_tool_round_trip_sums_both_requests(messages):
+    result = call_claude("key", "Be brief", "Does 1094 run small?", use_tool=True)
+    assert result["success"] and result["response"] == "Runs small."
+    assert result["tokens"] == {"input": 1300, "output": 100, "cached": 100, "cache_write": 0}
+    assert messages.requests[1]["messages"][-1]["content"][0]["content"] == "COUNT(*)\n190"
+    assert "timeout" not in messages.requests[0]
+
+
+def test_each_request_gets_what_is_left_of_the_timeout(messages):
+    call_claude("key", "Be brief", "Does 1094 run small?", use_tool=True, timeout=5)
+    first, second = (request["timeout"] for request in messages.requests)
+    assert 4 < second <= first <= 5
+
+
+def test_a_timeout_after_the_tool_call_still_reports_the_first_request(messages):
+    messages.delay = 0.2
+    result = call_claude("key", "Be brief", "Does 1094 run small?", use_tool=True, timeout=0.1)
+    assert not result["success"]
+    assert result["timed_out"]
+    assert result["error"] == "Timed out after 0.1s"
+    # The first request completed and is billed even though the turn failed
+    assert result["model"] == "claude-haiku-4-5-20251001"
+    assert result["tokens"] == {"input": 600, "output": 40, "cached": 100, "cache_write": 0}
+    assert len(messages.requests) == 1
@@ -0,0 +1,117 @@
+"""Pricing, usage records, spend budgets and the ledger's rollups"""
+import sqlite3
+
+import pytest
+
+from cost_ledger import (BATCH_DISCOUNT, CACHE_WRITE_MULTIPLIER, CostLedger, SpendBudget, call_cost,
+                         estimate_sweep, model_prices, usage_records)
+
+HAIKU = "claude-haiku-4-5-20251001"
+
+
+def test_prices_match_dated_snapshots_by_prefix():
+    assert model_prices("gpt-4o-mini-2024-07-18") == model_prices("gpt-4o-mini")
+    assert model_prices("gpt-4o-2024-08-06") == model_prices("gpt-4o")
+    assert model_prices("unknown-model") is None
+
+
+def test_call_cost_prices_cached_reads_and_writes():
+    # 1M input tokens, of which 200k were cache reads and 300k cache writes
+    tokens = {"input": 1_000_000, "output": 0, "cached": 200_000, "cache_write": 300_000}
+    input_price, _, cached_price = model_prices(HAIKU)
+    expected = 0.5 * input_price + 0.2 * cached_price + 0.3 * input_price * CACHE_WRITE_MULTIPLIER
+    assert call_cost(HAIKU, tokens) == pytest.approx(expected)
+    assert call_cost(HAIKU, tokens, batch=True) == pytest.approx(expected * BATCH_DISCOUNT)
+
+
+def test_call_cost_of_unknown_model_or_missing_tokens_is_none():
+    assert call_cost("unknown-model", {"input": 1, "output": 1}) is None
+    assert call_cost(HAIKU, None) is None
+
+
+def test_usage_records_include_escalations_and_failed_calls():
+    result = {
+        "success": False, "error": "Timed out", "model": "claude-sonnet-4-5-20250929",
+        "tokens": {"input": 10, "output": 0},
+        "escalations": [{"model": HAIKU, "tokens": {"input": 100, "output": 50}}],
+    }
+    records = usage_records(result, "Anthropic", question_id=3)
+    assert [r["model"] for r in records] == [HAIKU, "claude-sonnet-4-5-20250929"]
+    assert all(r["question_id"] == "3" and r["provider"] == "Anthropic" for r in records)
+
+
+def test_usage_records_skip_calls_without_tokens():
+    assert usage_records({"success": False, "error": "Invalid key"}, "OpenAI") == []
+
+
+def test_estimate_sweep_counts_every_call():
+    kwargs = {"system_prompt": "Be helpful.", "user_message": "Should I order clothing ID 1094?"}
+    estimate = estimate_sweep({1: [(HAIKU, kwargs)], 2: [(HAIKU, kwargs), ("unknown-model", kwargs)]})
+    assert estimate["questions"] == 2
+    assert estimate["calls"] == 3
+    assert estimate["unpriced"] == 1
+    assert estimate["per_question"][2] == pytest.approx(estimate["per_question"][1])
+    assert estimate["cost"] == pytest.approx(2 * estimate["per_question"][1])
+
+
+def test_spend_budget_counts_questions_in_flight():
+    budget = SpendBudget(1.0, {1: 0.6, 2: 0.6}, cost_fn=lambda result: result["cost"])
+    assert budget.reserve(1)
+    assert not budget.reserve(2)  # 1 is still reserved
+    budget.settle(1, {"cost": 0.1})
+    assert budget.reserve(2)
+    budget.charge(0.5)  # e.g. a hedged request that lost, reported late
+    assert budget.spent == pytest.approx(0.6)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return CostLedger(tmp_path / "ledger.db")
+
+
+def record(ledger, model, output, **labels):
+    return ledger.record(usage_records({"model": model, "tokens": {"input": 1000, "output": output}}, "Anthropic"),
+                         **labels)
+
+
+def test_totals_filter_by_label(ledger):
+    record(ledger, HAIKU, 100, session_id="a", run_id="r1")
+    record(ledger, HAIKU, 100, session_id="a")
+    record(ledger, HAIKU, 100, session_id="b", run_id="r1")
+    assert ledger.totals(session_id="a")["calls"] == 2
+    assert ledger.totals(run_id="r1")["calls"] == 2
+    assert ledger.totals(session_id="a", run_id="r1")["calls"] == 1
+    assert ledger.totals()["input"] == 3000
+
+
+def test_rollup_orders_by_cost(ledger):
+    record(ledger, HAIKU, 100, session_id="cheap")
+    record(ledger, HAIKU, 5000, session_id="dear")
+    assert [row["session"] for row in ledger.rollup("session")] == ["dear", "cheap"]
+    with pytest.raises(ValueError):
+        ledger.rollup("nonsense")
+
+
+def test_average_output_tokens_per_model(ledger):
+    record(ledger, HAIKU, 100)
+    record(ledger, HAIKU, 300)
+    record(ledger, "gpt-4o-mini", 50)
+    assert ledger.average_output_tokens() == {HAIKU: 200, "gpt-4o-mini": 50}
+
+
+def test_ledgers_from_before_cache_writes_are_upgraded(tmp_path):
+    path = tmp_path / "old.db"
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE calls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, prompt_hash TEXT, run_id TEXT,
+            question_id TEXT, provider TEXT, model TEXT, input_tokens INTEGER NOT NULL,
+            output_tokens INTEGER NOT NULL, cached_tokens INTEGER NOT NULL DEFAULT 0, cost REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+    conn.close()
+    ledger = CostLedger(path)
+    record(ledger, HAIKU, 10)
+    assert ledger.totals()["calls"] == 1
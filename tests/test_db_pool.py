@@ -0,0 +1,115 @@
+"""Shared read-only connection pool and the database tool's query runner"""
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import db_pool
+from db_pool import ReadOnlyPool, get_pool, run_tool_query
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "reviews.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE feedback_submissions (id INTEGER PRIMARY KEY, review_text TEXT)")
+    conn.executemany("INSERT INTO feedback_submissions (review_text) VALUES (?)", [("Runs small",), ("Soft",)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.mark.parametrize("sql", [
+    "INSERT INTO feedback_submissions (review_text) VALUES ('spam')",
+    "UPDATE feedback_submissions SET review_text = ''",
+    "DELETE FROM feedback_submissions",
+    "DROP TABLE feedback_submissions",
+    "CREATE TABLE extra (x)",
+])
+def test_pooled_connections_cannot_write(db_path, sql):
+    pool = ReadOnlyPool(db_path)
+    with pytest.raises(sqlite3.OperationalError):
+        pool.execute(sql)
+    assert pool.execute("SELECT COUNT(*) FROM feedback_submissions") == [(2,)]
+
+
+def test_query_only_cannot_be_switched_off_by_a_query(db_path):
+    pool = ReadOnlyPool(db_path)
+    with pool.connection() as conn:
+        conn.execute("PRAGMA query_only = 0")
+        # The file itself is still opened read-only
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM feedback_submissions")
+
+
+def test_connections_are_reused(db_path):
+    pool = ReadOnlyPool(db_path, size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    assert pool._opened == 1
+
+
+def test_an_open_transaction_is_rolled_back_on_return(db_path):
+    pool = ReadOnlyPool(db_path)
+    with pool.connection() as conn:
+        conn.execute("BEGIN")
+        conn.execute("SELECT * FROM feedback_submissions").fetchall()
+    assert not conn.in_transaction
+
+
+def test_borrowers_wait_once_the_pool_is_full(db_path):
+    pool = ReadOnlyPool(db_path, size=1)
+    borrowed = []
+
+    def borrow():
+        with pool.connection() as conn:
+            borrowed.append(conn)
+
+    with pool.connection() as held:
+        thread = threading.Thread(target=borrow)
+        thread.start()
+        time.sleep(0.1)
+        assert not borrowed
+    thread.join(5)
+    assert borrowed == [held]
+    assert pool._opened == 1
+
+
+def test_get_pool_shares_one_pool_per_database(db_path, monkeypatch):
+    monkeypatch.setattr(db_pool, "_pools", {})
+    assert get_pool(db_path) is get_pool(str(db_path))
+    assert not get_pool(db_path).immutable
+
+    monkeypatch.setattr(db_pool, "_pools", {})
+    monkeypatch.setenv("EVALS_DB_IMMUTABLE", "1")
+    pool = get_pool(db_path)
+    assert pool.immutable
+    assert "immutable=1" in pool._uri()
+    assert pool.execute("SELECT COUNT(*) FROM feedback_submissions") == [(2,)]
+
+
+def test_tool_queries_return_a_compact_table(db_path):
+    assert run_tool_query("SELECT id, review_text FROM feedback_submissions", db_path) == (
+        "id|review_text\n1|Runs small\n2|Soft"
+    )
+
+
+def test_tool_query_errors_are_reported_to_the_model(db_path):
+    assert run_tool_query("DELETE FROM feedback_submissions", db_path).startswith("Error executing query:")
+    assert run_tool_query("SELECT nope FROM feedback_submissions", db_path) == (
+        "Error executing query: no such column: nope"
+    )
+
+
+def test_a_tool_query_past_its_deadline_is_interrupted(db_path, monkeypatch):
+    monkeypatch.setattr(db_pool, "DEADLINE_CHECK_STEPS", 100)
+    endless = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+    started = time.monotonic()
+    assert run_tool_query(endless, db_path, deadline=time.monotonic() + 0.2) == "Error executing query: interrupted"
+    assert time.monotonic() - started < 2
+
+    # The connection goes back to the pool without the deadline check
+    assert run_tool_query("SELECT COUNT(*) FROM feedback_submissions", db_path) == "COUNT(*)\n2"
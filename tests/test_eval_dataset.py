@@ -0,0 +1,68 @@
+"""JSONL eval dataset: streaming, lookup by ID, filtering and sharding"""
+import os
+
+import pytest
+
+from eval_dataset import EvalDataset, write_cases
+
+CASES = [
+    {"id": i, "question": f"Question {i} about clothing ID {1000 + i}?",
+     "tags": ["fit"] if i % 2 else ["quality"]}
+    for i in range(1, 11)
+]
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    # Two shards of one suite, matched by a glob
+    write_cases(tmp_path / "cases_a.jsonl", CASES[:6])
+    write_cases(tmp_path / "cases_b.jsonl", CASES[6:])
+    return EvalDataset(tmp_path / "cases_*.jsonl")
+
+
+def test_cases_stream_in_file_order(dataset):
+    assert [case["id"] for case in dataset] == list(range(1, 11))
+    assert len(dataset) == 10
+    assert dataset.ids() == [str(i) for i in range(1, 11)]
+
+
+def test_get_fetches_a_case_from_either_file(dataset):
+    assert dataset.get(3) == CASES[2]
+    assert dataset.get("9") == CASES[8]
+    assert 9 in dataset
+    assert dataset.get(42) is None
+    assert 42 not in dataset
+
+
+def test_tag_filter_and_pagination(dataset):
+    fit = [case["id"] for case in dataset.iter_cases(tags=["fit"])]
+    assert fit == [1, 3, 5, 7, 9]
+    assert [case["id"] for case in dataset.iter_cases(tags=["fit"], start=1, limit=2)] == [3, 5]
+    assert dataset.tags() == ["fit", "quality"]
+
+
+def test_shards_split_the_suite_without_overlap(dataset):
+    shards = [[case["id"] for case in dataset.iter_cases(shard_index=i, num_shards=3)] for i in range(3)]
+    assert sorted(sum(shards, [])) == list(range(1, 11))
+    with pytest.raises(ValueError):
+        list(dataset.iter_cases(shard_index=3, num_shards=3))
+
+
+def test_duplicate_ids_are_rejected(tmp_path):
+    write_cases(tmp_path / "cases.jsonl", [CASES[0], CASES[0]])
+    with pytest.raises(ValueError, match="Duplicate eval case id 1"):
+        len(EvalDataset(tmp_path / "cases.jsonl"))
+
+
+def test_index_is_rebuilt_when_a_file_changes(tmp_path):
+    path = tmp_path / "cases.jsonl"
+    write_cases(path, CASES[:2])
+    dataset = EvalDataset(path)
+    assert dataset.get(2)["question"] == CASES[1]["question"]
+
+    edited = dict(CASES[1], question="Edited?")
+    write_cases(path, [edited, CASES[0]])
+    stat = path.stat()
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert dataset.get(2)["question"] == "Edited?"
+    assert dataset.ids() == ["2", "1"]
@@ -0,0 +1,85 @@
+"""Parquet exports of reviews, eval history and batch results"""
+import json
+import sqlite3
+
+import pyarrow.parquet as pq
+import pytest
+
+from batch_runner import append_results
+from export_data import (BATCH_RESULT_SCHEMA, REVIEW_SCHEMA, export_batch_results, export_eval_history,
+                         export_reviews, load_parquet)
+from init_db import init_database
+from response_archive import ResponseArchive
+from scheduler import EvalHistory
+
+
+@pytest.fixture
+def db_path(tmp_path, capsys):
+    path = tmp_path / "reviews.db"
+    init_database(path)
+    capsys.readouterr()
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO feedback_submissions (clothing_id, age, review_text, rating, recommended_ind, "
+        "positive_feedback_count) VALUES (?, 30, ?, ?, 1, 0)",
+        [(1094 if i % 2 else 829, f"Review {i}", 1 + i % 5) for i in range(7)]
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_reviews_are_written_one_row_group_per_chunk(tmp_path, db_path):
+    out = tmp_path / "reviews.parquet"
+    assert export_reviews(db_path, out, chunk_size=3) == 7
+
+    parquet = pq.ParquetFile(out)
+    assert parquet.schema_arrow == REVIEW_SCHEMA
+    assert parquet.metadata.num_row_groups == 3
+    table = load_parquet(out)
+    assert table.column("review_text").to_pylist() == [f"Review {i}" for i in range(7)]
+
+
+def test_load_parquet_reads_only_the_requested_columns_and_rows(tmp_path, db_path):
+    out = tmp_path / "reviews.parquet"
+    export_reviews(db_path, out, chunk_size=3)
+    table = load_parquet(out, columns=["id", "rating"], filters=[("clothing_id", "=", 1094)])
+    assert table.column_names == ["id", "rating"]
+    assert table.column("id").to_pylist() == [2, 4, 6]
+
+
+def test_eval_history_export(tmp_path):
+    history = EvalHistory(tmp_path / "eval_history.db")
+    history.record("key", "prompt", 1, {"passed": True, "details": {"mentions_sarah": True}})
+    history.record("key", "prompt", 2, {"passed": False, "details": {"mentions_sarah": False}})
+
+    out = tmp_path / "evals.parquet"
+    assert export_eval_history(tmp_path / "eval_history.db", out) == 2
+    rows = load_parquet(out, columns=["question_id", "passed", "details"]).to_pylist()
+    assert rows == [
+        {"question_id": "1", "passed": True, "details": '{"mentions_sarah": true}'},
+        {"question_id": "2", "passed": False, "details": '{"mentions_sarah": false}'},
+    ]
+
+
+def test_batch_results_read_response_bodies_from_the_archive(tmp_path):
+    archive = ResponseArchive(tmp_path / "responses.db")
+    ref = archive.put("Sarah, size up.")
+    state_path = tmp_path / "run_1.json"
+    state_path.write_text(json.dumps({
+        "provider": "anthropic", "model": "claude-haiku-4-5-20251001", "prompt_hash": "abc", "jobs": []
+    }))
+    append_results(state_path, {
+        "q-1": {"success": True, "response_ref": ref, "tokens": {"input": 100, "output": 20, "cached": 0},
+                "eval": {"passed": True, "details": {"mentions_sarah": True}}},
+        "q-2": {"success": False, "error": "overloaded"}
+    })
+
+    out = tmp_path / "batch.parquet"
+    assert export_batch_results([state_path], out, archive=archive) == 2
+    table = load_parquet(out)
+    assert table.schema == BATCH_RESULT_SCHEMA
+    first, second = table.to_pylist()
+    assert first["run"] == "run_1" and first["response"] == "Sarah, size up." and first["passed"]
+    assert first["input_tokens"] == 100
+    assert second["error"] == "overloaded" and second["passed"] is None
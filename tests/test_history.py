@@ -0,0 +1,68 @@
+"""Token estimates and budgeted conversation history"""
+from history import build_history, estimate_tokens, summarize_turns
+
+
+def turns(n, words=20):
+    """n alternating user/assistant messages of the given length, oldest first"""
+    return [{"role": "user" if i % 2 == 0 else "assistant",
+             "content": f"Message {i}. " + "word " * words}
+            for i in range(n)]
+
+
+def test_estimate_tokens_counts_words_and_punctuation():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("Does it run small?") == 5
+
+
+def test_estimate_tokens_falls_back_to_characters_for_unbroken_text():
+    assert estimate_tokens("x" * 400) == 100
+
+
+def test_short_history_is_kept_whole():
+    messages = turns(4)
+    history = build_history(messages, token_budget=2000)
+    assert history["messages"] == messages
+    assert history["summary"] is None
+    assert history["dropped"] == 0
+
+
+def test_long_history_keeps_the_newest_turns_within_budget():
+    messages = turns(40)
+    history = build_history(messages, token_budget=300, summarize=False)
+    kept = history["messages"]
+    assert kept == [{"role": m["role"], "content": m["content"]} for m in messages[-len(kept):]]
+    assert sum(estimate_tokens(m["content"]) + 4 for m in kept) <= 300
+    assert history["dropped"] == 40 - len(kept)
+
+
+def test_kept_history_opens_with_a_user_turn():
+    messages = turns(41)[1:]  # oldest message is the assistant's
+    for budget in (100, 150, 200, 250):
+        kept = build_history(messages, token_budget=budget)["messages"]
+        assert not kept or kept[0]["role"] == "user"
+
+
+def test_dropped_turns_are_folded_into_a_summary():
+    history = build_history(turns(40), token_budget=400)
+    assert history["summary"].splitlines()[-1].startswith("- ")
+    assert estimate_tokens(history["summary"]) <= 100  # SUMMARY_BUDGET_RATIO of 400
+
+
+def test_summary_keeps_the_newest_lines_that_fit():
+    summary = summarize_turns(turns(10), token_budget=20)
+    assert "Message 9." in summary
+    assert "Message 0." not in summary
+
+
+def test_an_earlier_summary_is_carried_ahead_of_newer_lines():
+    earlier = summarize_turns(turns(4), token_budget=1000)
+    summary = summarize_turns(turns(6)[4:], token_budget=1000, earlier=earlier)
+    assert summary.splitlines() == earlier.splitlines() + summarize_turns(turns(6)[4:], 1000).splitlines()
+    # Its lines are the oldest, so they are dropped first
+    assert "Message 0." not in summarize_turns(turns(6)[4:], token_budget=20, earlier=earlier)
+
+
+def test_an_earlier_summary_is_used_even_when_every_message_fits():
+    history = build_history(turns(2), token_budget=2000, earlier_summary="- User: Message 0.")
+    assert history["summary"] == "- User: Message 0."
+    assert history["dropped"] == 0
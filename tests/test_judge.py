@@ -0,0 +1,125 @@
+"""LLM judge batching, verdict cache keys and malformed verdicts, with a fake judge call"""
+import threading
+
+import pytest
+
+import judge
+from judge import JUDGE_CHECK, apply_verdict, judge_responses
+
+
+def make_items(n, ground_truth="Runs small; size up."):
+    return [{"id": i, "question": f"Does {i} run small?", "response": f"Answer {i}: size up.",
+             "ground_truth": ground_truth} for i in range(1, n + 1)]
+
+
+class FakeJudge:
+    """Stands in for _judge_anthropic; passes every item unless told otherwise"""
+
+    def __init__(self):
+        self.batches = []
+        self.overrides = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, client, items, model, rubric):
+        with self.lock:
+            self.batches.append([item["id"] for item in items])
+        verdicts = []
+        for item in items:
+            verdict = {"id": str(item["id"]), "passed": True, "score": 0.9, "reason": "Consistent."}
+            override = self.overrides.get(item["id"], {})
+            if override is None:
+                continue
+            verdicts.append({**verdict, **override})
+        return verdicts, {"input": 100, "output": 20, "cached": 0}
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    fake = FakeJudge()
+    monkeypatch.setattr(judge, "_judge_anthropic", fake)
+    return fake
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return tmp_path / "judge_cache.db"
+
+
+def test_items_are_graded_in_batches(fake, cache_path):
+    verdicts, usage = judge_responses(make_items(7), "anthropic", "key", batch_size=3,
+                                      cache_path=cache_path, return_usage=True)
+    assert sorted(len(batch) for batch in fake.batches) == [1, 3, 3]
+    assert set(verdicts) == {str(i) for i in range(1, 8)}
+    assert all(v["passed"] and not v["cached"] for v in verdicts.values())
+    assert len(usage) == 3
+    assert usage[0]["model"] == judge.DEFAULT_JUDGE_MODELS["anthropic"]
+
+
+def test_graded_responses_are_served_from_the_cache(fake, cache_path):
+    judge_responses(make_items(3), "anthropic", "key", cache_path=cache_path)
+    verdicts, usage = judge_responses(make_items(3), "anthropic", "key", cache_path=cache_path,
+                                      return_usage=True)
+    assert len(fake.batches) == 1
+    assert usage == []
+    assert all(v["cached"] and v["score"] == 0.9 for v in verdicts.values())
+
+
+def test_cache_key_covers_the_response_ground_truth_and_judge_model(fake, cache_path):
+    judge_responses(make_items(1), "anthropic", "key", cache_path=cache_path)
+
+    changed_response = [dict(make_items(1)[0], response="A different answer.")]
+    changed_truth = make_items(1, ground_truth="True to size.")
+    judge_responses(changed_response, "anthropic", "key", cache_path=cache_path)
+    judge_responses(changed_truth, "anthropic", "key", cache_path=cache_path)
+    judge_responses(make_items(1), "anthropic", "key", model="claude-sonnet-4-5", cache_path=cache_path)
+    assert len(fake.batches) == 4
+
+    # The item ID is not part of the key: the same graded answer under another ID is a hit
+    renumbered = [dict(make_items(1)[0], id=99)]
+    assert judge_responses(renumbered, "anthropic", "key", cache_path=cache_path)["99"]["cached"]
+    assert len(fake.batches) == 4
+
+
+def test_a_malformed_verdict_only_loses_its_own_item(fake, cache_path):
+    fake.overrides = {2: {"passed": "yes"}, 3: None}
+    verdicts = judge_responses(make_items(3), "anthropic", "key", cache_path=cache_path)
+
+    assert verdicts["1"]["passed"]
+    assert "Malformed judge verdict" in verdicts["2"]["error"]
+    assert verdicts["3"] == {"error": "Judge returned no verdict for this item"}
+
+    # Errors are not cached, so those items are graded again next time
+    fake.overrides = {}
+    verdicts = judge_responses(make_items(3), "anthropic", "key", cache_path=cache_path)
+    assert fake.batches[-1] == [2, 3]
+    assert verdicts["1"]["cached"] and verdicts["2"]["passed"] and verdicts["3"]["passed"]
+
+
+def test_a_missing_score_defaults_from_the_verdict(fake, cache_path):
+    fake.overrides = {1: {"passed": False, "score": None}}
+    verdicts = judge_responses(make_items(1), "anthropic", "key", cache_path=cache_path)
+    assert verdicts["1"]["score"] == 0.0
+
+
+def test_a_failed_judge_call_is_an_error_for_its_batch(monkeypatch, cache_path):
+    def failing(client, items, model, rubric):
+        raise RuntimeError("overloaded")
+    monkeypatch.setattr(judge, "_judge_anthropic", failing)
+    verdicts = judge_responses(make_items(2), "anthropic", "key", cache_path=cache_path)
+    assert verdicts == {"1": {"error": "overloaded"}, "2": {"error": "overloaded"}}
+
+
+def test_unknown_provider():
+    with pytest.raises(ValueError):
+        judge_responses(make_items(1), "gemini", "key")
+
+
+def test_apply_verdict_adds_an_assertion():
+    eval_result = {"passed": True, "details": {"mentions_sarah": True}}
+    apply_verdict(eval_result, {"passed": False, "score": 0.2, "reason": "Contradicts.", "cached": False})
+    assert eval_result["details"][JUDGE_CHECK] is False
+    assert not eval_result["passed"]
+
+    eval_result = {"passed": True, "details": {"mentions_sarah": True}}
+    apply_verdict(eval_result, {"error": "overloaded"})
+    assert eval_result["passed"] and JUDGE_CHECK not in eval_result["details"]
@@ -0,0 +1,111 @@
+"""MinHash signatures, LSH duplicate marking and the stored index"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ingest_data import write_review_chunks
+from init_db import init_database
+from near_duplicates import NUM_PERM, NearDuplicateIndex, mark_near_duplicates, minhash_signatures
+
+REVIEW = ("I ordered my usual size and the dress runs small through the bust, "
+          "so I had to exchange it for the next size up which fits perfectly")
+REPOST = REVIEW.replace("perfectly", "great")
+OTHER = "Lovely soft sweater, the colour is exactly as pictured and it washes well without pilling"
+
+
+def kaggle_rows(rows):
+    """(clothing_id, review_text) pairs as the Kaggle CSV columns ingest expects"""
+    return pd.DataFrame({
+        "Clothing ID": [clothing_id for clothing_id, _ in rows],
+        "Age": 35, "Title": None,
+        "Review Text": [text for _, text in rows],
+        "Rating": 4, "Recommended IND": 1, "Positive Feedback Count": 0,
+        "Division Name": "General", "Department Name": "Dresses", "Class Name": "Dresses"
+    })
+
+
+@pytest.fixture
+def db_path(tmp_path, capsys):
+    path = tmp_path / "reviews.db"
+    init_database(path)
+    capsys.readouterr()
+    return path
+
+
+def insert(db_path, rows):
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO feedback_submissions (clothing_id, review_text) VALUES (?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def canonical_ids(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT canonical_id FROM feedback_submissions ORDER BY id").fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def test_signature_agreement_tracks_similarity():
+    review, repost, other = minhash_signatures([REVIEW, REPOST, OTHER])
+    assert np.count_nonzero(review == repost) / NUM_PERM > 0.7
+    assert np.count_nonzero(review == other) / NUM_PERM < 0.2
+
+
+def test_texts_without_words_get_the_empty_signature():
+    signature = minhash_signatures(["", REVIEW])[0]
+    assert (signature == np.iinfo(np.uint32).max).all()
+
+
+def test_mark_points_copies_at_the_first_review(db_path):
+    insert(db_path, [(1094, REVIEW), (1094, OTHER), (1094, REPOST), (1094, REVIEW)])
+
+    summary = mark_near_duplicates(db_path)
+
+    assert summary == {"rows": 4, "duplicates": 2}
+    assert canonical_ids(db_path) == [None, None, 1, 1]
+
+
+def test_copies_of_another_product_are_not_duplicates(db_path):
+    insert(db_path, [(1094, REVIEW), (829, REVIEW)])
+    mark_near_duplicates(db_path)
+    assert canonical_ids(db_path) == [None, None]
+
+
+def test_remarking_gives_the_same_result(db_path):
+    insert(db_path, [(1094, REVIEW), (1094, REPOST), (1094, OTHER)])
+    mark_near_duplicates(db_path)
+    first = canonical_ids(db_path)
+    mark_near_duplicates(db_path)
+    assert canonical_ids(db_path) == first
+
+
+def test_index_survives_reopening(db_path):
+    conn = sqlite3.connect(db_path)
+    NearDuplicateIndex(conn).add([1], [1094], [REVIEW])
+    conn.commit()
+    conn.close()
+
+    conn = sqlite3.connect(db_path)
+    index = NearDuplicateIndex(conn)
+    assert len(index) == 1
+    assert index.add([2, 3], [1094, 1094], [REPOST, OTHER]) == [1, None]
+    conn.close()
+
+
+def test_ingest_marks_copies_of_reviews_already_in_the_database(db_path):
+    insert(db_path, [(1094, REVIEW)])
+
+    summary = write_review_chunks([kaggle_rows([(1094, REPOST), (1094, OTHER)])], db_path, near_duplicates="mark")
+
+    assert summary["near_duplicates"] == 1
+    assert canonical_ids(db_path) == [None, 1, None]
+
+
+def test_ingest_drop_leaves_copies_out(db_path):
+    rows = [(1094, REVIEW), (1094, REPOST), (1094, OTHER)]
+    summary = write_review_chunks([kaggle_rows(rows)], db_path, near_duplicates="drop")
+    assert summary["rows"] == 2
+    assert canonical_ids(db_path) == [None, None]
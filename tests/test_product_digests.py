@@ -0,0 +1,109 @@
+"""Per-product review digests and their incremental refresh"""
+import sqlite3
+
+import pytest
+
+from init_db import init_database
+from product_digests import build_digest, format_digest, load_digest, refresh_digests
+
+
+def review(rating, text, helpful=0, recommended=1, title=None):
+    return {"rating": rating, "recommended_ind": recommended, "positive_feedback_count": helpful,
+            "title": title, "review_text": text}
+
+
+REVIEWS = [
+    review(5, "Love it, but it runs small so I sized up.", helpful=9),
+    review(4, "Runs a little small in the hips. Otherwise great.", helpful=2),
+    review(5, "True to size and so soft."),
+    review(2, "Pilling after one wear and the seams are fraying.", helpful=6, recommended=0),
+    review(1, "See-through fabric, and it started pilling.", helpful=1, recommended=0),
+    review(5, "Pilling? None so far, love it."),
+]
+
+
+def test_digest_summarises_ratings_sizing_and_complaints():
+    digest = build_digest(1094, REVIEWS)
+    assert digest["review_count"] == 6
+    assert digest["average_rating"] == 3.67
+    assert digest["ratings"] == {"5": 3, "4": 1, "2": 1, "1": 1}
+    assert digest["recommend_rate"] == 0.67
+    assert digest["sizing"] == {"verdict": "runs small", "votes": {"runs small": 2, "true to size": 1}}
+    # Only 1-3 star reviews count towards complaints
+    assert digest["complaints"] == {"pilling": 2, "seams / fraying / holes": 1, "thin / see-through": 1}
+    assert digest["complaint_reviews"] == 2
+    assert digest["quotes"]["positive"]["text"] == "Love it, but it runs small so I sized up."
+    assert digest["quotes"]["critical"]["helpful"] == 6
+
+
+def test_split_sizing_votes_are_reported_as_mixed():
+    digest = build_digest(1, [review(4, "Runs small."), review(4, "Runs large."), review(4, "True to size.")])
+    assert digest["sizing"]["verdict"] == "mixed sizing feedback"
+    assert build_digest(1, [review(4, "Nice.")])["sizing"]["verdict"] == "no sizing feedback"
+
+
+def test_long_quotes_are_cut_at_a_sentence_end():
+    text = "Great dress. " * 10 + "x" * 200
+    quote = build_digest(1, [review(5, text)])["quotes"]["positive"]["text"]
+    assert quote.endswith("Great dress.")
+    assert len(quote) <= 200
+
+
+def test_formatted_digest():
+    text = format_digest(build_digest(1094, REVIEWS))
+    assert text.splitlines()[:3] == [
+        "Review digest for clothing ID 1094 (6 reviews, precomputed from the reviews database):",
+        "- Rating 3.67/5 (5★ 3, 4★ 1, 2★ 1, 1★ 1); 67% recommend",
+        "- Sizing: runs small (2 say runs small, 1 say true to size)",
+    ]
+    assert "- Quality complaints in 2 reviews rated 1-3★: pilling (2)" in text
+
+
+@pytest.fixture
+def db_path(tmp_path, capsys):
+    path = tmp_path / "reviews.db"
+    init_database(path)
+    capsys.readouterr()
+    insert(path, [(1094, r["rating"], r["review_text"]) for r in REVIEWS] + [(829, 4, "Runs large.")])
+    return path
+
+
+def insert(db_path, rows):
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO feedback_submissions (clothing_id, rating, recommended_ind, review_text) VALUES (?, ?, 1, ?)", rows
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_refresh_only_recomputes_products_with_new_reviews(db_path):
+    assert refresh_digests(db_path) == 2
+    assert refresh_digests(db_path) == 0
+
+    insert(db_path, [(829, 2, "Runs large and the zipper broke.")])
+    assert refresh_digests(db_path) == 1
+    assert load_digest(829, db_path)["review_count"] == 2
+    assert refresh_digests(db_path, full=True) == 2
+
+
+def test_copies_are_left_out_of_digests(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE feedback_submissions SET canonical_id = 1 WHERE id = 2")
+    conn.commit()
+    conn.close()
+    refresh_digests(db_path)
+    assert load_digest(1094, db_path)["review_count"] == 5
+
+
+def test_load_digest(db_path, tmp_path):
+    refresh_digests(db_path)
+    digest = load_digest(1094, db_path)
+    assert digest["summary"].startswith("Review digest for clothing ID 1094")
+    assert digest["sizing"]["verdict"] == "runs small"
+    assert load_digest(4242, db_path) is None
+
+    # A database that predates the digest table has no digests
+    bare = tmp_path / "bare.db"
+    sqlite3.connect(bare).close()
+    assert load_digest(1094, bare) is None
@@ -0,0 +1,203 @@
+"""Provider dispatch with fake provider calls"""
+import threading
+import time
+
+import pytest
+
+import providers
+from providers import LatencyTracker, call_providers
+
+
+class FakeCall:
+    """Stands in for call_claude / call_openai: answers after a delay"""
+
+    def __init__(self, name, delay=0.0, success=True, tokens=None):
+        self.name = name
+        self.delay = delay
+        self.success = success
+        self.tokens = tokens or {"input": 100, "output": 10, "cached": 0}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, **kwargs):
+        with self.lock:
+            self.calls.append(kwargs)
+        time.sleep(self.delay)
+        if not self.success:
+            return {"success": False, "error": f"{self.name} failed"}
+        return {"success": True, "response": f"{self.name} answer", "model": kwargs.get("model"),
+                "tokens": dict(self.tokens)}
+
+
+@pytest.fixture(autouse=True)
+def latencies(monkeypatch):
+    tracker = LatencyTracker()
+    monkeypatch.setattr(providers, "latency_tracker", tracker)
+    return tracker
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    fakes = {"Anthropic": FakeCall("claude", delay=0.3), "OpenAI": FakeCall("gpt", delay=0.3)}
+    for brand, fake in fakes.items():
+        monkeypatch.setitem(providers.PROVIDER_CALLS, brand, fake)
+    return fakes
+
+
+def test_compared_providers_are_called_at_the_same_time(fakes):
+    started = time.perf_counter()
+    results = call_providers({"Anthropic": {"user_message": "Hi"}, "OpenAI": {"user_message": "Hi"}})
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.55
+    assert list(results) == ["Anthropic", "OpenAI"]
+    assert results["Anthropic"]["response"] == "claude answer"
+    assert results["OpenAI"]["provider"] == "OpenAI"
+    assert all(result["latency"] >= 0.3 for result in results.values())
+    assert fakes["OpenAI"].calls == [{"user_message": "Hi"}]
+
+
+def test_one_failing_provider_does_not_hide_the_other(fakes):
+    fakes["OpenAI"].success = False
+    results = call_providers({"Anthropic": {}, "OpenAI": {}})
+    assert results["Anthropic"]["success"]
+    assert results["OpenAI"] == {"success": False, "error": "gpt failed", "latency": pytest.approx(0.3, abs=0.2),
+                                 "provider": "OpenAI"}
+
+
+def test_successful_latencies_are_tracked_per_model(fakes, latencies):
+    fakes["Anthropic"].delay = 0
+    call_providers({"Anthropic": {"model": "claude-haiku-4-5-20251001"}})
+    key = ("Anthropic", "claude-haiku-4-5-20251001", False)
+    assert latencies.percentile(key, min_samples=1) is not None
+    assert latencies.percentile(key) is None
+
+
+class TieredCall(FakeCall):
+    """Answers with the model name, so a pass check can accept some tiers only"""
+
+    def __call__(self, **kwargs):
+        result = super().__call__(**kwargs)
+        result["response"] = f"answer from {kwargs['model']}"
+        return result
+
+
+@pytest.fixture
+def tiered(monkeypatch):
+    fake = TieredCall("claude", tokens={"input": 100, "output": 10, "cached": 0})
+    monkeypatch.setitem(providers.PROVIDER_CALLS, "Anthropic", fake)
+    return fake
+
+
+TIERS = ["small", "medium", "large"]
+
+
+def test_routed_calls_stop_at_the_first_passing_tier(tiered):
+    result = providers.call_routed("Anthropic", lambda r: r["model"] == "small", tiers=TIERS)
+    assert result["tier"] == 0
+    assert result["escalations"] == []
+    assert [call["model"] for call in tiered.calls] == ["small"]
+
+
+def test_failing_answers_escalate_to_stronger_models(tiered):
+    tiered.delay = 0.05
+    result = providers.call_routed("Anthropic", lambda r: r["model"] == "medium", tiers=TIERS)
+    assert result["tier"] == 1
+    assert result["response"] == "answer from medium"
+    assert [e["model"] for e in result["escalations"]] == ["small"]
+    assert result["escalations"][0]["tokens"] == {"input": 100, "output": 10, "cached": 0}
+    # The turn's latency includes the tier that failed
+    assert result["latency"] >= 0.1
+
+
+def test_the_last_tier_is_kept_even_if_it_fails(tiered):
+    result = providers.call_routed("Anthropic", lambda r: False, tiers=TIERS)
+    assert result["tier"] == 2
+    assert len(result["escalations"]) == 2
+    assert len(tiered.calls) == 3
+
+
+def test_routing_uses_the_brand_tiers_by_default(tiered):
+    result = providers.call_routed("Anthropic", lambda r: False)
+    assert [call["model"] for call in tiered.calls] == providers.MODEL_TIERS["Anthropic"]
+    assert result["model"] == providers.MODEL_TIERS["Anthropic"][-1]
+
+
+def test_call_providers_routes_only_the_given_brands(fakes):
+    results = call_providers({"Anthropic": {}, "OpenAI": {}},
+                             route={"Anthropic": lambda r: True})
+    assert results["Anthropic"]["tier"] == 0
+    assert "tier" not in results["OpenAI"]
+
+
+def test_a_call_gets_what_is_left_of_the_deadline(tiered):
+    deadline = time.monotonic() + 5
+    providers.call_provider("Anthropic", deadline=deadline, model="small", timeout=60)
+    assert 4 < tiered.calls[0]["timeout"] <= 5
+
+    providers.call_provider("Anthropic", deadline=time.monotonic() + 60, model="small", timeout=2)
+    assert tiered.calls[1]["timeout"] == 2
+
+
+def test_a_call_is_not_sent_once_the_deadline_has_passed(tiered):
+    result = providers.call_provider("Anthropic", deadline=time.monotonic() - 1, model="small")
+    assert not result["success"] and result["timed_out"]
+    assert tiered.calls == []
+
+
+def test_with_deadline_shares_one_deadline_across_brands():
+    late = []
+    requests = providers.with_deadline({"Anthropic": {"model": "a"}, "OpenAI": {}}, 30, hedge=True,
+                                       on_late_usage=late.append)
+    assert requests["Anthropic"]["deadline"] == requests["OpenAI"]["deadline"]
+    assert 29 < requests["Anthropic"]["deadline"] - time.monotonic() <= 30
+    assert requests["Anthropic"]["model"] == "a" and requests["OpenAI"]["hedge"]
+    assert providers.with_deadline({"Anthropic": {}})["Anthropic"]["deadline"] is None
+
+
+def test_no_escalation_once_the_deadline_has_passed(tiered):
+    tiered.delay = 0.2
+    result = providers.call_routed("Anthropic", lambda r: False, tiers=TIERS, deadline=time.monotonic() + 0.1)
+    assert result["tier"] == 0
+    assert [call["model"] for call in tiered.calls] == ["small"]
+
+
+class SlowFirstCall(FakeCall):
+    """The first request hangs for a while; later ones answer quickly"""
+
+    def __call__(self, **kwargs):
+        with self.lock:
+            first = not self.calls
+            self.calls.append(kwargs)
+        time.sleep(0.5 if first else 0.01)
+        return {"success": True, "response": "first" if first else "duplicate", "tokens": dict(self.tokens)}
+
+
+def test_a_slow_call_is_hedged_and_the_loser_is_billed_when_it_finishes(monkeypatch, latencies):
+    fake = SlowFirstCall("claude", tokens={"input": 100, "output": 10, "cached": 0})
+    monkeypatch.setitem(providers.PROVIDER_CALLS, "Anthropic", fake)
+    key = ("Anthropic", "small", False)
+    for _ in range(providers.HEDGE_MIN_SAMPLES):
+        latencies.record(key, 0.05)
+
+    late = []
+    finished = threading.Event()
+
+    def on_late_usage(brand, result):
+        late.append((brand, result["response"], result["tokens"]))
+        finished.set()
+
+    result = providers.call_provider("Anthropic", hedge=True, on_late_usage=on_late_usage, model="small")
+    assert result["response"] == "duplicate"
+    assert result["hedge"] == {"after": 0.05, "sent": True, "won_by_duplicate": True}
+    assert result["latency"] < 0.4
+    assert late == []
+
+    assert finished.wait(5)
+    assert late == [("Anthropic", "first", {"input": 100, "output": 10, "cached": 0})]
+
+
+def test_no_hedge_without_enough_latency_history(tiered):
+    result = providers.call_provider("Anthropic", hedge=True, model="small")
+    assert "hedge" not in result
+    assert len(tiered.calls) == 1
@@ -0,0 +1,73 @@
+"""Deduplicated, dictionary-compressed response archive"""
+import pytest
+
+import response_archive
+from response_archive import ResponseArchive, response_hash, train_dictionary
+
+
+def answer(i):
+    return (f"Hi Sarah! Clothing ID {1000 + i} runs a little small, so order one size up. "
+            f"Reviewers love the fabric and it holds up well for work presentations. "
+            f"Buy it here: https://santra.com/clothing/{1000 + i}")
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return ResponseArchive(tmp_path / "responses.db")
+
+
+def test_bodies_round_trip_by_content_hash(archive):
+    digests = archive.put_many(["Runs small ✓", "Lovely fabric"])
+    assert digests == [response_hash("Runs small ✓"), response_hash("Lovely fabric")]
+    assert archive.get_many(digests) == {digests[0]: "Runs small ✓", digests[1]: "Lovely fabric"}
+    assert archive.get("unknown") is None
+    assert archive.get_many([]) == {}
+
+
+def test_identical_responses_are_stored_once(archive):
+    first = archive.put_many([answer(1), answer(1)])
+    second = archive.put(answer(1))
+    assert first == [second, second]
+    assert archive.stats()["responses"] == 1
+
+
+def test_dictionary_is_built_from_recurring_phrases():
+    dictionary = train_dictionary([answer(i) for i in range(20)])
+    assert 0 < len(dictionary) <= response_archive.MAX_DICTIONARY_BYTES
+    assert b"runs a little small" in dictionary
+    assert train_dictionary(["one answer"]) == b""
+
+
+def test_training_compresses_new_bodies_better(archive):
+    archive.put_many(answer(i) for i in range(50))
+    before = archive.stats()
+    assert archive.train() > 0
+
+    archive.put_many(answer(i) for i in range(50, 100))
+    after = archive.stats()
+    new_stored = after["stored_bytes"] - before["stored_bytes"]
+    new_raw = after["raw_bytes"] - before["raw_bytes"]
+    assert new_raw / new_stored > before["raw_bytes"] / before["stored_bytes"]
+    assert after["dictionaries"] == 1
+
+
+def test_older_bodies_stay_readable_after_retraining(archive):
+    old = archive.put(answer(1))
+    archive.put_many(answer(i) for i in range(2, 40))
+    archive.train()
+    middle = archive.put(answer(100))
+    archive.put_many(f"Completely different wording number {i}, nothing about sizing at all" for i in range(40))
+    archive.train()
+    new = archive.put(answer(200))
+
+    # A fresh instance has no dictionaries cached and must load each version by ID
+    reopened = ResponseArchive(archive.db_path)
+    assert reopened.get_many([old, middle, new]) == {old: answer(1), middle: answer(100), new: answer(200)}
+    assert reopened.stats()["dictionaries"] == 2
+
+
+def test_iter_responses_pages_through_everything(archive, monkeypatch):
+    monkeypatch.setattr(response_archive, "SCAN_CHUNK_SIZE", 3)
+    texts = [answer(i) for i in range(7)]
+    archive.put_many(texts)
+    assert sorted(text for _, text in archive.iter_responses()) == sorted(texts)
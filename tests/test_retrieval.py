@@ -0,0 +1,103 @@
+"""Review index: building, product-restricted search, staleness and review_context"""
+import sqlite3
+
+import pytest
+
+from init_db import init_database
+from retrieval import (ReviewIndex, build_index, extract_clothing_id, format_review_context, index_is_stale,
+                       index_watermark, retrieve_review_context)
+
+REVIEWS = [
+    # (clothing_id, title, review_text, rating, helpful)
+    (1094, "Runs small", "This dress runs small in the bust, order a size up", 3, 12),
+    (1094, "Lovely colour", "The green colour is lovely and the fabric is soft", 5, 2),
+    (1094, None, "Zipper broke after one wash, poor quality", 1, 7),
+    (829, "Great jeans", "These jeans run small too, size up one", 4, 5),
+    (829, None, "Comfortable stretchy denim that keeps its shape", 5, 1),
+]
+
+
+@pytest.fixture
+def db_path(tmp_path, capsys):
+    path = tmp_path / "reviews.db"
+    init_database(path)
+    capsys.readouterr()
+    insert(path, REVIEWS)
+    return path
+
+
+def insert(db_path, reviews):
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO feedback_submissions (clothing_id, title, review_text, rating, recommended_ind, "
+        "positive_feedback_count) VALUES (?, ?, ?, ?, 1, ?)", reviews
+    )
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def index_dir(tmp_path, db_path):
+    path = tmp_path / "index"
+    build_index(db_path, path, n_features=512)
+    return path
+
+
+def test_build_records_the_watermark(db_path, index_dir):
+    index = ReviewIndex(index_dir)
+    assert index.meta["rows"] == 5
+    assert index.meta["max_review_id"] == 5
+    assert index_watermark(db_path) == (5, 5)
+    assert list(index.clothing_ids) == sorted(index.clothing_ids)
+
+
+def test_search_is_restricted_to_the_product(index_dir):
+    index = ReviewIndex(index_dir)
+    hits = index.search("does it run small, should I size up?", clothing_id=1094, k=2)
+    assert hits[0][0] == 1
+    assert {review_id for review_id, _ in hits} <= {1, 2, 3}
+    assert hits[0][1] >= hits[1][1]
+
+    everywhere = {review_id for review_id, _ in index.search("run small size up", k=2)}
+    assert everywhere == {1, 4}
+    assert index.search("anything", clothing_id=4242) == []
+
+
+def test_copies_are_left_out_of_the_index(tmp_path, db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE feedback_submissions SET canonical_id = 1 WHERE id = 2")
+    conn.commit()
+    conn.close()
+    meta = build_index(db_path, tmp_path / "index", n_features=512)
+    assert meta["rows"] == 4
+    assert 2 not in ReviewIndex(tmp_path / "index").review_ids
+
+
+def test_index_goes_stale_when_reviews_are_added(tmp_path, db_path, index_dir):
+    assert not index_is_stale(index_dir, db_path=db_path)
+    insert(db_path, [(829, None, "Faded in the wash", 2, 0)])
+    assert index_is_stale(index_dir, db_path=db_path)
+    assert index_is_stale(tmp_path / "missing", db_path=db_path)
+
+
+def test_extract_clothing_id(index_dir):
+    index = ReviewIndex(index_dir)
+    assert extract_clothing_id("Should I order clothing ID 1094?") == 1094
+    assert extract_clothing_id("Is #829 worth it?") == 829
+    # A bare number only counts if the index has reviews for it
+    assert extract_clothing_id("Does 829 have quality issues?") is None
+    assert extract_clothing_id("Does 829 have quality issues?", index) == 829
+    assert extract_clothing_id("Is 2024 a good year for 829?", index) == 829
+
+
+def test_review_context_for_a_question(db_path, index_dir):
+    index = ReviewIndex(index_dir, db_path=str(db_path))
+    context = retrieve_review_context(index, "Does clothing ID 1094 have quality issues?", k=1)
+    assert context["clothing_id"] == 1094
+    assert [review["id"] for review in context["reviews"]] == [3]
+
+    text = format_review_context(context)
+    assert text.startswith("Relevant customer reviews for clothing ID 1094")
+    assert "- [1★, recommends, 7 helpful] Zipper broke after one wash, poor quality" in text
+    assert retrieve_review_context(index, "Anything on clothing ID 4242?") is None
+    assert format_review_context(None) == ""
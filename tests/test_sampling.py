@@ -0,0 +1,109 @@
+"""Wilson interval and early stopping of the flakiness sampler"""
+import itertools
+import threading
+
+import pytest
+
+from sampling import is_settled, sample_pass_rate, wilson_interval
+
+
+def test_wilson_interval_brackets_the_observed_rate():
+    low, high = wilson_interval(8, 10)
+    assert low < 0.8 < high
+    assert 0.0 <= low and high <= 1.0
+    # Known value: 8/10 at 95% confidence
+    assert low == pytest.approx(0.490, abs=1e-3)
+    assert high == pytest.approx(0.943, abs=1e-3)
+
+
+def test_wilson_interval_without_samples_is_uninformative():
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+
+
+def test_wilson_interval_narrows_with_more_samples():
+    narrow = wilson_interval(80, 100)
+    wide = wilson_interval(8, 10)
+    assert narrow[1] - narrow[0] < wide[1] - wide[0]
+
+
+def test_not_settled_before_min_samples():
+    assert not is_settled(0, 2, min_samples=3)
+
+
+def test_settled_once_the_interval_is_below_the_target():
+    # 0 of 5 passing: the whole interval lies below 0.8
+    assert is_settled(0, 5)
+
+
+def test_settled_once_the_interval_is_within_the_margin_of_the_target():
+    # 8 of 8 passing: the interval starts at about 0.68, within 0.15 of 0.8
+    assert is_settled(8, 8)
+    assert not is_settled(7, 7)
+
+
+def test_not_settled_while_the_interval_straddles_the_target():
+    assert not is_settled(3, 4, margin=0.05)
+
+
+def scripted(outcomes):
+    """call_fn returning the given pass/fail outcomes in order"""
+    outcomes = iter(outcomes)
+    return lambda: {"success": True, "ok": next(outcomes)}
+
+
+def test_stops_early_when_every_sample_fails():
+    result = sample_pass_rate(scripted([False] * 10), lambda r: r["ok"],
+                              max_samples=10, min_samples=3, concurrency=1)
+    assert result["samples"] < 10
+    assert result["stopped_early"]
+    assert not result["passed"]
+
+
+def test_stops_early_when_every_sample_passes_with_the_defaults():
+    result = sample_pass_rate(scripted([True] * 10), lambda r: r["ok"], concurrency=1)
+    assert result["samples"] < 10
+    assert result["stopped_early"]
+    assert result["passed"]
+
+
+def test_runs_to_max_samples_while_unsettled():
+    outcomes = [True, False] * 5
+    result = sample_pass_rate(scripted(outcomes), lambda r: r["ok"],
+                              max_samples=10, concurrency=1, target=0.5, margin=0.01)
+    assert result["samples"] == 10
+    assert result["passes"] == 5
+    assert not result["stopped_early"]
+
+
+def test_failed_calls_count_as_failing_samples():
+    result = sample_pass_rate(lambda: {"success": False, "error": "timeout"}, lambda r: True,
+                              max_samples=3, concurrency=1)
+    assert result["passes"] == 0
+    assert all(not r["passed"] for r in result["results"])
+
+
+def test_calls_running_when_sampling_stops_are_reported_once_they_finish():
+    release = threading.Event()
+    counter = itertools.count(1)
+
+    def call():
+        if next(counter) == 2:
+            # The second call is still running when the three failures settle it
+            release.wait(5)
+            return {"success": True, "ok": True, "tokens": 42}
+        return {"success": True, "ok": False}
+
+    late = []
+    reported = threading.Event()
+
+    def on_late_result(result):
+        late.append(result)
+        reported.set()
+
+    result = sample_pass_rate(call, lambda r: r["ok"], max_samples=10, min_samples=3,
+                              concurrency=2, on_late_result=on_late_result)
+    assert result["samples"] == 3
+    assert not late
+    release.set()
+    assert reported.wait(5)
+    assert late == [{"success": True, "ok": True, "tokens": 42}]
@@ -0,0 +1,102 @@
+"""Failure-first ordering, known-verdict skipping and fail-fast "Run all" scheduling"""
+import threading
+
+import pytest
+
+from scheduler import EvalHistory, prompt_hash, run_all, run_key
+
+PROMPT = "You are a shopping assistant."
+
+
+@pytest.fixture
+def history(tmp_path):
+    return EvalHistory(tmp_path / "eval_history.db")
+
+
+def verdict(passed):
+    return {"passed": passed, "details": {"check": passed}}
+
+
+def test_run_key_changes_with_prompt_models_and_settings():
+    base = run_key(PROMPT, {"Anthropic": "haiku"}, {"use_db_tool": True})
+    assert base == run_key(PROMPT, {"Anthropic": "haiku"}, {"use_db_tool": True})
+    assert base != run_key(PROMPT + " ", {"Anthropic": "haiku"}, {"use_db_tool": True})
+    assert base != run_key(PROMPT, {"Anthropic": "sonnet"}, {"use_db_tool": True})
+    assert base != run_key(PROMPT, {"Anthropic": "haiku"}, {"use_db_tool": False})
+    assert len(prompt_hash(PROMPT)) == 16
+
+
+def test_recent_failures_come_first_then_unseen_then_passing(history):
+    history.record("old", PROMPT, 1, verdict(True))
+    history.record("old", PROMPT, 2, verdict(False))
+    history.record("old", PROMPT, 3, verdict(False))
+    history.record("old", PROMPT, 3, verdict(False))
+    # 4 failed before but passed last time
+    history.record("old", PROMPT, 4, verdict(False))
+    history.record("old", PROMPT, 4, verdict(True))
+
+    # 3 has failed more often than 2; 5 has never run; 4 passes but is flakier than 1
+    assert history.order_failures_first([1, 2, 3, 4, 5]) == [3, 2, 5, 4, 1]
+
+
+def test_known_verdicts_are_per_run_key_and_latest_wins(history):
+    history.record("a", PROMPT, 1, verdict(False))
+    history.record("a", PROMPT, 1, verdict(True))
+    history.record("b", PROMPT, 2, verdict(False))
+    known = history.known_verdicts("a", [1, 2])
+    assert known == {"1": {"passed": True, "details": {"check": True}}}
+
+
+def run(history, outcomes, **kwargs):
+    """run_all with a call_fn that returns each question's scripted outcome"""
+    calls = []
+    lock = threading.Lock()
+
+    def call_fn(question_id):
+        with lock:
+            calls.append(question_id)
+        return {"success": True, "passed": outcomes[question_id]}
+
+    result = run_all(list(outcomes), call_fn, lambda q, r: verdict(r["passed"]), history, "key", PROMPT, **kwargs)
+    return result, calls
+
+
+def test_runs_skip_questions_with_a_known_verdict(history):
+    result, calls = run(history, {1: True, 2: False, 3: True}, max_workers=1)
+    assert sorted(calls) == [1, 2, 3]
+    assert result["first_failure"] == 2
+
+    result, calls = run(history, {1: True, 2: False, 3: True, 4: True}, max_workers=1)
+    assert calls == [4]
+    assert set(result["skipped"]) == {"1", "2", "3"}
+    # The next run of the same key puts the known failure first
+    assert result["order"][0] == 2
+
+    _, calls = run(history, {1: True, 2: False}, skip_known=False, max_workers=1)
+    assert calls == [2, 1]
+
+
+def test_fail_fast_cancels_the_queue_after_the_first_failure(history):
+    history.record("other", PROMPT, 3, verdict(False))
+    result, calls = run(history, {1: True, 2: True, 3: False, 4: True}, fail_fast=True, max_workers=1)
+    # 3 failed last time, so it runs first and nothing else is sent
+    assert calls == [3]
+    assert result["first_failure"] == 3
+    assert sorted(result["cancelled"]) == [1, 2, 4]
+
+
+def test_verdicts_are_recorded_after_the_judge_runs(history):
+    def judge_fn(results):
+        for _, (_, eval_result) in results.items():
+            eval_result["passed"] = False
+
+    result, _ = run(history, {1: True, 2: True}, judge_fn=judge_fn, max_workers=1)
+    assert result["first_failure"] == 1
+    assert {q: v["passed"] for q, v in history.known_verdicts("key", [1, 2]).items()} == {"1": False, "2": False}
+
+
+def test_response_refs_are_recorded_with_the_verdict(history):
+    history.record("key", PROMPT, 1, verdict(True), {"Anthropic": "abc123"})
+    with history._connect() as conn:
+        refs, = conn.execute("SELECT response_refs FROM eval_history").fetchone()
+    assert refs == '{"Anthropic": "abc123"}'
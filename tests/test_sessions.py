@@ -0,0 +1,61 @@
+"""Disk-backed chat sessions: transcript round-trip, state and the in-memory window"""
+import pytest
+
+from sessions import SessionStore, new_session_id
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(tmp_path / "sessions.db")
+
+
+def messages(n):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} ✓"} for i in range(n)]
+
+
+def test_session_ids_are_unique():
+    assert new_session_id() != new_session_id()
+
+
+def test_messages_round_trip_in_order(store):
+    for position, message in enumerate(messages(5)):
+        assert store.append_message("s1", message) == position
+    assert store.message_count("s1") == 5
+    assert store.load_messages("s1") == messages(5)
+    assert store.load_messages("s1", 1, 3) == messages(5)[1:3]
+    assert store.load_messages("s1", 4, 2) == []
+
+
+def test_sessions_are_kept_apart(store):
+    store.append_message("s1", {"role": "user", "content": "one"})
+    store.append_message("s2", {"role": "user", "content": "two"})
+    assert store.load_messages("s2") == [{"role": "user", "content": "two"}]
+    assert store.message_count("unknown") == 0
+
+
+def test_state_round_trip_keeps_the_message_count(store):
+    assert store.load_state("s1") is None
+    store.save_state("s1", {"system_prompt": "Be brief", "eval_results": [["1", {"passed": True}]]})
+    store.append_message("s1", {"role": "user", "content": "hi"})
+    store.save_state("s1", {"system_prompt": "Be kind", "eval_results": []})
+    assert store.load_state("s1") == {"system_prompt": "Be kind", "eval_results": [], "message_count": 1}
+
+
+def test_load_session_reads_only_the_newest_window(store):
+    for message in messages(12):
+        store.append_message("s1", message)
+    store.save_state("s1", {"game_complete": False})
+
+    saved = store.load_session("s1", window=5)
+    assert saved["messages"] == messages(12)[7:]
+    assert saved["message_offset"] == 7
+    assert saved["game_complete"] is False
+    assert store.load_session("unknown") is None
+
+
+def test_a_short_transcript_loads_whole(store):
+    store.append_message("s1", {"role": "user", "content": "hi"})
+    saved = store.load_session("s1", window=5)
+    assert saved["message_offset"] == 0
+    assert saved["messages"] == [{"role": "user", "content": "hi"}]
+    assert saved["message_count"] == 1
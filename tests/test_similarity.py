@@ -0,0 +1,102 @@
+"""Offline hashed embeddings and vectorised semantic assertions"""
+import numpy as np
+import pytest
+
+import similarity
+from evals import evaluate_response_rule_based, evaluate_responses_rule_based
+from similarity import HashingVectorizer, semantic_match_scores, split_sentences
+
+RETURNS = "I really hate having to return clothes"
+
+
+def test_split_sentences():
+    assert split_sentences("Runs small. Size up!\nLovely fabric") == ["Runs small.", "Size up!", "Lovely fabric"]
+    assert split_sentences("") == []
+
+
+def test_embeddings_are_unit_rows_and_deterministic():
+    vectorizer = HashingVectorizer(n_features=256)
+    matrix = vectorizer.transform(["Runs small", "", "Runs small"])
+    assert matrix.shape == (3, 256) and matrix.dtype == np.float32
+    assert np.linalg.norm(matrix[0]) == pytest.approx(1.0)
+    assert not matrix[1].any()
+    assert np.array_equal(matrix[0], matrix[2])
+    assert np.array_equal(matrix[0], HashingVectorizer(n_features=256).transform(["Runs small"])[0])
+
+
+def test_related_wording_scores_higher_than_unrelated():
+    scores = semantic_match_scores(
+        ["Since you hate returning clothes, order one size up.", "The colour is a lovely deep green."],
+        [[RETURNS], [RETURNS]]
+    )
+    assert scores[0] > 0.35 > scores[1]
+
+
+def test_a_single_on_point_sentence_is_enough():
+    long_answer = "The fabric is soft. It washes well. Returning it would be a hassle you hate. Great colour."
+    whole, = semantic_match_scores([long_answer], [[RETURNS]])
+    on_point, = semantic_match_scores(["Returning it would be a hassle you hate."], [[RETURNS]])
+    assert whole == pytest.approx(on_point)
+
+
+def test_responses_are_only_compared_with_their_own_references():
+    scores = semantic_match_scores([RETURNS, RETURNS], [[RETURNS], ["Lovely deep green colour"]])
+    assert scores[0] == pytest.approx(1.0)
+    assert scores[1] < 0.35
+
+
+def test_empty_inputs_score_zero_and_lengths_must_match():
+    assert list(semantic_match_scores(["", "text"], [[RETURNS], []])) == [0.0, 0.0]
+    with pytest.raises(ValueError):
+        semantic_match_scores(["a"], [])
+
+
+def test_large_batches_are_scored_in_chunks(monkeypatch):
+    responses = [RETURNS if i % 2 else "Lovely colour" for i in range(10)]
+    expected = semantic_match_scores(responses, [[RETURNS]] * 10)
+    monkeypatch.setattr(similarity, "SCORE_CHUNK_SIZE", 3)
+    assert np.allclose(semantic_match_scores(responses, [[RETURNS]] * 10), expected)
+
+
+def test_idf_downweights_words_every_text_shares():
+    corpus = [f"this dress {word}" for word in ("runs small", "is lovely", "washes well", "fades fast")]
+    vectorizer = HashingVectorizer().fit_idf(corpus)
+    plain = HashingVectorizer()
+    a, b = "this dress runs small", "this dress fades fast"
+    weighted = vectorizer.transform([a]) @ vectorizer.transform([b]).T
+    unweighted = plain.transform([a]) @ plain.transform([b]).T
+    assert weighted[0, 0] < unweighted[0, 0]
+
+
+CASE = {
+    "id": "semantic-1",
+    "question": "Should I buy this dress?",
+    "ground_truth": "It runs small, so order a size up.",
+    "assertions": [
+        {"check": "mentions_sarah", "match": "sarah"},
+        {"check": "acknowledges_return_aversion", "type": "semantic", "references": [RETURNS]},
+        {"check": "matches_ground_truth", "type": "semantic", "include_ground_truth": True, "threshold": 0.5}
+    ]
+}
+
+
+def test_semantic_assertions_in_an_eval_case():
+    result = evaluate_response_rule_based(
+        "Sarah, since you hate returning clothes: it runs small, so order a size up.", CASE["id"], question_data=CASE
+    )
+    assert result["passed"], result
+    assert set(result["scores"]) == {"acknowledges_return_aversion", "matches_ground_truth"}
+
+    result = evaluate_response_rule_based("Sarah, the colour is lovely.", CASE["id"], question_data=CASE)
+    assert result["details"]["mentions_sarah"]
+    assert not result["details"]["acknowledges_return_aversion"]
+
+
+def test_batch_evaluation_matches_one_at_a_time():
+    responses = ["Sarah, since you hate returning clothes: it runs small, so order a size up.",
+                 "Sarah, the colour is lovely."]
+    batched = evaluate_responses_rule_based(responses, [CASE, CASE])
+    single = [evaluate_response_rule_based(r, CASE["id"], question_data=CASE) for r in responses]
+    assert [r["passed"] for r in batched] == [r["passed"] for r in single]
+    for b, s in zip(batched, single):
+        assert b["scores"] == pytest.approx(s["scores"])
@@ -0,0 +1,32 @@
+"""Synthetic review corpus: columns, determinism and text variety"""
+import synth_reviews
+from near_duplicates import minhash_signatures
+from synth_reviews import generate_reviews
+
+
+def corpus(n_rows=2000, seed=42):
+    return next(generate_reviews(n_rows, chunk_size=n_rows, seed=seed))
+
+
+def test_rows_have_the_kaggle_columns_and_limits():
+    reviews = corpus()
+    assert list(reviews.columns) == ["Clothing ID", "Age", "Title", "Review Text", "Rating", "Recommended IND",
+                                     "Positive Feedback Count", "Division Name", "Department Name", "Class Name"]
+    lengths = reviews["Review Text"].str.len()
+    assert lengths.max() <= synth_reviews.MAX_REVIEW_CHARS
+    assert 250 < lengths.mean() < 350
+    assert "{" not in "".join(reviews["Review Text"])
+
+
+def test_the_same_seed_yields_the_same_corpus():
+    assert corpus(200).equals(corpus(200))
+    assert not corpus(200).equals(corpus(200, seed=7))
+
+
+def test_review_texts_are_rarely_near_duplicates():
+    texts = corpus()["Review Text"].tolist()
+    assert len(set(texts)) > 0.98 * len(texts)
+    # Estimated Jaccard similarity of consecutive rows stays low
+    signatures = minhash_signatures(texts)
+    similarity = (signatures[1:] == signatures[:-1]).mean(axis=1)
+    assert (similarity >= 0.8).mean() < 0.01
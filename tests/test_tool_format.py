@@ -0,0 +1,50 @@
+"""Compact, token-budgeted tool results"""
+from history import estimate_tokens
+from tool_format import format_tool_result
+
+COLUMNS = ["id", "review_text", "positive_feedback_count"]
+
+
+def test_empty_result():
+    assert format_tool_result(COLUMNS, []) == "(0 rows)"
+
+
+def test_small_result_is_a_header_and_pipe_separated_rows():
+    rows = [(1, "Runs small", 3), (2, "Lovely | soft\nfabric", None)]
+    assert format_tool_result(COLUMNS, rows) == (
+        "id|review_text|positive_feedback_count\n"
+        "1|Runs small|3\n"
+        "2|Lovely / soft fabric|"
+    )
+
+
+def test_long_fields_are_truncated():
+    text = format_tool_result(COLUMNS, [(1, "x" * 1000, 0)], max_field_chars=50)
+    assert text.splitlines()[1] == "1|" + "x" * 49 + "…|0"
+
+
+def test_single_value_is_sent_whole_if_it_fits():
+    summary = "Clothing ID 1094: 4.2★ over 120 reviews. " * 20
+    assert format_tool_result(["summary"], [(summary,)]) == f"summary\n{summary}"
+
+
+def test_over_budget_keeps_the_most_helpful_rows_in_query_order():
+    rows = [(i, "word " * 50, helpful) for i, helpful in enumerate([1, 9, 0, 7, 3])]
+    text = format_tool_result(COLUMNS, rows, token_budget=140)
+    lines = text.splitlines()
+    assert [line.split("|")[0] for line in lines[1:-1]] == ["1", "3"]
+    assert lines[-1] == "(showing 2 of 5 rows, kept by highest positive_feedback_count; add filters or LIMIT for others)"
+    assert estimate_tokens("\n".join(lines[:-1])) <= 140
+
+
+def test_a_row_too_long_for_the_budget_does_not_stop_shorter_rows():
+    rows = [(0, "word " * 10, 9), (1, "word " * 200, 5), (2, "word " * 10, 1)]
+    text = format_tool_result(COLUMNS, rows, token_budget=60, max_field_chars=2000)
+    lines = text.splitlines()
+    assert [line.split("|")[0] for line in lines[1:-1]] == ["0", "2"]
+    assert lines[-1].startswith("(showing 2 of 3 rows")
+
+
+def test_truncated_results_say_there_are_more_rows():
+    text = format_tool_result(COLUMNS, [(1, "Runs small", 3)], truncated=True)
+    assert text.endswith("(showing 1 of 1+ rows; add filters or LIMIT for others)")
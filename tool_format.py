@@ -0,0 +1,95 @@
+"""
+Token-efficient formatting of database tool results
+
+The tool result is sent back to the model in a second call, so every byte
+of it is paid for as input tokens. Instead of one Python tuple repr per
+row, results are sent as a header line of column names followed by
+pipe-separated rows, long text fields are truncated, and when the result
+is over the token budget the most helpful reviews (by
+positive_feedback_count) are kept.
+"""
+from typing import List, Sequence
+
+from history import estimate_tokens
+
+DEFAULT_TOOL_TOKEN_BUDGET = 1500
+
+# Characters kept per text field (review_text is the usual offender)
+MAX_FIELD_CHARS = 300
+
+# Column used to pick rows when a result is over budget
+RANK_COLUMN = "positive_feedback_count"
+
+# Rows read from the database per tool call; enough to rank, bounded in memory
+MAX_TOOL_ROWS = 5000
+
+
+def _cell(value, max_chars: int) -> str:
+    if value is None:
+        return ""
+    text = str(value).replace("\n", " ").replace("|", "/")
+    if len(text) > max_chars:
+        text = text[:max_chars - 1].rstrip() + "…"
+    return text
+
+
+def format_tool_result(
+    columns: Sequence[str],
+    rows: List[tuple],
+    token_budget: int = DEFAULT_TOOL_TOKEN_BUDGET,
+    max_field_chars: int = MAX_FIELD_CHARS,
+    rank_column: str = RANK_COLUMN,
+    truncated: bool = False
+) -> str:
+    """
+    Render query results compactly for the model
+
+    Args:
+        columns: Column names
+        rows: Result rows
+        token_budget: Approximate tokens the whole result may use
+        max_field_chars: Longer fields are cut to this many characters
+        rank_column: If over budget, keep the rows with the highest value here
+            (rows keep their query order otherwise)
+        truncated: The rows are only the first part of a larger result
+
+    Returns:
+        Header line, one line per row, and a note if rows were left out
+    """
+    if not rows:
+        return "(0 rows)"
+
+    # A single value (e.g. a product digest) is sent whole if it fits
+    if len(rows) == 1 and len(columns) == 1 and rows[0][0] is not None and not truncated:
+        value = str(rows[0][0])
+        if estimate_tokens(columns[0]) + estimate_tokens(value) <= token_budget:
+            return f"{columns[0]}\n{value}"
+
+    header = "|".join(columns)
+    lines = ["|".join(_cell(value, max_field_chars) for value in row) for row in rows]
+
+    used = estimate_tokens(header)
+    costs = [estimate_tokens(line) for line in lines]
+    if used + sum(costs) <= token_budget and not truncated:
+        return "\n".join([header, *lines])
+
+    # Over budget: take rows most-helpful first while they fit; a row too long
+    # for what is left is skipped, shorter rows after it may still fit
+    order = list(range(len(rows)))
+    if rank_column in columns:
+        rank = list(columns).index(rank_column)
+        order.sort(key=lambda i: rows[i][rank] or 0, reverse=True)
+    kept = []
+    for i in order:
+        if used + costs[i] > token_budget and kept:
+            continue
+        kept.append(i)
+        used += costs[i]
+    kept.sort()
+
+    total = f"{len(rows)}+" if truncated else str(len(rows))
+    note = f"(showing {len(kept)} of {total} rows"
+    if rank_column in columns and len(kept) < len(rows):
+        note += f", kept by highest {rank_column}"
+    note += "; add filters or LIMIT for others)"
+    return "\n".join([header, *(lines[i] for i in kept), note])